@@ -5,6 +5,7 @@ High School Mathematics Tutoring System
 
 import streamlit as st
 import os
+import time
 from pathlib import Path
 
 # Add src to path
@@ -15,7 +16,26 @@ from src.database.db_manager import DatabaseManager
 from src.ai.ai_client import AIClient
 from src.core.student_manager import StudentManager
 from src.core.conversation_handler import ConversationHandler
+from src.core.practice_manager import PracticeManager
+from src.core.practice_recorder import PracticeRecorder
+from src.core.practice_prefetcher import PracticePrefetcher
+from src.core.token_ledger import TokenLedger
+from src.core.view_cache import ViewCache
+from src.core.dashboard import ProgressDashboard
+from src.core.session_manager import SessionManager
+from src.core.session_lifecycle import SessionLifecycle
+from src.core.state_store import create_state_store, persist_session_state, restore_session_state
+from src.core.invalidation_bus import InvalidationBus
+from src.core.upload_pipeline import UploadPipeline
+from src.core.upload_understanding import create_understanding
+from src.utils.shared_cache import create_shared_cache
 from src.utils.config import config
+from src.utils.cache import all_caches
+from src.utils.math_prerender import create_prerenderer
+from src.utils.metrics import active_sessions, observe_render, registry, start_metrics_server
+from src.utils.perf_store import perf_store
+from src.utils.startup import init_warmup
+from src.utils.tracing import configure_tracing, tracer
 
 # Page configuration
 st.set_page_config(
@@ -352,22 +372,168 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def init_tracing():
+    """Apply the tracing settings (exporters, sampling) once per process"""
+    configured = configure_tracing(config.get('tracing', {}))
+    # Finished requests feed the Performance page
+    configured.add_listener(perf_store.record_trace)
+    return configured
+
+
 @st.cache_resource
 def init_database():
     """Initialize database connection"""
-    db_manager = DatabaseManager()
+    db_manager = DatabaseManager(config.database_url)
     db_manager.create_tables()
+    
+    profiler = config.get('database.profiler', {}) or {}
+    if profiler.get('enabled'):
+        db_manager.enable_profiler(
+            slow_ms=profiler.get('slow_ms', 100),
+            n_plus_one_threshold=profiler.get('n_plus_one_threshold', 5)
+        )
     return db_manager
 
 
 @st.cache_resource
-def init_ai_client():
+def init_shared_cache():
+    """Initialize the cache shared between replicas (in-process for a single replica)"""
+    return create_shared_cache(config.shared_cache_url)
+
+
+@st.cache_resource
+def init_invalidation_bus(_db_manager, _shared_cache):
+    """Relay write events to other replicas (only when a shared cache is configured)"""
+    if not config.shared_cache_url:
+        return None
+    return InvalidationBus(_db_manager, _shared_cache, replica_id=config.replica_id)
+
+
+@st.cache_resource
+def init_state_store():
+    """Initialize the shared server-side session store"""
+    return create_state_store(
+        backend=config.get('state_store.backend', 'sqlite'),
+        path=config.get('state_store.path', 'data/session_state.db'),
+        ttl_hours=config.get('state_store.ttl_hours', 72)
+    )
+
+
+@st.cache_resource
+def init_math_prerenderer():
+    """Initialize server-side math pre-rendering (None when disabled)"""
+    return create_prerenderer(config.get('ui.math_prerender', {}))
+
+
+@st.cache_resource
+def init_student_manager(_db_manager):
+    """Initialize the shared (stateless) student manager"""
+    return StudentManager(_db_manager)
+
+
+@st.cache_resource
+def init_session_lifecycle(_db_manager, _shared_cache=None):
+    """Initialize the shared active-session index and start the idle-session sweeper"""
+    return SessionLifecycle(
+        _db_manager,
+        timeout_minutes=config.session_timeout_minutes,
+        sweep_interval_seconds=config.get('session.sweep_interval_seconds', 60),
+        batch_size=config.get('session.sweep_batch_size', 500),
+        shared_cache=_shared_cache if config.shared_cache_url else None,
+        replica_id=config.replica_id
+    )
+
+
+@st.cache_resource
+def init_upload_pipeline(_ai_client):
+    """Initialize the shared chat attachment pipeline and its worker pool"""
+    return UploadPipeline(
+        storage_dir=config.get('uploads.storage_dir', 'data/uploads'),
+        max_workers=config.get('uploads.max_workers', 4),
+        max_file_mb=config.get('uploads.max_file_mb', 25),
+        max_image_side=config.get('uploads.max_image_side', 1568),
+        max_image_mb=config.get('uploads.max_image_mb', 3.75),
+        max_text_chars=config.get('uploads.max_text_chars', 20000),
+        max_pages=config.get('uploads.max_pages', 30),
+        understanding=create_understanding(_ai_client, config.get('uploads.understanding', {}))
+    )
+
+
+@st.cache_resource
+def init_conversation_handler(_db_manager, _ai_client, _student_manager, _upload_pipeline,
+                              _session_lifecycle):
+    """Initialize the shared (stateless) conversation handler"""
+    return ConversationHandler(
+        _db_manager,
+        _ai_client,
+        session_manager=SessionManager(_db_manager, lifecycle=_session_lifecycle),
+        student_manager=_student_manager,
+        upload_pipeline=_upload_pipeline
+    )
+
+
+@st.cache_resource
+def init_view_cache(_student_manager):
+    """Initialize the shared sidebar/dashboard view-model cache"""
+    return ViewCache(_student_manager)
+
+
+@st.cache_resource
+def init_progress_dashboard(_db_manager):
+    """Initialize the shared Progress page view-model cache"""
+    return ProgressDashboard(_db_manager)
+
+
+@st.cache_resource
+def init_practice_recorder(_db_manager):
+    """Initialize the shared background practice recorder"""
+    return PracticeRecorder(_db_manager)
+
+
+@st.cache_resource
+def init_practice_manager(_db_manager, _ai_client, _recorder):
+    """Initialize the shared practice manager"""
+    return PracticeManager(_db_manager, _ai_client, recorder=_recorder)
+
+
+@st.cache_resource
+def init_practice_prefetcher(_practice_manager):
+    """Initialize the shared practice set prefetcher"""
+    return PracticePrefetcher(
+        _practice_manager,
+        ttl_seconds=config.get('practice.prefetch_ttl_seconds', 600),
+        max_per_student=config.get('practice.prefetch_per_student', 2),
+        wait_seconds=config.get('practice.prefetch_wait_seconds', 3),
+        mastery_threshold=config.get('progress.mastery_threshold', 0.8)
+    )
+
+
+@st.cache_resource
+def init_token_ledger(_db_manager, _shared_cache=None):
+    """Initialize the shared token ledger with configured budgets (counted across replicas)"""
+    budgets = config.token_budgets
+    return TokenLedger(
+        _db_manager,
+        student_daily_soft=budgets.get('student_daily_soft_tokens'),
+        student_daily_hard=budgets.get('student_daily_hard_tokens'),
+        global_daily_soft=budgets.get('global_daily_soft_tokens'),
+        global_daily_hard=budgets.get('global_daily_hard_tokens'),
+        shared_cache=_shared_cache if config.shared_cache_url else None
+    )
+
+
+@st.cache_resource
+def init_ai_client(_token_ledger=None):
     """Initialize AI client"""
     try:
         return AIClient(
             model=config.ai_model,
             max_tokens=config.ai_max_tokens,
-            temperature=config.ai_temperature
+            temperature=config.ai_temperature,
+            routes=config.ai_routes,
+            pricing=config.ai_pricing,
+            ledger=_token_ledger
         )
     except Exception as e:
         st.error(f"Failed to initialize AI client: {str(e)}")
@@ -375,23 +541,117 @@ def init_ai_client():
         st.stop()
 
 
+@st.cache_resource
+def init_metrics(_practice_recorder, _practice_prefetcher, _session_lifecycle):
+    """Start the sidecar metrics endpoint and register the scrape-time gauges"""
+    if not config.get('deployment.enable_monitoring', True):
+        registry.enabled = False
+        return None
+    
+    registry.gauge(
+        "mathtutor_cache_hit_ratio", "Hit ratio of in-process caches",
+        lambda: {(cache.name,): cache.get_stats()["hit_ratio"] for cache in all_caches()},
+        ("cache",)
+    )
+    registry.gauge(
+        "mathtutor_cache_entries", "Entries held by in-process caches",
+        lambda: {(cache.name,): len(cache) for cache in all_caches()},
+        ("cache",)
+    )
+    registry.gauge(
+        "mathtutor_active_sessions", "Browser sessions active in the last 5 minutes",
+        active_sessions.count
+    )
+    registry.gauge(
+        "mathtutor_tutoring_sessions_active", "Students with an active tutoring session",
+        lambda: _session_lifecycle.active_count
+    )
+    registry.gauge(
+        "mathtutor_queue_depth", "Work waiting in background queues",
+        lambda: {
+            ("practice_recorder",): _practice_recorder.queue_depth,
+            ("practice_prefetcher",): _practice_prefetcher.get_stats()["pending"],
+            ("trace_export",): tracer.get_stats()["export_queue"]
+        },
+        ("queue",)
+    )
+    return start_metrics_server(config.get('deployment.metrics_host', '127.0.0.1'), config.metrics_port)
+
+
 def initialize_session_state():
     """Initialize Streamlit session state"""
+    init_tracing()
+    
     if 'db_manager' not in st.session_state:
         st.session_state.db_manager = init_database()
     
+    if 'shared_cache' not in st.session_state:
+        st.session_state.shared_cache = init_shared_cache()
+        st.session_state.invalidation_bus = init_invalidation_bus(
+            st.session_state.db_manager,
+            st.session_state.shared_cache
+        )
+    
+    if 'token_ledger' not in st.session_state:
+        st.session_state.token_ledger = init_token_ledger(
+            st.session_state.db_manager,
+            st.session_state.shared_cache
+        )
+    
     if 'ai_client' not in st.session_state:
-        st.session_state.ai_client = init_ai_client()
+        st.session_state.ai_client = init_ai_client(st.session_state.token_ledger)
     
     if 'student_manager' not in st.session_state:
-        st.session_state.student_manager = StudentManager(st.session_state.db_manager)
+        st.session_state.student_manager = init_student_manager(st.session_state.db_manager)
+    
+    if 'view_cache' not in st.session_state:
+        st.session_state.view_cache = init_view_cache(st.session_state.student_manager)
+    
+    if 'progress_dashboard' not in st.session_state:
+        st.session_state.progress_dashboard = init_progress_dashboard(st.session_state.db_manager)
+    
+    if 'session_lifecycle' not in st.session_state:
+        st.session_state.session_lifecycle = init_session_lifecycle(
+            st.session_state.db_manager,
+            st.session_state.shared_cache
+        )
     
     if 'conversation_handler' not in st.session_state:
-        st.session_state.conversation_handler = ConversationHandler(
+        st.session_state.conversation_handler = init_conversation_handler(
+            st.session_state.db_manager,
+            st.session_state.ai_client,
+            st.session_state.student_manager,
+            init_upload_pipeline(st.session_state.ai_client),
+            st.session_state.session_lifecycle
+        )
+    
+    if 'practice_recorder' not in st.session_state:
+        st.session_state.practice_recorder = init_practice_recorder(st.session_state.db_manager)
+    
+    if 'practice_manager' not in st.session_state:
+        st.session_state.practice_manager = init_practice_manager(
             st.session_state.db_manager,
-            st.session_state.ai_client
+            st.session_state.ai_client,
+            st.session_state.practice_recorder
         )
     
+    if 'practice_prefetcher' not in st.session_state:
+        st.session_state.practice_prefetcher = init_practice_prefetcher(
+            st.session_state.practice_manager
+        )
+    
+    init_metrics(st.session_state.practice_recorder, st.session_state.practice_prefetcher,
+                 st.session_state.session_lifecycle)
+    
+    if 'state_store' not in st.session_state:
+        st.session_state.state_store = init_state_store()
+    
+    if 'math_prerenderer' not in st.session_state:
+        st.session_state.math_prerenderer = init_math_prerenderer()
+    
+    # Bring back this browser session's state after a reconnect or restart
+    restore_session_state(st.session_state.state_store, st.session_state.db_manager)
+    
     if 'current_student' not in st.session_state:
         st.session_state.current_student = None
     
@@ -417,7 +677,7 @@ def render_sidebar():
         # Student selection/creation
         st.markdown("### ▸ Student Profile")
         
-        students = st.session_state.student_manager.get_all_students()
+        students = st.session_state.view_cache.get_all_students()
         
         if students:
             student_options = {f"{s.name} (Grade {s.grade_level})": s.id for s in students}
@@ -435,7 +695,8 @@ def render_sidebar():
             else:
                 student_id = student_options[selected]
                 if not st.session_state.current_student or st.session_state.current_student.id != student_id:
-                    st.session_state.current_student = st.session_state.student_manager.get_student(student_id)
+                    # Reuse the cached row instead of querying again
+                    st.session_state.current_student = next(s for s in students if s.id == student_id)
         else:
             st.info("No students yet. Create your first student below!")
             st.session_state.current_student = None
@@ -489,8 +750,8 @@ def render_sidebar():
             </div>
             """, unsafe_allow_html=True)
             
-            # Quick stats with better visibility
-            summary = st.session_state.student_manager.get_student_summary(
+            # Quick stats with better visibility (cached until the student's data changes)
+            summary = st.session_state.view_cache.get_student_summary(
                 st.session_state.current_student.id
             )
             if summary:
@@ -671,7 +932,7 @@ def render_home_page():
         st.markdown("<br>", unsafe_allow_html=True)
         
         # Get student summary
-        summary = st.session_state.student_manager.get_student_summary(student.id)
+        summary = st.session_state.view_cache.get_student_summary(student.id)
         
         if summary:
             # Stats cards - Modern metrics
@@ -755,6 +1016,8 @@ def render_home_page():
 
 def main():
     """Main application entry point"""
+    render_start = time.perf_counter()
+    
     # Initialize
     initialize_session_state()
     
@@ -778,6 +1041,12 @@ def main():
         High School Mathematics
     </div>
     """, unsafe_allow_html=True)
+    
+    persist_session_state(st.session_state.state_store)
+    observe_render("home", render_start)
+    
+    # The first page is out - import the deferred heavy dependencies in the background
+    init_warmup()
 
 
 if __name__ == "__main__":
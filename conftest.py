@@ -0,0 +1,35 @@
+"""Shared pytest fixtures"""
+
+import pytest
+
+from src.database.db_manager import DatabaseManager
+
+
+@pytest.fixture
+def db():
+    """Throwaway in-memory database with every table created"""
+    db_manager = DatabaseManager("sqlite://")
+    db_manager.create_tables()
+    yield db_manager
+    if db_manager.profiler is not None:
+        db_manager.profiler.detach()
+
+
+@pytest.fixture
+def query_budget(db):
+    """
+    Limit the SQL statements a block runs against the `db` fixture
+
+    Usage:
+        with query_budget(3, "add_message") as counter:
+            ...
+
+    The block fails with QueryBudgetExceededError when it runs more
+    statements than allowed; counter[0] holds the count.
+    """
+    profiler = db.enable_profiler(slow_ms=1000, explain=False)
+
+    def budget(max_statements: int, name: str = "block"):
+        return profiler.budget(max_statements, name)
+
+    return budget
@@ -3,6 +3,7 @@
 import subprocess
 import sys
 import os
+import time
 from pathlib import Path
 
 
@@ -21,7 +22,68 @@ def check_api_key():
     return True
 
 
-def main():
+def launch_replicas(workers: int, base_port: int = None, proxy_port: int = None,
+                    shared_cache_url: str = None):
+    """
+    Start several app replicas behind a local sticky reverse proxy
+    
+    Args:
+        workers: Number of Streamlit processes
+        base_port: Port of the first replica, the others follow (default from config)
+        proxy_port: Port the proxy (and browsers) use (default from config)
+        shared_cache_url: redis:// URL of the shared cache (starts a local stand-in if not configured)
+    """
+    sys.path.insert(0, str(Path(__file__).parent))
+    from src.utils.config import config
+    from src.utils.sticky_proxy import StickyProxy
+    
+    base_port = base_port or config.get('replicas.base_port', 8510)
+    proxy_port = proxy_port or config.get('replicas.proxy_port', 8501)
+    shared_cache_url = shared_cache_url or config.shared_cache_url
+    
+    if config.database_url.startswith("sqlite"):
+        print("⚠️  Replicas share the SQLite file; set DATABASE_URL to PostgreSQL for heavy load.\n")
+    
+    processes = []
+    
+    if not shared_cache_url:
+        cache_port = base_port - 1
+        shared_cache_url = f"redis://127.0.0.1:{cache_port}/0"
+        processes.append(subprocess.Popen([
+            sys.executable, "-m", "src.utils.shared_cache", "--port", str(cache_port)
+        ]))
+        print(f"Started local shared cache on {shared_cache_url}")
+    
+    backends = []
+    for index in range(workers):
+        port = base_port + index
+        env = dict(os.environ, SHARED_CACHE_URL=shared_cache_url, REPLICA_ID=f"replica-{index}",
+                   METRICS_PORT=str(config.metrics_port + index))
+        processes.append(subprocess.Popen([
+            sys.executable, "-m", "streamlit", "run", "app.py",
+            "--server.port", str(port),
+            "--server.headless", "true"
+        ], env=env))
+        backends.append(("127.0.0.1", port))
+        print(f"Started replica {index} on port {port}")
+    
+    # Give the replicas a moment to bind before taking traffic
+    time.sleep(2)
+    print(f"\nOpen http://localhost:{proxy_port} (sticky proxy over {workers} replicas)")
+    print("Press Ctrl+C to stop all processes.\n")
+    
+    try:
+        StickyProxy(backends, port=proxy_port).run()
+    except KeyboardInterrupt:
+        print("\n\nShutting down...")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main(workers: int = 1):
     """Main launch function"""
     print("\n" + "="*60)
     print("  AI Math Tutor - Launcher")
@@ -52,6 +114,10 @@ def main():
     print("Press Ctrl+C to stop the application.\n")
     print("="*60 + "\n")
     
+    if workers > 1:
+        launch_replicas(workers)
+        return
+    
     try:
         subprocess.run([sys.executable, "-m", "streamlit", "run", "app.py"])
     except KeyboardInterrupt:
@@ -62,5 +128,12 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Launch AI Math Tutor")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of app replicas behind a sticky proxy (default: 1)")
+    
+    args = parser.parse_args()
+    main(workers=args.workers)
 
@@ -5,12 +5,20 @@ Chat Page - Interactive tutoring conversation
 import streamlit as st
 from datetime import datetime
 import sys
+import time
+import uuid
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.utils.math_renderer import render_math_message
+from src.core.state_store import persist_session_state
+from src.utils.config import config
+from src.utils.metrics import observe_render
+from src.utils.math_renderer import render_message_cached
+from src.utils.startup import init_warmup
+
+render_start = time.perf_counter()
 
 st.set_page_config(
     page_title="Chat - AI Math Tutor",
@@ -23,10 +31,37 @@ if 'current_student' not in st.session_state or st.session_state.current_student
     st.warning("Please select or create a student profile first!")
     if st.button("Go to Home"):
         st.switch_page("app.py")
+    init_warmup()
     st.stop()
 
+# Save the state left by the previous run (it may have ended in a rerun or page switch)
+persist_session_state(st.session_state.get('state_store'))
+
 st.markdown("# ▸ Chat with Your Math Tutor")
 
+# Number of most recent messages rendered on each rerun
+CHAT_WINDOW = config.get('ui.chat_window_messages', 20)
+
+
+def render_chat_message(message):
+    """Render one transcript message, reusing its cached markdown"""
+    role = message["role"]
+    prerenderer = st.session_state.get('math_prerenderer')
+    content = render_message_cached(message.get("id"), message["content"], role,
+                                    message.get("metadata"), prerenderer)
+    
+    if role == "student":
+        with st.chat_message("user", avatar="👤"):
+            # Typed by the student: never shown as HTML
+            st.markdown(content)
+            attachments = (message.get("metadata") or {}).get("attachments")
+            if attachments:
+                st.caption("📎 " + ", ".join(item["name"] for item in attachments))
+    else:
+        with st.chat_message("assistant", avatar="🤓"):
+            st.markdown(content, unsafe_allow_html=prerenderer is not None)
+
+
 # Custom CSS for upload button visibility - ONLY for upload button
 st.markdown("""
 <style>
@@ -60,18 +95,26 @@ if 'chat_messages' not in st.session_state:
 if 'chat_session_id' not in st.session_state:
     st.session_state.chat_session_id = None
 
+if 'chat_window' not in st.session_state:
+    st.session_state.chat_window = CHAT_WINDOW
+
 # Load existing session if needed
 if st.session_state.current_session and st.session_state.chat_session_id != st.session_state.current_session:
     st.session_state.chat_session_id = st.session_state.current_session
+    st.session_state.chat_window = CHAT_WINDOW
     
     # Load messages from database
     session_manager = st.session_state.conversation_handler.session_manager
-    messages = session_manager.get_session_messages(st.session_state.chat_session_id)
+    messages = session_manager.normalize_tutor_messages(
+        session_manager.get_session_messages(st.session_state.chat_session_id)
+    )
     
     st.session_state.chat_messages = [
         {
+            "id": msg.id,
             "role": msg.role,
             "content": msg.content,
+            "metadata": msg.message_metadata,
             "timestamp": msg.timestamp
         }
         for msg in messages
@@ -85,6 +128,7 @@ with st.sidebar:
         st.session_state.chat_messages = []
         st.session_state.chat_session_id = None
         st.session_state.current_session = None
+        st.session_state.chat_window = CHAT_WINDOW
         st.rerun()
     
     st.markdown("---")
@@ -155,16 +199,16 @@ with chat_container:
             "What would you like to work on today?"
         )
     else:
-        for message in st.session_state.chat_messages:
-            role = message["role"]
-            content = message["content"]
-            
-            if role == "student":
-                with st.chat_message("user", avatar="👤"):
-                    st.markdown(content)
-            else:
-                with st.chat_message("assistant", avatar="🤓"):
-                    st.markdown(content)
+        # Only the most recent messages are rendered; older ones load on demand
+        hidden = max(len(st.session_state.chat_messages) - st.session_state.chat_window, 0)
+        
+        if hidden:
+            if st.button(f"↑ Load earlier messages ({hidden} more)", key="load_earlier_messages"):
+                st.session_state.chat_window += CHAT_WINDOW
+                st.rerun()
+        
+        for message in st.session_state.chat_messages[hidden:]:
+            render_chat_message(message)
 
 # Chat input section
 st.markdown("---")
@@ -225,6 +269,18 @@ if st.session_state.show_upload:
         if uploaded_files:
             st.success(f"✅ Successfully uploaded {len(uploaded_files)} file(s)")
             
+            # Process each new file in the background (stored, resized or read)
+            upload_pipeline = st.session_state.conversation_handler.upload_pipeline
+            upload_jobs = st.session_state.setdefault('upload_jobs', {})
+            for file in uploaded_files:
+                file_key = getattr(file, "file_id", None) or f"{file.name}:{file.size}"
+                if file_key not in upload_jobs and upload_pipeline is not None:
+                    upload_jobs[file_key] = upload_pipeline.submit(
+                        file.name, file.getbuffer(), file.type,
+                        student_id=st.session_state.current_student.id
+                    )
+            file_keys = [getattr(file, "file_id", None) or f"{file.name}:{file.size}" for file in uploaded_files]
+            
             # Display uploaded files with previews
             st.markdown("#### Uploaded Files:")
             cols = st.columns(min(len(uploaded_files), 3))
@@ -241,11 +297,29 @@ if st.session_state.show_upload:
                         else:
                             st.info(f"📄 {file.type.split('/')[-1].upper()}")
                         
+                        job = upload_jobs.get(file_keys[idx])
+                        if job is None or not job.done():
+                            st.caption("Processing…")
+                        else:
+                            result = job.result()
+                            understanding = result.get("understanding")
+                            if result["error"]:
+                                st.warning(result["error"])
+                            elif result["kind"] == "image":
+                                st.caption(f"Ready • {result['width']}×{result['height']}")
+                            else:
+                                st.caption(f"Ready • {result['pages']} page(s)"
+                                           + (" (truncated)" if result["truncated"] else ""))
+                            if understanding and not understanding["error"] and understanding["problem_text"]:
+                                with st.expander("Problems found" + (" (seen before)" if understanding["cached"] and not understanding.get("hint") else "")):
+                                    st.markdown(understanding["problem_text"])
+                        
                         # Individual action buttons
                         col_a, col_b = st.columns(2)
                         with col_a:
                             if st.button("✍️ Ask", key=f"ask_{idx}", use_container_width=True):
                                 st.session_state.chat_input = f"I uploaded '{file.name}'. Can you help me understand this problem?"
+                                st.session_state.pending_attachments = [file_keys[idx]]
                                 st.session_state.show_upload = False
                                 st.rerun()
                         
@@ -258,6 +332,7 @@ if st.session_state.show_upload:
             if st.button("▸ Ask about all files", type="primary", use_container_width=True):
                 file_names = ", ".join([f.name for f in uploaded_files])
                 st.session_state.chat_input = f"I've uploaded {len(uploaded_files)} files: {file_names}. Can you help me with these?"
+                st.session_state.pending_attachments = file_keys
                 st.session_state.show_upload = False
                 st.rerun()
     
@@ -302,17 +377,33 @@ if default_input and not user_input:
 
 # Process user input
 if user_input:
+    previous_session_id = st.session_state.chat_session_id
+    
+    # Collect the files this message asks about (waiting for any still processing)
+    attachments = []
+    upload_jobs = st.session_state.get('upload_jobs', {})
+    for file_key in st.session_state.pop('pending_attachments', []):
+        job = upload_jobs.get(file_key)
+        if job is None:
+            continue
+        try:
+            attachments.append(job.result(timeout=60))
+        except Exception as e:
+            st.warning(f"Could not attach a file: {e}")
+    
     # Add user message to display
-    st.session_state.chat_messages.append({
+    user_message = {
+        "id": f"local-{uuid.uuid4().hex}",
         "role": "student",
         "content": user_input,
+        "metadata": {"attachments": [{"name": item["name"]} for item in attachments]} if attachments else None,
         "timestamp": datetime.now()
-    })
+    }
+    st.session_state.chat_messages.append(user_message)
     
-    # Show user message immediately
+    # Show user message immediately (the transcript above is already on screen)
     with chat_container:
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(user_input)
+        render_chat_message(user_message)
     
     # Show thinking indicator
     with chat_container:
@@ -324,7 +415,8 @@ if user_input:
                         student_id=st.session_state.current_student.id,
                         message=user_input,
                         session_id=st.session_state.chat_session_id,
-                        session_type=session_type
+                        session_type=session_type,
+                        attachments=attachments
                     )
                     
                     if response["success"]:
@@ -334,25 +426,38 @@ if user_input:
                         
                         # Add tutor response to display
                         st.session_state.chat_messages.append({
+                            "id": response["message_id"],
                             "role": "tutor",
                             "content": response["response"],
+                            "metadata": response["message_metadata"],
                             "timestamp": response["timestamp"]
                         })
                         
                         # Display response
-                        st.markdown(response["response"])
+                        prerenderer = st.session_state.get('math_prerenderer')
+                        st.markdown(render_message_cached(
+                            response["message_id"], response["response"], "tutor",
+                            response["message_metadata"], prerenderer
+                        ), unsafe_allow_html=prerenderer is not None)
                         
                         # Show token usage
                         with st.expander("▸ Response Info"):
                             st.caption(f"Tokens used: {response['tokens_used']}")
+                        
+                        if response.get("budget_warning"):
+                            st.caption("You're close to today's tutoring limit.")
                     else:
                         st.error(f"Error: {response['error']}")
                 
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
     
-    # Rerun to update chat display
-    st.rerun()
+    # The new turn is already drawn, so only rerun when a new session was
+    # started and the chat history in the sidebar needs it
+    if st.session_state.chat_session_id != previous_session_id:
+        st.rerun()
+    
+    persist_session_state(st.session_state.get('state_store'))
 
 # Tips section
 with st.expander("▸ Tips for Getting Help"):
@@ -384,3 +489,5 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+observe_render("chat", render_start)
+init_warmup()
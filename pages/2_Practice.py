@@ -3,14 +3,21 @@ Practice Page - Practice problems and exercises
 """
 
 import streamlit as st
+import time
 import sys
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from src.core.state_store import persist_session_state
 from src.utils.config import config
+from src.utils.metrics import observe_render
 from src.utils.math_renderer import create_problem_card
+from src.utils.practice_parser import parse_practice_content
+from src.utils.startup import init_warmup
+
+render_start = time.perf_counter()
 
 st.set_page_config(
     page_title="Practice - AI Math Tutor",
@@ -23,8 +30,12 @@ if 'current_student' not in st.session_state or st.session_state.current_student
     st.warning("Please select or create a student profile first!")
     if st.button("Go to Home"):
         st.switch_page("app.py")
+    init_warmup()
     st.stop()
 
+# Save the state left by the previous run (it may have ended in a rerun or page switch)
+persist_session_state(st.session_state.get('state_store'))
+
 st.markdown("# ▸ Practice Problems")
 st.markdown(f"**Student:** {st.session_state.current_student.name}")
 
@@ -80,33 +91,25 @@ with st.sidebar:
         if selected_topic:
             with st.spinner(f"Generating {problem_count} problems... This may take 10-20 seconds"):
                 try:
-                    # Request practice problems from AI with optimized settings
-                    ai_client = st.session_state.ai_client
-                    from src.ai.ai_client import PromptBuilder
-                    
-                    # Build prompt
-                    prompt_builder = PromptBuilder()
-                    system_prompt = prompt_builder.build_system_prompt(
-                        student_name=st.session_state.current_student.name,
-                        grade_level=st.session_state.current_student.grade_level
-                    )
-                    
-                    practice_prompt = prompt_builder.format_practice_request_prompt(
-                        topic=selected_topic,
-                        difficulty=difficulty,
-                        count=problem_count
-                    )
+                    student = st.session_state.current_student
                     
-                    # Generate with higher token limit for practice problems
-                    response = ai_client.create_message(
-                        system=system_prompt,
-                        messages=[{"role": "user", "content": practice_prompt}],
-                        max_tokens=3000  # Increased for multiple problems
+                    # Use the prefetched set if it matches, otherwise generate now
+                    content = st.session_state.practice_prefetcher.take(
+                        student.id, selected_topic, difficulty, problem_count
                     )
+                    if not content:
+                        content = st.session_state.practice_manager.generate_practice_set(
+                            student_id=student.id,
+                            student_name=student.name,
+                            grade_level=student.grade_level,
+                            topic=selected_topic,
+                            difficulty=difficulty,
+                            count=problem_count
+                        )
                     
-                    if response["content"]:
+                    if content:
                         # Store the response content
-                        st.session_state.practice_content = response["content"]
+                        st.session_state.practice_content = content
                         st.session_state.practice_topic = selected_topic
                         st.session_state.practice_difficulty = difficulty
                         st.success(f"{problem_count} problems generated successfully!")
@@ -162,43 +165,25 @@ with col1:
         </div>
         """, unsafe_allow_html=True)
         
-        # Parse problems and solutions from AI content
-        import re
-        content = st.session_state.practice_content
-        
-        # Split by Solutions heading
-        split_patterns = [
-            r'\n#+\s*Solutions?\s*\n',
-            r'\n\*\*Solutions?\*\*\s*\n',
-            r'\n##\s*Solutions?\s*\n',
-            r'\nSOLUTIONS?\s*\n'
-        ]
-        
-        problems_part = content
-        solutions_part = None
-        
-        for pattern in split_patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
-            if match:
-                problems_part = content[:match.start()]
-                solutions_part = content[match.end():]
-                break
-        
-        # Parse individual problems
-        problem_pattern = r'\*\*Problem\s*(\d+)[:\.]?\*\*\s*(.*?)(?=\*\*Problem\s*\d+|\Z)'
-        problems = re.findall(problem_pattern, problems_part, re.DOTALL | re.IGNORECASE)
+        # Parse problems and solutions from AI content (cached per content hash)
+        parsed = parse_practice_content(st.session_state.practice_content)
+        set_key = parsed["set_key"]
+        problems = parsed["problems"]
+        solutions_dict = parsed["solutions"]
         
-        if not problems:
-            # Fallback: try to split by numbers or dashes
-            problem_splits = re.split(r'\n(?:\d+[\.\)]|\-{3,})\s*', problems_part)
-            problems = [(str(i+1), prob.strip()) for i, prob in enumerate(problem_splits) if prob.strip()]
+        # A different set was loaded (generated, prefetched or reopened): start it fresh
+        if st.session_state.get('active_practice_set') != set_key:
+            st.session_state.active_practice_set = set_key
+            st.session_state.problem_completed = {}
+            st.session_state.show_solution = {}
+            st.session_state.problem_feedback = {}
+            st.session_state.answer_correct = {}
+            for widget_key in [key for key in st.session_state
+                               if key.startswith(("answer_", "work_")) and key != "answer_correct"]:
+                del st.session_state[widget_key]
         
-        # Parse solutions
-        solutions_dict = {}
-        if solutions_part:
-            solution_pattern = r'\*\*(?:Problem\s*)?(\d+)[:\.]?\s*(?:Solution)?[:\.]?\*\*\s*(.*?)(?=\*\*(?:Problem\s*)?\d+|\Z)'
-            solutions = re.findall(solution_pattern, solutions_part, re.DOTALL | re.IGNORECASE)
-            solutions_dict = {num: sol.strip() for num, sol in solutions}
+        # Formulas as server-rendered MathML when pre-rendering is on
+        prerenderer = st.session_state.get('math_prerenderer')
         
         # Initialize problem states
         if 'problem_completed' not in st.session_state:
@@ -210,15 +195,11 @@ with col1:
         if 'answer_correct' not in st.session_state:
             st.session_state.answer_correct = {}
         
+        # Answers collected for "Check All Answers"
+        submissions = []
+        
         # Display each problem in a custom card
         for idx, (prob_num, prob_text) in enumerate(problems):
-            # Clean up problem text
-            prob_text = re.sub(r'<br\s*/?>', '\n', prob_text.strip())
-            prob_text = re.sub(r'<[^>]+>', '', prob_text)
-            prob_text = re.sub(r'\*\*', '', prob_text)  # Remove markdown bold markers
-            prob_text = re.sub(r'^[\-\_\*]{2,}', '', prob_text, flags=re.MULTILINE)  # Remove --- or *** lines
-            prob_text = prob_text.strip()
-            
             # Streamlined problem header
             st.markdown(f"""
             <div style='display: inline-flex; align-items: center; margin-bottom: 0.75rem; margin-top: 1.5rem;'>
@@ -233,9 +214,10 @@ with col1:
             """, unsafe_allow_html=True)
             
             # Problem content - LARGER FONT
+            problem_html = prerenderer.render_markdown(prob_text, escape_html=False) if prerenderer else prob_text
             st.markdown(f"""
             <div style='font-size: 1.15rem; line-height: 1.7; color: #1f2937; margin-bottom: 1rem; font-weight: 500;'>
-                {prob_text}
+                {problem_html}
             </div>
             """, unsafe_allow_html=True)
             
@@ -270,52 +252,58 @@ with col1:
                 label_visibility="collapsed"
             )
             
+            # Collect the submission for batch grading
+            submissions.append({
+                "key": problem_key,
+                "number": prob_num,
+                "problem_text": prob_text,
+                "answer": answer,
+                "work": work,
+                "solution": solutions_dict.get(prob_num, "")
+            })
+            
             # Check answer with AI tutor
             if check_button and answer:
                 with st.spinner("Checking your answer..."):
                     try:
-                        ai_client = st.session_state.ai_client
-                        from src.ai.ai_client import PromptBuilder
+                        practice_manager = st.session_state.practice_manager
                         
                         # Get the solution for comparison
                         solution = solutions_dict.get(prob_num, "")
                         
-                        # Build tutoring prompt
-                        prompt_builder = PromptBuilder()
-                        system_prompt = prompt_builder.build_system_prompt(
+                        result = practice_manager.check_answer(
                             student_name=st.session_state.current_student.name,
-                            grade_level=st.session_state.current_student.grade_level
-                        )
-                        
-                        check_prompt = f"""I'm working on this problem:
-{prob_text}
-
-My answer: {answer}
-
-{f"My work: {work}" if work else ""}
-
-Can you check if my answer is correct? If it's right, confirm it briefly. If it's wrong, help me understand what I did wrong and guide me toward the correct answer. Don't just give me the answer - help me learn.
-
-The correct solution is: {solution}"""
-                        
-                        response = ai_client.create_message(
-                            system=system_prompt,
-                            messages=[{"role": "user", "content": check_prompt}],
-                            max_tokens=1000
+                            grade_level=st.session_state.current_student.grade_level,
+                            problem_text=prob_text,
+                            answer=answer,
+                            work=work,
+                            solution=solution,
+                            student_id=st.session_state.current_student.id
                         )
                         
-                        if response["content"]:
+                        if result["feedback"]:
                             # Store feedback
-                            st.session_state.problem_feedback[problem_key] = response["content"]
+                            st.session_state.problem_feedback[problem_key] = result["feedback"]
+                            st.session_state.answer_correct[problem_key] = result["is_correct"]
                             
-                            # Check if correct (simple heuristic)
-                            feedback_lower = response["content"].lower()
-                            is_correct = any(word in feedback_lower[:200] for word in ["correct", "right", "exactly", "perfect", "yes"])
-                            st.session_state.answer_correct[problem_key] = is_correct
-                            
-                            if is_correct:
+                            if result["is_correct"]:
                                 st.session_state.problem_completed[problem_key] = True
                             
+                            # Record the attempt in the background
+                            st.session_state.practice_recorder.record_attempt(
+                                student_id=st.session_state.current_student.id,
+                                topic=st.session_state.practice_topic,
+                                difficulty=st.session_state.practice_difficulty,
+                                set_key=set_key,
+                                number=prob_num,
+                                problem_text=prob_text,
+                                student_answer=answer,
+                                is_correct=result["is_correct"],
+                                feedback=result["feedback"],
+                                correct_answer=practice_manager.extract_final_answer(solution) or "",
+                                solution_explanation=solution or None
+                            )
+                            
                             st.rerun()
                     
                     except Exception as e:
@@ -376,9 +364,7 @@ The correct solution is: {solution}"""
             
             # Show solution if toggled
             if st.session_state.show_solution.get(problem_key) and prob_num in solutions_dict:
-                solution_text = solutions_dict[prob_num]
-                solution_text = re.sub(r'<br\s*/?>', '\n', solution_text)
-                solution_text = re.sub(r'<[^>]+>', '', solution_text)
+                solution_text = parsed["solution_texts"][prob_num]
                 
                 st.markdown(f"""
                 <div style='background-color: #f3f4f6; padding: 1rem; 
@@ -388,10 +374,65 @@ The correct solution is: {solution}"""
                 </div>
                 """, unsafe_allow_html=True)
                 
-                st.markdown(solution_text)
+                if prerenderer:
+                    st.markdown(prerenderer.render_markdown(solution_text), unsafe_allow_html=True)
+                else:
+                    st.markdown(solution_text)
             
             st.markdown("<br>", unsafe_allow_html=True)
         
+        # Record the generated problems once per set (written in the background)
+        if submissions and st.session_state.get('recorded_practice_set') != set_key:
+            practice_manager = st.session_state.practice_manager
+            st.session_state.practice_recorder.record_problem_set(
+                student_id=st.session_state.current_student.id,
+                topic=st.session_state.practice_topic,
+                difficulty=st.session_state.practice_difficulty,
+                set_key=set_key,
+                problems=[
+                    {
+                        "number": sub["number"],
+                        "problem_text": sub["problem_text"],
+                        "correct_answer": practice_manager.extract_final_answer(sub["solution"]) or "",
+                        "solution_explanation": sub["solution"] or None
+                    }
+                    for sub in submissions
+                ]
+            )
+            st.session_state.recorded_practice_set = set_key
+        
+        # Batch grading of every answered problem
+        answered = [sub for sub in submissions if sub["answer"]]
+        if answered:
+            if st.button(
+                f"✓ Check All Answers ({len(answered)})",
+                key="check_all",
+                use_container_width=True,
+                type="primary"
+            ):
+                with st.spinner(f"Checking {len(answered)} answers..."):
+                    try:
+                        results = st.session_state.practice_manager.grade_batch(
+                            student_id=st.session_state.current_student.id,
+                            student_name=st.session_state.current_student.name,
+                            grade_level=st.session_state.current_student.grade_level,
+                            topic=st.session_state.practice_topic,
+                            difficulty=st.session_state.practice_difficulty,
+                            submissions=answered,
+                            set_key=set_key
+                        )
+                        
+                        for result in results:
+                            st.session_state.problem_feedback[result["key"]] = result["feedback"]
+                            st.session_state.answer_correct[result["key"]] = bool(result["is_correct"])
+                            if result["is_correct"]:
+                                st.session_state.problem_completed[result["key"]] = True
+                        
+                        st.rerun()
+                    
+                    except Exception as e:
+                        st.error(f"Error checking answers: {str(e)}")
+        
         # Progress summary
         completed_count = sum(1 for v in st.session_state.problem_completed.values() if v)
         total_count = len(problems)
@@ -410,6 +451,19 @@ The correct solution is: {solution}"""
             with col_prog2:
                 st.metric("Completed", f"{completed_count}/{total_count}")
             
+            # Set nearly done - prepare the likely next set in the background (once per set)
+            if completed_count >= total_count - 1 and config.get('practice.prefetch_enabled', True) \
+                    and st.session_state.get('prefetched_practice_set') != set_key:
+                st.session_state.prefetched_practice_set = set_key
+                st.session_state.practice_prefetcher.prefetch(
+                    student_id=st.session_state.current_student.id,
+                    student_name=st.session_state.current_student.name,
+                    grade_level=st.session_state.current_student.grade_level,
+                    difficulty=st.session_state.practice_difficulty,
+                    count=total_count,
+                    current_topic=st.session_state.practice_topic
+                )
+            
             if completed_count == total_count:
                 st.success("Amazing! You've completed all problems!")
                 st.balloons()
@@ -434,7 +488,10 @@ The correct solution is: {solution}"""
         
         with col_c:
             if st.button("▸ Save Progress", use_container_width=True, type="primary"):
-                st.success("Progress saved!")
+                if st.session_state.practice_recorder.flush(timeout=5.0):
+                    st.success("Progress saved!")
+                else:
+                    st.info("Still saving your progress - it will finish in the background.")
     
     else:
         # No practice content yet
@@ -512,3 +569,5 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+observe_render("practice", render_start)
+init_warmup()
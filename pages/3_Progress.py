@@ -3,16 +3,21 @@ Progress Page - Track student progress and analytics
 """
 
 import streamlit as st
+import time
 import sys
 from pathlib import Path
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import pandas as pd
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from src.core.state_store import persist_session_state
+from src.utils.config import config
+from src.utils.metrics import observe_render
+from src.utils.startup import init_warmup
+
+render_start = time.perf_counter()
+
 st.set_page_config(
     page_title="Progress - AI Math Tutor",
     page_icon="↗",
@@ -24,18 +29,23 @@ if 'current_student' not in st.session_state or st.session_state.current_student
     st.warning("Please select or create a student profile first!")
     if st.button("Go to Home"):
         st.switch_page("app.py")
+    init_warmup()
     st.stop()
 
+# Save the state left by the previous run (it may have ended in a rerun or page switch)
+persist_session_state(st.session_state.get('state_store'))
+
 st.markdown("# ↗ Your Progress")
 st.markdown(f"**Student:** {st.session_state.current_student.name} (Grade {st.session_state.current_student.grade_level})")
 
 # Get student data
 student_id = st.session_state.current_student.id
-student_manager = st.session_state.student_manager
-db_manager = st.session_state.db_manager
+dashboard = st.session_state.progress_dashboard
 
-# Get comprehensive summary
-summary = student_manager.get_student_summary(student_id)
+# Get comprehensive summary and the prepared dashboard data (both cached)
+summary = st.session_state.view_cache.get_student_summary(student_id)
+view = dashboard.get_view_model(student_id)
+progress_records = view["progress"]
 
 if not summary or summary["statistics"]["total_sessions"] == 0:
     st.info("Start learning to see your progress here!")
@@ -47,6 +57,7 @@ if not summary or summary["statistics"]["total_sessions"] == 0:
     with col2:
         if st.button("▸ Practice Problems", use_container_width=True, type="primary"):
             st.switch_page("pages/2_Practice.py")
+    init_warmup()
     st.stop()
 
 # Overview metrics
@@ -76,13 +87,10 @@ with col3:
     )
 
 with col4:
-    # Calculate average accuracy
-    progress_records = db_manager.get_student_progress(student_id)
     if progress_records:
-        avg_accuracy = sum(p.accuracy for p in progress_records) / len(progress_records)
         st.metric(
             "Avg. Accuracy",
-            f"{round(avg_accuracy * 100)}%",
+            f"{round(view['avg_accuracy'] * 100)}%",
             help="Average accuracy across all topics"
         )
     else:
@@ -97,43 +105,9 @@ with col1:
     st.markdown("## ▸ Topic Mastery")
     
     if progress_records:
-        # Create dataframe for visualization
-        progress_data = []
-        for prog in progress_records:
-            progress_data.append({
-                "Topic": prog.topic,
-                "Subtopic": prog.subtopic or "",
-                "Accuracy": prog.accuracy * 100,
-                "Attempts": prog.attempts,
-                "Skill Level": prog.skill_level,
-                "Last Practiced": prog.last_practiced
-            })
-        
-        df = pd.DataFrame(progress_data)
-        
-        # Sort by accuracy
-        df = df.sort_values("Accuracy", ascending=True)
-        
-        # Create horizontal bar chart
-        fig = px.bar(
-            df,
-            y="Topic",
-            x="Accuracy",
-            orientation='h',
-            color="Accuracy",
-            color_continuous_scale=["#ff4444", "#ffaa00", "#44ff44"],
-            range_color=[0, 100],
-            title="Accuracy by Topic",
-            labels={"Accuracy": "Accuracy (%)"}
-        )
-        
-        fig.update_layout(
-            height=400,
-            showlegend=False,
-            xaxis_range=[0, 100]
-        )
+        df = view["frame"]
         
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(dashboard.figure(view["accuracy_figure"]), use_container_width=True)
         
         # Detailed topic breakdown
         st.markdown("### 📋 Detailed Breakdown")
@@ -164,28 +138,7 @@ with col2:
     st.markdown("## ▸ Skill Levels")
     
     if progress_records:
-        # Count skill levels
-        skill_counts = {}
-        for prog in progress_records:
-            level = prog.skill_level
-            skill_counts[level] = skill_counts.get(level, 0) + 1
-        
-        # Create pie chart
-        fig = go.Figure(data=[go.Pie(
-            labels=list(skill_counts.keys()),
-            values=list(skill_counts.values()),
-            hole=.3,
-            marker=dict(colors=['#ff6b6b', '#ffd93d', '#6bcf7f', '#4ecdc4'])
-        )])
-        
-        fig.update_layout(
-            title="Topics by Skill Level",
-            height=300,
-            showlegend=True,
-            legend=dict(orientation="v")
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(dashboard.figure(view["skill_figure"]), use_container_width=True)
         
         # Skill level legend
         st.markdown("**Skill Levels:**")
@@ -232,15 +185,26 @@ else:
 # Study recommendations
 st.markdown("## ▸ Recommendations")
 
+# Prepare a practice set for the weakest topic in the background, unless one
+# is already waiting (this runs on every rerun of the page)
+prefetcher = st.session_state.get('practice_prefetcher')
+if progress_records and prefetcher and config.get('practice.prefetch_enabled', True) \
+        and not prefetcher.has_pending(student_id):
+    prefetcher.prefetch(
+        student_id=student_id,
+        student_name=st.session_state.current_student.name,
+        grade_level=st.session_state.current_student.grade_level,
+        topic=view["weak_topics"][0].topic,
+        difficulty="medium",
+        count=config.get('practice.problems_per_set', 5)
+    )
+
 if progress_records:
-    # Find topics that need work (lowest accuracy)
-    weak_topics = sorted(progress_records, key=lambda x: x.accuracy)[:3]
-    
     col1, col2, col3 = st.columns(3)
     
     with col1:
         st.markdown("### ▸ Focus On")
-        for prog in weak_topics:
+        for prog in view["weak_topics"]:
             st.markdown(f"**{prog.topic}**")
             st.progress(prog.accuracy)
             st.caption(f"{round(prog.accuracy * 100)}% accuracy")
@@ -248,9 +212,8 @@ if progress_records:
     with col2:
         st.markdown("### ⚡ Quick Wins")
         # Topics close to mastery (70-85% accuracy)
-        almost_there = [p for p in progress_records if 0.70 <= p.accuracy < 0.85]
-        if almost_there:
-            for prog in almost_there[:3]:
+        if view["almost_there"]:
+            for prog in view["almost_there"]:
                 st.markdown(f"**{prog.topic}**")
                 st.caption(f"{round(prog.accuracy * 100)}% - Almost there!")
         else:
@@ -259,9 +222,8 @@ if progress_records:
     with col3:
         st.markdown("### 🏆 Mastered")
         # High accuracy topics (>= 85%)
-        mastered = [p for p in progress_records if p.accuracy >= 0.85]
-        if mastered:
-            for prog in mastered[:3]:
+        if view["mastered"]:
+            for prog in view["mastered"]:
                 st.markdown(f"**{prog.topic}** ✅")
                 st.caption(f"{round(prog.accuracy * 100)}% accuracy")
         else:
@@ -274,8 +236,21 @@ col1, col2 = st.columns(2)
 with col1:
     if st.button("▸ Generate Practice for Weak Topics", type="primary", use_container_width=True):
         if progress_records:
-            weakest = min(progress_records, key=lambda x: x.accuracy)
+            weakest = view["weak_topics"][0]
             st.session_state.practice_topic = weakest.topic
+            
+            # Open the prefetched set right away if it is ready
+            if prefetcher:
+                count = config.get('practice.problems_per_set', 5)
+                with st.spinner(f"Preparing {weakest.topic} practice..."):
+                    content = prefetcher.take(student_id, weakest.topic, "medium", count)
+                if content:
+                    st.session_state.practice_content = content
+                    st.session_state.practice_difficulty = "medium"
+                    st.session_state.problem_completed = {}
+                    st.session_state.show_solution = {}
+                    st.session_state.problem_feedback = {}
+                    st.session_state.answer_correct = {}
             st.switch_page("pages/2_Practice.py")
         else:
             st.warning("No progress data yet")
@@ -293,3 +268,5 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+observe_render("progress", render_start)
+init_warmup()
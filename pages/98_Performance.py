@@ -0,0 +1,311 @@
+"""Performance Page - Live latencies, AI usage, caches and database state
+
+Everything shown is read from in-process state (the perf store, cache
+counters, the connection pool, the token ledger's in-memory totals), so
+keeping this page open adds no load to the database.
+"""
+
+import streamlit as st
+import sys
+from pathlib import Path
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.cache import all_caches
+from src.utils.perf_store import perf_store
+from src.utils.startup import init_warmup
+from src.utils.tracing import tracer
+
+st.set_page_config(
+    page_title="Performance",
+    page_icon="📈",
+    layout="wide"
+)
+
+st.markdown("# 📈 Performance")
+st.markdown("Live view of this process: request latencies, AI usage, caches and the database.")
+
+WINDOWS = {"5 minutes": 300, "15 minutes": 900, "1 hour": 3600, "6 hours": 21600}
+
+col1, col2, col3 = st.columns([2, 2, 1])
+with col1:
+    window_label = st.selectbox("Window", list(WINDOWS), index=1)
+with col2:
+    refresh_seconds = st.select_slider("Auto-refresh", options=[0, 5, 10, 30, 60], value=10,
+                                       format_func=lambda s: f"{s}s" if s else "Off")
+with col3:
+    st.write("")
+    if st.button("Clear samples"):
+        perf_store.clear()
+
+window = WINDOWS[window_label]
+
+
+def _render():
+    """Draw every section from the in-process stores"""
+    st.caption(f"Updated {datetime.now().strftime('%H:%M:%S')}")
+
+    # ==================== Request Latency ====================
+    st.markdown("## ⏱️ Request Latency")
+
+    latency = perf_store.latency_summary(window)
+    if latency:
+        st.dataframe([
+            {
+                "Request": name,
+                "Count": stats["count"],
+                "Errors": stats["errors"],
+                "p50 (ms)": round(stats["p50_ms"], 1),
+                "p95 (ms)": round(stats["p95_ms"], 1),
+                "Max (ms)": round(stats["max_ms"], 1),
+                "AI share": f"{stats['ai_share']:.0%}",
+                "DB share": f"{stats['db_share']:.0%}",
+                "SQL / request": round(stats["statements_per_request"], 1)
+            }
+            for name, stats in sorted(latency.items())
+        ], use_container_width=True, hide_index=True)
+
+        recent = perf_store.recent_requests(limit=300)
+        recent = [entry for entry in recent if entry["time"] >= datetime.now().timestamp() - window]
+        if recent:
+            import plotly.express as px
+
+            figure = px.scatter(
+                x=[datetime.fromtimestamp(entry["time"]) for entry in recent],
+                y=[entry["duration_ms"] for entry in recent],
+                color=[entry["name"] for entry in recent],
+                labels={"x": "Time", "y": "Latency (ms)", "color": "Request"}
+            )
+            figure.update_layout(height=300, margin=dict(l=10, r=10, t=10, b=30))
+            st.plotly_chart(figure, use_container_width=True)
+    else:
+        st.info("No requests recorded in this window")
+
+    if not tracer.enabled or tracer.sample_rate < 1.0:
+        st.caption(
+            f"Latencies come from traced requests (tracing {'on' if tracer.enabled else 'off'}, "
+            f"sample rate {tracer.sample_rate:.0%})"
+        )
+
+    st.markdown("---")
+
+    # ==================== AI Usage ====================
+    st.markdown("## 🤖 AI Tokens & Cost")
+
+    bucket_seconds = 60 if window <= 3600 else 600
+    series = perf_store.ai_timeseries(window, bucket_seconds)
+    if series:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("AI Calls", sum(bucket["calls"] for bucket in series))
+        with col2:
+            st.metric("Tokens", f"{sum(b['input_tokens'] + b['output_tokens'] for b in series):,}")
+        with col3:
+            st.metric("Cost (USD)", f"${sum(bucket['cost'] for bucket in series):.4f}")
+
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        times = [datetime.fromtimestamp(bucket["time"]) for bucket in series]
+        figure = make_subplots(specs=[[{"secondary_y": True}]])
+        figure.add_trace(go.Bar(x=times, y=[b["input_tokens"] for b in series], name="Input tokens"))
+        figure.add_trace(go.Bar(x=times, y=[b["output_tokens"] for b in series], name="Output tokens"))
+        figure.add_trace(
+            go.Scatter(x=times, y=[b["cost"] for b in series], name="Cost (USD)", mode="lines+markers"),
+            secondary_y=True
+        )
+        figure.update_layout(barmode="stack", height=320, margin=dict(l=10, r=10, t=10, b=30))
+        st.plotly_chart(figure, use_container_width=True)
+
+        st.dataframe([
+            {
+                "Route / Model": key,
+                "Calls": stats["calls"],
+                "Errors": stats["errors"],
+                "Tokens": stats["tokens"],
+                "Cost (USD)": f"${stats['cost']:.4f}",
+                "p95 (ms)": round(stats["p95_ms"], 1)
+            }
+            for key, stats in sorted(perf_store.ai_by_route(window).items())
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.info("No AI calls in this window")
+
+    st.markdown("---")
+
+    # ==================== Heavy Hitters ====================
+    st.markdown("## 🏋️ Heavy Hitters")
+
+    hitters = perf_store.heavy_hitters(window, limit=10)
+    if hitters:
+        st.dataframe([
+            {
+                "Student ID": hitter["student_id"],
+                "AI Calls": hitter["ai_calls"],
+                "Tokens": hitter["tokens"],
+                "Cost (USD)": f"${hitter['cost']:.4f}",
+                "Requests": hitter["requests"],
+                "Request time (s)": round(hitter["request_ms"] / 1000, 1)
+            }
+            for hitter in hitters
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.info("No per-student activity in this window")
+
+    st.markdown("---")
+
+    # ==================== Rate Limits ====================
+    st.markdown("## 🚦 Budgets & Rate Limits")
+
+    if 'token_ledger' in st.session_state:
+        snapshot = st.session_state.token_ledger.get_snapshot()
+        global_status = snapshot["global"]
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tokens Today (All Students)",
+                      f"{global_status['used']:,}" if global_status else "not loaded")
+        with col2:
+            hard = snapshot["limits"]["global_daily_hard"]
+            st.metric("Global Hard Limit", f"{hard:,}" if hard else "None")
+        with col3:
+            blocked = sum(1 for student in snapshot["students"] if student["exceeded"])
+            st.metric("Students Blocked", blocked)
+
+        if global_status and global_status["exceeded"]:
+            st.error("Global hard budget reached - AI calls are blocked")
+        elif global_status and global_status["warning"]:
+            st.warning("Global soft budget reached")
+
+        if snapshot["students"]:
+            st.dataframe([
+                {
+                    "Student ID": student["student_id"],
+                    "Tokens Today": student["used"],
+                    "Remaining": student["remaining"] if student["remaining"] is not None else "-",
+                    "Status": "blocked" if student["exceeded"] else "warning" if student["warning"] else "ok"
+                }
+                for student in snapshot["students"][:20]
+            ], use_container_width=True, hide_index=True)
+        shared = st.session_state.token_ledger.shared_cache is not None
+        st.caption(f"UTC day {snapshot['day']} • totals "
+                   f"{'counted for every replica in the shared cache' if shared else 'held in memory by the token ledger'}")
+    else:
+        st.warning("Token ledger not initialized. Go to Home page first.")
+
+    st.markdown("---")
+
+    # ==================== Caches ====================
+    st.markdown("## 🗄️ Caches")
+
+    caches = [cache.get_stats() for cache in all_caches()]
+    if caches:
+        st.dataframe([
+            {
+                "Cache": stats["name"],
+                "Hit ratio": f"{stats['hit_ratio']:.0%}",
+                "Hits": stats["hits"],
+                "Misses": stats["misses"],
+                "Entries": f"{stats['size']} / {stats['max_size']}",
+                "Evictions": stats["evictions"]
+            }
+            for stats in sorted(caches, key=lambda item: item["name"])
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.info("No caches created yet")
+
+    prerenderer = st.session_state.get('math_prerenderer')
+    if prerenderer is not None:
+        prerender_stats = prerenderer.get_stats()
+        disk = prerender_stats["disk"]
+        st.caption(
+            f"Math pre-rendering: {prerender_stats['renders']} formulas rendered "
+            f"({prerender_stats['render_errors']} left to KaTeX) • disk hit ratio {disk['hit_ratio']:.0%} • "
+            f"{disk['files']} files, {disk['bytes'] / 1024:.0f} of {disk['max_bytes'] / 1024:.0f} KB • "
+            f"{disk['evictions']} evicted"
+        )
+
+    handler = st.session_state.get('conversation_handler')
+    understanding = handler.upload_pipeline.understanding if handler and handler.upload_pipeline else None
+    if understanding is not None:
+        understanding_stats = understanding.get_stats()
+        disk = understanding_stats["disk"]
+        st.caption(
+            f"Upload understanding: {understanding_stats['exact_hits']} hits, "
+            f"{understanding_stats['hints']} similar-upload hints, {understanding_stats['misses']} transcribed "
+            f"({understanding_stats['failures']} failed) • hit ratio {understanding_stats['hit_ratio']:.0%} • "
+            f"{understanding_stats['tokens_saved']:,} tokens saved • {disk['files']} files, "
+            f"{disk['bytes'] / 1024:.0f} of {disk['max_bytes'] / 1024:.0f} KB • {disk['evictions']} evicted"
+        )
+
+    st.markdown("---")
+
+    # ==================== Tutoring Sessions ====================
+    st.markdown("## 🧑‍🎓 Tutoring Sessions")
+
+    if 'session_lifecycle' in st.session_state:
+        lifecycle = st.session_state.session_lifecycle.get_stats()
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Active", lifecycle["active"])
+        with col2:
+            st.metric("Started", lifecycle["started"])
+        with col3:
+            st.metric("Ended", lifecycle["ended"])
+        with col4:
+            st.metric("Expired (idle)", lifecycle["expired"])
+        st.caption(
+            f"Since this process started • sessions end {lifecycle['timeout_minutes']:.0f} minutes after "
+            f"their last message • {lifecycle['idle']} awaiting the next sweep • "
+            f"{lifecycle['sweeps']} sweeps ({lifecycle['failed_sweeps']} failed, "
+            f"{lifecycle['skipped_sweeps']} left to another replica)"
+        )
+    else:
+        st.warning("Session lifecycle not initialized. Go to Home page first.")
+
+    st.markdown("---")
+
+    # ==================== Database ====================
+    st.markdown("## 💾 Database")
+
+    if 'db_manager' in st.session_state:
+        pool = st.session_state.db_manager.get_pool_status()
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Pool", pool["pool"])
+        with col2:
+            st.metric("Checked Out", pool["checked_out"] if pool["checked_out"] is not None else "-")
+        with col3:
+            st.metric("Idle", pool["checked_in"] if pool["checked_in"] is not None else "-")
+        with col4:
+            st.metric("Overflow", pool["overflow"] if pool["overflow"] is not None else "-")
+    else:
+        st.warning("Database not initialized.")
+
+    slow = perf_store.slow_statements(limit=20)
+    st.markdown(f"**Slow statements** (≥ {perf_store.slow_statement_ms:.0f} ms)")
+    if slow:
+        st.dataframe([
+            {
+                "Time": datetime.fromtimestamp(entry["time"]).strftime('%H:%M:%S'),
+                "Operation": entry["operation"],
+                "Duration (ms)": round(entry["duration_ms"], 1),
+                "Statement": " ".join(entry["statement"].split())
+            }
+            for entry in slow
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.caption("None recorded")
+
+
+# Re-run only this part on a timer, not the whole script
+if refresh_seconds and hasattr(st, "fragment"):
+    st.fragment(run_every=refresh_seconds)(_render)()
+else:
+    _render()
+
+init_warmup()
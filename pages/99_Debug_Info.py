@@ -1,6 +1,7 @@
 """Debug Info Page - Shows current configuration"""
 
 import streamlit as st
+import json
 import os
 import sys
 from pathlib import Path
@@ -9,6 +10,9 @@ from datetime import datetime
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from src.utils.startup import init_warmup
+from src.utils.tracing import tracer
+
 st.set_page_config(
     page_title="Debug Info",
     page_icon="🔧",
@@ -62,6 +66,28 @@ if 'ai_client' in st.session_state:
     with col3:
         st.metric("Temperature", ai_client.temperature)
     
+    # Model routing policy and per-route statistics
+    st.markdown("### 🔀 Model Routes")
+    route_stats = ai_client.get_route_stats()
+    route_rows = []
+    for task in sorted(set(ai_client.routes) | set(route_stats)):
+        route = ai_client.get_route(task)
+        stats = route_stats.get(task, {})
+        route_rows.append({
+            "Task": task,
+            "Model": route["model"],
+            "Max Tokens": route["max_tokens"],
+            "Temperature": route["temperature"],
+            "Calls": stats.get("calls", 0),
+            "Errors": stats.get("errors", 0),
+            "Fallbacks": stats.get("fallbacks", 0),
+            "Avg Latency (ms)": round(stats.get("avg_latency_ms", 0.0)),
+            "Max Latency (ms)": round(stats.get("max_latency_ms", 0.0)),
+            "Tokens (in/out)": f"{stats.get('input_tokens', 0)}/{stats.get('output_tokens', 0)}",
+            "Cost (USD)": f"${stats.get('cost', 0.0):.4f}"
+        })
+    st.dataframe(route_rows, use_container_width=True, hide_index=True)
+    
     st.markdown("---")
     
     # Test the API
@@ -106,16 +132,217 @@ st.markdown("## 💾 Database Information")
 
 if 'db_manager' in st.session_state:
     db = st.session_state.db_manager
-    st.info(f"Database URL: {db.db_url}")
+    st.info(f"Database URL: {db.database_url}")
     
     if 'student_manager' in st.session_state:
         students = st.session_state.student_manager.get_all_students()
         st.metric("Total Students", len(students))
+    
+    if db.profiler is not None:
+        profile = db.profiler.report()
+        st.markdown(f"**SQL Profiler** ({profile['total_statements']} statements)")
+        st.dataframe([
+            {"Method": name, "Statements": stats["count"], "Total (ms)": stats["total_ms"],
+             "Mean (ms)": stats["mean_ms"], "Max (ms)": stats["max_ms"]}
+            for name, stats in profile["operations"].items()
+        ], use_container_width=True, hide_index=True)
+        if profile["n_plus_one"]:
+            st.warning(f"{len(profile['n_plus_one'])} suspected N+1 pattern(s)")
+        with st.expander("Full profiler report"):
+            st.code(db.profiler.format_report())
+            if st.button("Reset profiler"):
+                db.profiler.reset()
+                st.rerun()
+    else:
+        st.caption("SQL profiler is off (database.profiler.enabled in config.yaml)")
 else:
     st.warning("Database not initialized.")
 
 st.markdown("---")
 
+# Token Usage and Budgets
+st.markdown("## 🪙 Token Usage & Budgets")
+
+if 'token_ledger' in st.session_state:
+    ledger = st.session_state.token_ledger
+    current_student = st.session_state.get('current_student')
+    budget = ledger.check_budget(current_student.id if current_student else None)
+    
+    def _budget_caption(status):
+        if status["hard_limit"]:
+            return f"{status['remaining']:,} remaining of {status['hard_limit']:,}"
+        return "No hard limit"
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.metric("Tokens Today (All Students)", f"{budget['global']['used']:,}")
+        st.caption(_budget_caption(budget["global"]))
+        if budget["global"]["warning"]:
+            st.warning("Global soft budget reached")
+    
+    with col2:
+        if budget["student"]:
+            st.metric(f"Tokens Today ({current_student.name})", f"{budget['student']['used']:,}")
+            st.caption(_budget_caption(budget["student"]))
+            if budget["student"]["warning"]:
+                st.warning("Student soft budget reached")
+        else:
+            st.info("Select a student to see their usage")
+    
+    db = st.session_state.db_manager
+    usage_rows = db.get_token_usage_by_day(days=7)
+    if usage_rows:
+        st.markdown("**Last 7 Days (by task):**")
+        st.dataframe([
+            {
+                "Day": row["day"].isoformat(),
+                "Task": row["task"],
+                "Calls": row["calls"],
+                "Tokens": row["total_tokens"],
+                "Cost (USD)": f"${row['cost']:.4f}"
+            }
+            for row in usage_rows
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.info("No AI usage recorded yet")
+else:
+    st.warning("Token ledger not initialized. Go to Home page first.")
+
+st.markdown("---")
+
+# Practice Pipeline
+st.markdown("## ✎ Practice Pipeline")
+
+col1, col2 = st.columns(2)
+
+with col1:
+    if 'practice_prefetcher' in st.session_state:
+        prefetch_stats = st.session_state.practice_prefetcher.get_stats()
+        st.metric("Prefetch Hit Rate", f"{prefetch_stats['hit_rate']:.0%}")
+        st.caption(
+            f"Hits: {prefetch_stats['hits']} • Misses: {prefetch_stats['misses']} • "
+            f"Expired: {prefetch_stats['expired']} • Wasted: {prefetch_stats['wasted']} • "
+            f"Pending: {prefetch_stats['pending']}"
+        )
+
+with col2:
+    if 'practice_recorder' in st.session_state:
+        recorder_stats = st.session_state.practice_recorder.get_stats()
+        st.metric("Recorder Queue Depth", recorder_stats["queue_depth"])
+        st.caption(
+            f"Problems: {recorder_stats['problems_recorded']} • "
+            f"Attempts: {recorder_stats['attempts_recorded']} • "
+            f"Retried: {recorder_stats['retried_jobs']} • "
+            f"Dropped: {recorder_stats['dropped_jobs']} • "
+            f"Failed batches: {recorder_stats['failed_batches']}"
+        )
+
+st.markdown("---")
+
+# Request Traces
+st.markdown("## ⏱️ Request Traces")
+
+trace_stats = tracer.get_stats()
+st.caption(
+    f"Traces: {trace_stats['traces']} • Spans: {trace_stats['spans']} • Kept: {trace_stats['kept']} • "
+    f"Exported: {trace_stats['exported']} • Export errors: {trace_stats['export_errors']} • "
+    f"Dropped: {trace_stats['dropped']}"
+)
+
+traces = tracer.recent_traces(limit=50)
+if traces:
+    # Where chat turns spend their time, averaged over the recent ones
+    chat_turns = [trace for trace in traces if trace.root.name == "chat.turn"]
+    if chat_turns:
+        stage_totals = {}
+        for trace in chat_turns:
+            root_id = trace.root.span_id
+            for trace_span in trace.spans:
+                if trace_span.parent_id == root_id:
+                    stage_totals.setdefault(trace_span.name, []).append(trace_span.duration_ms)
+        st.markdown(f"**Chat turn stages (last {len(chat_turns)} turns):**")
+        st.dataframe([
+            {
+                "Stage": name,
+                "Avg (ms)": round(sum(durations) / len(durations), 1),
+                "Max (ms)": round(max(durations), 1),
+                "Share": f"{sum(durations) / sum(t.root.duration_ms for t in chat_turns):.0%}"
+            }
+            for name, durations in sorted(stage_totals.items(), key=lambda item: -sum(item[1]))
+        ], use_container_width=True, hide_index=True)
+    
+    traces_by_id = {trace.trace_id: trace for trace in traces}
+    
+    def _trace_label(trace_id):
+        trace = traces_by_id[trace_id]
+        started = datetime.fromtimestamp(trace.root.start_ns / 1e9).strftime('%H:%M:%S')
+        status = " ⚠️" if trace.root.error else ""
+        return f"{started} • {trace.root.name} • {trace.root.duration_ms:.0f} ms{status}"
+    
+    selected = traces_by_id[st.selectbox("Trace", list(traces_by_id), format_func=_trace_label)]
+    
+    # Waterfall: one bar per span, offset from the start of the trace
+    import plotly.graph_objects as go
+    
+    depth = {}
+    rows = []
+    for trace_span in sorted(selected.spans, key=lambda item: item.start_ns):
+        depth[trace_span.span_id] = depth.get(trace_span.parent_id, -1) + 1
+        rows.append({
+            "Span": "\u00a0\u00a0" * depth[trace_span.span_id] + trace_span.name,
+            "Start (ms)": round((trace_span.start_ns - selected.root.start_ns) / 1e6, 2),
+            "Duration (ms)": round(trace_span.duration_ms, 2),
+            "Thread": trace_span.thread,
+            "Error": trace_span.error or "",
+            "Attributes": ", ".join(f"{k}={v}" for k, v in trace_span.attributes.items())
+        })
+    
+    colors = {"chat": "#667eea", "practice": "#764ba2", "ai": "#f59e0b", "db": "#10b981"}
+    figure = go.Figure(go.Bar(
+        x=[row["Duration (ms)"] for row in rows],
+        base=[row["Start (ms)"] for row in rows],
+        y=list(range(len(rows))),
+        orientation="h",
+        marker_color=[
+            "#ef4444" if row["Error"] else colors.get(row["Span"].strip("\u00a0").split(".")[0], "#9ca3af")
+            for row in rows
+        ],
+        hovertext=[row["Attributes"] for row in rows]
+    ))
+    figure.update_layout(
+        height=max(240, 22 * len(rows) + 80),
+        margin=dict(l=10, r=10, t=10, b=30),
+        xaxis_title="ms since start of trace",
+        yaxis=dict(
+            autorange="reversed",
+            tickmode="array",
+            tickvals=list(range(len(rows))),
+            ticktext=[row["Span"] for row in rows]
+        )
+    )
+    st.plotly_chart(figure, use_container_width=True)
+    
+    with st.expander("Span details"):
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "Download JSONL",
+                "\n".join(json.dumps(item.to_dict(), default=str) for item in selected.spans),
+                file_name=f"trace-{selected.trace_id}.jsonl"
+            )
+        with col2:
+            st.download_button(
+                "Download OTLP/JSON",
+                json.dumps(selected.to_otlp(), default=str),
+                file_name=f"trace-{selected.trace_id}.otlp.json"
+            )
+else:
+    st.info("No traces yet - send a chat message or generate a practice set")
+
+st.markdown("---")
+
 # Session State
 with st.expander("📊 Session State (Click to expand)"):
     st.json({
@@ -129,3 +356,4 @@ with st.expander("📊 Session State (Click to expand)"):
 st.markdown("---")
 st.caption("This page is for debugging only. Remove it in production by deleting pages/99_Debug_Info.py")
 
+init_warmup()
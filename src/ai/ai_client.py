@@ -1,16 +1,67 @@
 """Anthropic Claude AI client wrapper"""
 
 import os
-from typing import List, Dict, Optional, Any
-from anthropic import Anthropic, AnthropicError
+import threading
+import time
+from typing import List, Dict, Optional, Any, Union
 import json
 
+from ..utils import metrics
+from ..utils.config import load_environment
+from ..utils.perf_store import perf_store
+from ..utils.tracing import KIND_CLIENT, span
+
+# The Anthropic SDK is imported on first use (it dominates cold-start import time)
+
+
+# Default routing policy per task type. A route without a model uses the client's
+# main model; explicit arguments to create_message always win over the route.
+DEFAULT_ROUTES = {
+    "chat": {},
+    "practice_generation": {"max_tokens": 3000},
+    "answer_check": {"model": "claude-haiku-4-5", "max_tokens": 1000, "temperature": 0.2},
+    "summarize": {"model": "claude-haiku-4-5", "max_tokens": 1000, "temperature": 0.3},
+    "transcribe": {"model": "claude-haiku-4-5", "max_tokens": 2000, "temperature": 0.0},
+}
+
+# Price per million tokens (USD), matched by model name prefix
+DEFAULT_PRICING = {
+    "claude-opus-4": {"input": 15.0, "output": 75.0},
+    "claude-sonnet-4": {"input": 3.0, "output": 15.0},
+    "claude-3-5-sonnet": {"input": 3.0, "output": 15.0},
+    "claude-haiku-4": {"input": 1.0, "output": 5.0},
+    "claude-3-5-haiku": {"input": 0.8, "output": 4.0},
+}
+
+# Prompt caching prices relative to a model's input price, unless its pricing
+# entry sets 'cache_write' / 'cache_read' itself
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+# HTTP statuses worth retrying on the next model (with any 5xx, incl. 529 overloaded):
+# request timeout, conflict and rate limit. Anything else (bad request, bad key,
+# permissions) would fail the same way on every model.
+FALLBACK_STATUSES = (408, 409, 429)
+
+
+def _should_fall_back(error: Exception) -> bool:
+    """Whether a failed call may succeed on the route's next model"""
+    from anthropic import APIConnectionError, APIStatusError
+    
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in FALLBACK_STATUSES or error.status_code >= 500
+    return False
+
 
 class AIClient:
     """Wrapper for Anthropic Claude API"""
     
     def __init__(self, api_key: str = None, model: str = None, 
-                 max_tokens: int = 4096, temperature: float = 0.7):
+                 max_tokens: int = 4096, temperature: float = 0.7,
+                 routes: Dict[str, Dict] = None, pricing: Dict[str, Dict] = None,
+                 ledger=None, base_url: str = None):
         """
         Initialize AI client
         
@@ -19,61 +70,282 @@ class AIClient:
             model: Model name (defaults to claude-3-5-sonnet-20241022)
             max_tokens: Maximum tokens for response
             temperature: Temperature for response generation (0.0 to 1.0)
+            routes: Per-task routing policy, task -> {model, max_tokens, temperature, fallback}
+            pricing: Price per million tokens by model prefix, for cost reporting
+            ledger: Optional TokenLedger that records usage and enforces budgets
+            base_url: API base URL (defaults to Anthropic's; used for mock servers)
         """
+        load_environment()
         self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("Anthropic API key is required. Set ANTHROPIC_API_KEY environment variable.")
         
-        self.client = Anthropic(api_key=self.api_key)
+        self.base_url = base_url
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model = model or os.getenv("AI_MODEL", "claude-sonnet-4-5-20250929")
         self.max_tokens = max_tokens
         self.temperature = temperature
+        
+        self.routes = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+        for task, route in (routes or {}).items():
+            self.routes.setdefault(task, {}).update(
+                {k: v for k, v in (route or {}).items() if v is not None}
+            )
+        self.pricing = dict(DEFAULT_PRICING)
+        self.pricing.update(pricing or {})
+        
+        self.ledger = ledger
+        
+        self._route_stats: Dict[str, Dict[str, Any]] = {}
+        self._stats_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """Anthropic SDK client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from anthropic import Anthropic
+                    self._client = Anthropic(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+    
+    # ==================== Routing ====================
+    
+    def get_route(self, task: str = None) -> Dict[str, Any]:
+        """
+        Resolve the routing policy for a task type
+        
+        Args:
+            task: Task type (chat, practice_generation, answer_check, summarize, transcribe)
+        
+        Returns:
+            Dict with 'model', 'max_tokens', 'temperature' and 'fallback_models'
+        """
+        route = self.routes.get(task or "chat", {})
+        model = route.get("model") or self.model
+        
+        fallback = route.get("fallback")
+        if fallback is None:
+            fallback = [self.model]
+        elif isinstance(fallback, str):
+            fallback = [fallback]
+        
+        return {
+            "model": model,
+            "max_tokens": route.get("max_tokens") or self.max_tokens,
+            "temperature": route.get("temperature", self.temperature),
+            "fallback_models": [m for m in fallback if m and m != model]
+        }
+    
+    def estimate_cost(self, model: str, input_tokens: int, output_tokens: int,
+                      cache_creation_tokens: int = 0, cache_read_tokens: int = 0) -> float:
+        """
+        Estimate the cost of a call in USD
+        
+        Args:
+            model: Model name
+            input_tokens: Input token count (not counting cached tokens)
+            output_tokens: Output token count
+            cache_creation_tokens: Input tokens written to the prompt cache
+            cache_read_tokens: Input tokens read from the prompt cache
+        
+        Returns:
+            Estimated cost (0.0 if the model has no known price)
+        """
+        # Longest matching prefix wins (e.g. dated model names)
+        prices = None
+        for prefix in sorted(self.pricing, key=len, reverse=True):
+            if model.startswith(prefix):
+                prices = self.pricing[prefix]
+                break
+        
+        if not prices:
+            return 0.0
+        
+        input_price = prices.get("input", 0.0)
+        return (input_tokens * input_price
+                + output_tokens * prices.get("output", 0.0)
+                + cache_creation_tokens * prices.get("cache_write", input_price * CACHE_WRITE_MULTIPLIER)
+                + cache_read_tokens * prices.get("cache_read", input_price * CACHE_READ_MULTIPLIER)
+                ) / 1_000_000
+    
+    def _record_route_call(self, task: str, model: str, latency_ms: float,
+                           usage: Dict[str, int] = None, cost: float = 0.0,
+                           error: bool = False, fallback: bool = False, student_id: int = None):
+        """Accumulate per-route statistics and export them as metrics"""
+        perf_store.record_ai_call(
+            task, model, latency_ms,
+            input_tokens=usage.get("input_tokens", 0) if usage else 0,
+            output_tokens=usage.get("output_tokens", 0) if usage else 0,
+            cost=cost, ok=not error, student_id=student_id
+        )
+        metrics.AI_REQUEST_SECONDS.observe(latency_ms / 1000, task, model, "error" if error else "ok")
+        if usage:
+            metrics.AI_TOKENS.inc(usage.get("input_tokens", 0), task, model, "input")
+            metrics.AI_TOKENS.inc(usage.get("output_tokens", 0), task, model, "output")
+            cached = usage.get("cache_read_input_tokens", 0)
+            if cached:
+                metrics.AI_TOKENS.inc(cached, task, model, "cache_read")
+            written = usage.get("cache_creation_input_tokens", 0)
+            if written:
+                metrics.AI_TOKENS.inc(written, task, model, "cache_write")
+        if cost:
+            metrics.AI_COST.inc(cost, task, model)
+        
+        with self._stats_lock:
+            stats = self._route_stats.setdefault(task, {
+                "calls": 0, "errors": 0, "fallbacks": 0,
+                "total_latency_ms": 0.0, "max_latency_ms": 0.0,
+                "input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+                "models": {}
+            })
+            stats["calls"] += 1
+            stats["total_latency_ms"] += latency_ms
+            stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+            if error:
+                stats["errors"] += 1
+            if fallback:
+                stats["fallbacks"] += 1
+            if usage:
+                stats["input_tokens"] += usage.get("input_tokens", 0)
+                stats["output_tokens"] += usage.get("output_tokens", 0)
+            stats["cost"] += cost
+    
+    def get_route_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get latency and cost statistics per route
+        
+        Returns:
+            Dict mapping task type to calls, errors, fallbacks, average and max
+            latency, token totals, cost and calls per model
+        """
+        with self._stats_lock:
+            report = {}
+            for task, stats in self._route_stats.items():
+                entry = dict(stats)
+                entry["models"] = dict(stats["models"])
+                entry["avg_latency_ms"] = stats["total_latency_ms"] / stats["calls"] if stats["calls"] else 0.0
+                report[task] = entry
+            return report
+    
+    # ==================== Requests ====================
     
     def create_message(self, system: str, messages: List[Dict[str, str]], 
-                      max_tokens: int = None, temperature: float = None) -> Dict[str, Any]:
+                      max_tokens: int = None, temperature: float = None,
+                      task: str = None, student_id: int = None,
+                      session_id: int = None) -> Dict[str, Any]:
         """
         Create a message using Claude API
         
+        The model, max_tokens and temperature come from the task's route unless
+        given explicitly. If the routed model fails, the route's fallback models
+        are tried in order. With a ledger attached, budgets are checked before the
+        call and the usage is recorded after it.
+        
         Args:
             system: System prompt/instructions
             messages: List of message dicts with 'role' and 'content'
             max_tokens: Override default max_tokens
             temperature: Override default temperature
+            task: Task type used to pick the route (defaults to chat)
+            student_id: Student the call is made for (for usage accounting)
+            session_id: Tutoring session the call belongs to (for usage accounting)
         
         Returns:
-            Response dict with 'content', 'usage', 'stop_reason'
-        """
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=max_tokens or self.max_tokens,
-                temperature=temperature if temperature is not None else self.temperature,
-                system=system,
-                messages=messages
-            )
+            Response dict with 'content', 'usage', 'stop_reason', 'model', 'task',
+            'latency_ms', 'cost' and 'budget'
+        """
+        task = task or "chat"
+        
+        with span("ai.create_message", task=task, messages=len(messages)):
+            return self._create_message(system, messages, max_tokens, temperature,
+                                        task, student_id, session_id)
+    
+    def _create_message(self, system: str, messages: List[Dict[str, str]],
+                        max_tokens: Optional[int], temperature: Optional[float],
+                        task: str, student_id: Optional[int],
+                        session_id: Optional[int]) -> Dict[str, Any]:
+        """Budget check, routed request with fallbacks, usage recording"""
+        from anthropic import AnthropicError
+        
+        budget = None
+        if self.ledger is not None:
+            # Raises BudgetExceededError when a hard budget is used up
+            with span("ai.budget_check"):
+                budget = self.ledger.enforce(student_id)
+        
+        route = self.get_route(task)
+        models = [route["model"]] + route["fallback_models"]
+        
+        last_error = None
+        for attempt, model in enumerate(models):
+            start = time.perf_counter()
+            try:
+                with span("ai.request", kind=KIND_CLIENT, model=model, attempt=attempt) as request_span:
+                    response = self.client.messages.create(
+                        model=model,
+                        max_tokens=max_tokens or route["max_tokens"],
+                        temperature=temperature if temperature is not None else route["temperature"],
+                        system=system,
+                        messages=messages
+                    )
+                    if request_span is not None:
+                        request_span.set_attribute("input_tokens", response.usage.input_tokens)
+                        request_span.set_attribute("output_tokens", response.usage.output_tokens)
+                        request_span.set_attribute("stop_reason", response.stop_reason or "")
+            except AnthropicError as e:
+                latency_ms = (time.perf_counter() - start) * 1000
+                self._record_route_call(task, model, latency_ms, error=True, fallback=attempt > 0,
+                                        student_id=student_id)
+                if not _should_fall_back(e):
+                    # A bad request or key fails on every model - don't pay to find out
+                    raise
+                last_error = e
+                continue
+            except Exception as e:
+                raise Exception(f"Error calling AI: {str(e)}")
+            
+            latency_ms = (time.perf_counter() - start) * 1000
             
             # Extract content
             content = ""
             if response.content:
                 content = response.content[0].text if response.content else ""
             
+            usage = {
+                "input_tokens": response.usage.input_tokens,
+                "output_tokens": response.usage.output_tokens,
+                "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", 0) or 0,
+                "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", 0) or 0
+            }
+            cost = self.estimate_cost(response.model, usage["input_tokens"], usage["output_tokens"],
+                                      usage["cache_creation_input_tokens"],
+                                      usage["cache_read_input_tokens"])
+            self._record_route_call(task, model, latency_ms, usage=usage, cost=cost,
+                                    fallback=attempt > 0, student_id=student_id)
+            
+            if self.ledger is not None:
+                with span("ai.record_usage"):
+                    self.ledger.record(task, response.model, usage, cost=cost,
+                                       student_id=student_id, session_id=session_id)
+            
             return {
                 "content": content,
-                "usage": {
-                    "input_tokens": response.usage.input_tokens,
-                    "output_tokens": response.usage.output_tokens
-                },
+                "usage": usage,
                 "stop_reason": response.stop_reason,
-                "model": response.model
+                "model": response.model,
+                "task": task,
+                "latency_ms": latency_ms,
+                "cost": cost,
+                "budget": budget
             }
         
-        except AnthropicError as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
-        except Exception as e:
-            raise Exception(f"Error calling AI: {str(e)}")
+        raise Exception(f"Anthropic API error: {str(last_error)}") from last_error
     
     def chat(self, system: str, messages: List[Dict[str, str]], 
-            max_tokens: int = None, temperature: float = None) -> str:
+            max_tokens: int = None, temperature: float = None, task: str = None) -> str:
         """
         Simplified chat method that returns just the content string
         
@@ -82,24 +354,30 @@ class AIClient:
             messages: List of message dicts with 'role' and 'content'
             max_tokens: Override default max_tokens
             temperature: Override default temperature
+            task: Task type used to pick the route
         
         Returns:
             Response content as string
         """
-        response = self.create_message(system, messages, max_tokens, temperature)
+        response = self.create_message(system, messages, max_tokens, temperature, task=task)
         return response["content"]
     
-    def generate_with_context(self, system: str, user_message: str, 
+    def generate_with_context(self, system: str, user_message: Union[str, List[Dict[str, Any]]], 
                              conversation_history: List[Dict[str, str]] = None,
-                             max_tokens: int = None) -> Dict[str, Any]:
+                             max_tokens: int = None, task: str = "chat",
+                             student_id: int = None, session_id: int = None) -> Dict[str, Any]:
         """
         Generate response with conversation history
         
         Args:
             system: System instructions
-            user_message: Current user message
+            user_message: Current user message (text, or a list of content blocks
+                          such as images and attached document text)
             conversation_history: Previous messages in conversation
             max_tokens: Override default max_tokens
+            task: Task type used to pick the route
+            student_id: Student the call is made for (for usage accounting)
+            session_id: Tutoring session the call belongs to (for usage accounting)
         
         Returns:
             Full response dict with content and usage
@@ -113,7 +391,8 @@ class AIClient:
         # Add current message
         messages.append({"role": "user", "content": user_message})
         
-        return self.create_message(system, messages, max_tokens)
+        return self.create_message(system, messages, max_tokens, task=task,
+                                   student_id=student_id, session_id=session_id)
     
     def count_tokens_estimate(self, text: str) -> int:
         """
@@ -3,27 +3,83 @@
 from typing import Optional, Dict
 import jwt
 from datetime import datetime, timedelta
+from functools import lru_cache
+import ipaddress
+import logging
 import os
-import bcrypt
+import time
 
 from ..database.db_manager import DatabaseManager
 from ..database.models import Student
+from ..utils.cache import LRUCache
+from ..utils.config import config
+from ..utils.shared_cache import SharedCache
+from .password_hasher import HasherBusyError, LoginThrottle, LoginThrottledError, PasswordHasher
+
+
+logger = logging.getLogger(__name__)
 
 
 class AuthManager:
     """Manages authentication and authorization"""
     
-    def __init__(self, db_manager: DatabaseManager, secret_key: str = None):
+    # Verified tokens are re-checked this many seconds before they expire
+    TOKEN_EXPIRY_MARGIN_SECONDS = 60
+    
+    def __init__(self, db_manager: DatabaseManager, secret_key: str = None,
+                 student_ttl_seconds: int = 60, max_cached_tokens: int = 4096,
+                 hasher: PasswordHasher = None, throttle: LoginThrottle = None,
+                 shared_cache: SharedCache = None):
         """
         Initialize auth manager
         
         Args:
             db_manager: Database manager instance
             secret_key: Secret key for JWT tokens
+            student_ttl_seconds: Seconds a student row is reused before reloading
+            max_cached_tokens: Maximum number of verified tokens kept
+            hasher: Password hasher (defaults to one configured from config.yaml)
+            throttle: Failed-login throttle (defaults to one configured from config.yaml)
+            shared_cache: Cache the default throttle counts failures in, so the
+                          limits hold across replicas (None = per process)
         """
         self.db = db_manager
+        self.hasher = hasher or PasswordHasher(
+            rounds=config.get('auth.bcrypt_rounds', 12),
+            max_workers=config.get('auth.hash_workers'),
+            max_pending=config.get('auth.max_pending_hashes', 64)
+        )
+        self.throttle = throttle or LoginThrottle(
+            max_attempts=config.get('auth.login_max_attempts', 5),
+            window_seconds=config.get('auth.login_window_seconds', 300),
+            max_attempts_per_ip=config.get('auth.login_max_attempts_per_ip', 20),
+            shared_cache=shared_cache
+        )
         self.secret_key = secret_key or os.getenv("SECRET_KEY", "change-this-secret-key-in-production")
         self.token_expiry_hours = 24
+        self.student_ttl_seconds = student_ttl_seconds
+        
+        # token -> (student_id, re-verify after, epoch); student_id -> (student, loaded at)
+        self._verified_tokens = LRUCache(max_size=max_cached_tokens, name="auth_tokens")
+        self._students = LRUCache(max_size=max_cached_tokens, name="auth_students")
+        
+        # Revocation epochs (a token is only valid while its epoch claim is current) are
+        # stored in the database; this caches them for student_ttl_seconds.
+        # student_id (None for global) -> (epoch, loaded at)
+        self._epochs = LRUCache(max_size=max_cached_tokens + 1, name="auth_epochs")
+        
+        db_manager.add_listener(self._handle_event)
+    
+    def _handle_event(self, event: str, student_id: int = None, **data):
+        """Drop the cached student row when the student is written; reload revoked epochs"""
+        if event == "student_updated" and student_id is not None:
+            self._students.pop(student_id)
+        elif event == "tokens_revoked":
+            self._epochs.pop(student_id)
+            if student_id is None:
+                self._students.clear()
+            else:
+                self._students.pop(student_id)
     
     def register_student(self, name: str, email: str, password: str, 
                         grade_level: int) -> Optional[Student]:
@@ -45,7 +101,7 @@ class AuthManager:
             return None
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = self.hasher.hash(password)
         
         # Create student with password
         with self.db.get_session() as db_session:
@@ -59,32 +115,60 @@ class AuthManager:
             db_session.flush()
             db_session.refresh(student)
             db_session.expunge(student)
-            return student
+        
+        self.db.notify("student_created", student_id=student.id)
+        return student
     
-    def authenticate(self, email: str, password: str) -> Optional[Student]:
+    def authenticate(self, email: str, password: str, ip: str = None) -> Optional[Student]:
         """
         Authenticate a student
         
+        A hash made at an outdated cost factor is replaced after a successful login.
+        
         Args:
             email: Email address
             password: Password
+            ip: Client IP address, for throttling
         
         Returns:
             Student object if authenticated, None otherwise
+        
+        Raises:
+            LoginThrottledError: If the email or IP has too many recent failures
+            HasherBusyError: If too many logins are already being checked
         """
+        self.throttle.check(email, ip)
+        
         student = self.db.get_student_by_email(email)
         
         if not student or not student.password_hash:
+            self.throttle.record_failure(email, ip)
             return None
         
         # Check password
-        if bcrypt.checkpw(password.encode('utf-8'), student.password_hash.encode('utf-8')):
+        if self.hasher.verify(password, student.password_hash):
+            self.throttle.record_success(email)
+            
+            if self.hasher.needs_rehash(student.password_hash):
+                self._set_password_hash(student.id, self.hasher.hash(password))
+            
             # Update last active
             self.db.update_student_last_active(student.id)
             return student
         
+        self.throttle.record_failure(email, ip)
         return None
     
+    def _set_password_hash(self, student_id: int, password_hash: str) -> bool:
+        """Store a new password hash for a student"""
+        with self.db.get_session() as session:
+            student = session.query(Student).filter(Student.id == student_id).first()
+            if student:
+                student.password_hash = password_hash
+                return True
+        
+        return False
+    
     def create_token(self, student_id: int) -> str:
         """
         Create JWT token for student
@@ -97,6 +181,7 @@ class AuthManager:
         """
         payload = {
             "student_id": student_id,
+            "epoch": self.get_token_epoch(student_id),
             "exp": datetime.utcnow() + timedelta(hours=self.token_expiry_hours),
             "iat": datetime.utcnow()
         }
@@ -104,6 +189,36 @@ class AuthManager:
         token = jwt.encode(payload, self.secret_key, algorithm="HS256")
         return token
     
+    # ==================== Revocation ====================
+    
+    def get_token_epoch(self, student_id: int) -> int:
+        """
+        Get the current revocation epoch for a student's tokens
+        
+        Both epochs only ever grow, so their sum changes on every revocation.
+        They are persisted, so a restart or a replica that missed the
+        revocation event still sees them (within student_ttl_seconds).
+        """
+        return self._cached_epoch(None) + self._cached_epoch(student_id)
+    
+    def _cached_epoch(self, student_id: Optional[int]) -> int:
+        now = time.time()
+        cached = self._epochs.get(student_id)
+        if cached and now - cached[1] < self.student_ttl_seconds:
+            return cached[0]
+        epoch = self.db.get_token_epoch(student_id)
+        self._epochs.set(student_id, (epoch, now))
+        return epoch
+    
+    def revoke_student_tokens(self, student_id: int):
+        """Invalidate every token issued to a student so far (forced logout)"""
+        # Stored, then sent as a write event so other replicas reload it right away
+        self.db.bump_token_epoch(student_id)
+    
+    def revoke_all_tokens(self):
+        """Invalidate every token issued so far (forced logout of everyone)"""
+        self.db.bump_token_epoch()
+    
     def verify_token(self, token: str) -> Optional[Dict]:
         """
         Verify JWT token
@@ -126,21 +241,48 @@ class AuthManager:
         """
         Get student from JWT token
         
+        A verified token is remembered until shortly before it expires and the
+        student row is reused for student_ttl_seconds, so repeated checks of the
+        same token (every Streamlit rerun) cost a couple of dictionary lookups.
+        
         Args:
             token: JWT token string
         
         Returns:
             Student object if valid token, None otherwise
         """
-        payload = self.verify_token(token)
-        if not payload:
+        if not token:
             return None
         
-        student_id = payload.get("student_id")
-        if not student_id:
+        now = time.time()
+        entry = self._verified_tokens.get(token)
+        if entry is None or entry[1] <= now:
+            payload = self.verify_token(token)
+            if not payload:
+                self._verified_tokens.pop(token)
+                return None
+            
+            student_id = payload.get("student_id")
+            if not student_id:
+                return None
+            
+            entry = (student_id, payload["exp"] - self.TOKEN_EXPIRY_MARGIN_SECONDS,
+                     payload.get("epoch", 0))
+            self._verified_tokens.set(token, entry)
+        
+        student_id, _, epoch = entry
+        if epoch != self.get_token_epoch(student_id):
+            self._verified_tokens.pop(token)
             return None
         
-        return self.db.get_student(student_id)
+        cached = self._students.get(student_id)
+        if cached and now - cached[1] < self.student_ttl_seconds:
+            return cached[0]
+        
+        student = self.db.get_student(student_id)
+        if student:
+            self._students.set(student_id, (student, now))
+        return student
     
     def change_password(self, student_id: int, old_password: str, 
                        new_password: str) -> bool:
@@ -160,20 +302,11 @@ class AuthManager:
             return False
         
         # Verify old password
-        if not bcrypt.checkpw(old_password.encode('utf-8'), student.password_hash.encode('utf-8')):
+        if not self.hasher.verify(old_password, student.password_hash):
             return False
         
-        # Hash new password
-        new_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        # Update in database
-        with self.db.get_session() as session:
-            student = session.query(Student).filter(Student.id == student_id).first()
-            if student:
-                student.password_hash = new_hash
-                return True
-        
-        return False
+        # Hash new password and update in database
+        return self._set_password_hash(student_id, self.hasher.hash(new_password))
     
     def reset_password_request(self, email: str) -> Optional[str]:
         """
@@ -219,17 +352,13 @@ class AuthManager:
         if not student_id:
             return False
         
-        # Hash new password
-        new_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Hash new password and update in database
+        updated = self._set_password_hash(student_id, self.hasher.hash(new_password))
         
-        # Update in database
-        with self.db.get_session() as session:
-            student = session.query(Student).filter(Student.id == student_id).first()
-            if student:
-                student.password_hash = new_hash
-                return True
-        
-        return False
+        if updated:
+            # Log out every session that used the old password
+            self.revoke_student_tokens(student_id)
+        return updated
 
 
 # Streamlit-specific authentication helpers
@@ -245,6 +374,50 @@ def init_auth_state():
         st.session_state.auth_token = None
 
 
+@lru_cache(maxsize=1)
+def _trusted_proxies() -> tuple:
+    """Networks of the proxies allowed to set X-Forwarded-For (auth.trusted_proxies)"""
+    networks = []
+    for entry in config.get('auth.trusted_proxies') or []:
+        try:
+            networks.append(ipaddress.ip_network(str(entry), strict=False))
+        except ValueError:
+            logger.warning("Ignoring invalid auth.trusted_proxies entry %r", entry)
+    return tuple(networks)
+
+
+def _is_trusted_proxy(address: Optional[str]) -> bool:
+    """Check whether an address belongs to a configured proxy"""
+    if not address:
+        return False
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_proxies())
+
+
+def _client_ip() -> Optional[str]:
+    """
+    Get the client IP of the current Streamlit request, if available
+    
+    X-Forwarded-For is only believed when the connection comes from a trusted
+    proxy; the client is then the nearest address in it that isn't one.
+    """
+    import streamlit as st
+    
+    context = getattr(st, "context", None)
+    headers = getattr(context, "headers", None) or {}
+    peer = getattr(context, "ip_address", None)
+    forwarded = headers.get("X-Forwarded-For")
+    if not forwarded or not _is_trusted_proxy(peer):
+        return peer
+    for address in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+        if not _is_trusted_proxy(address):
+            return address
+    return peer
+
+
 def render_login_page(auth_manager: AuthManager):
     """Render login page for Streamlit"""
     import streamlit as st
@@ -260,7 +433,12 @@ def render_login_page(auth_manager: AuthManager):
             submit = st.form_submit_button("Login")
             
             if submit:
-                student = auth_manager.authenticate(email, password)
+                try:
+                    student = auth_manager.authenticate(email, password, ip=_client_ip())
+                except (LoginThrottledError, HasherBusyError) as e:
+                    st.error(str(e))
+                    st.stop()
+                
                 if student:
                     token = auth_manager.create_token(student.id)
                     st.session_state.authenticated = True
@@ -288,7 +466,12 @@ def render_login_page(auth_manager: AuthManager):
                 elif len(password) < 6:
                     st.error("Password must be at least 6 characters")
                 else:
-                    student = auth_manager.register_student(name, email, password, grade)
+                    try:
+                        student = auth_manager.register_student(name, email, password, grade)
+                    except HasherBusyError as e:
+                        st.error(str(e))
+                        st.stop()
+                    
                     if student:
                         st.success("Registration successful! Please login.")
                     else:
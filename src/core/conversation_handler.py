@@ -5,105 +5,173 @@ from datetime import datetime
 
 from ..database.db_manager import DatabaseManager
 from ..ai.ai_client import AIClient, PromptBuilder
+from ..utils.math_renderer import katex_metadata
+from ..utils.tracing import current_trace_id, span
 from .session_manager import SessionManager
 from .student_manager import StudentManager
+from .upload_pipeline import UploadPipeline
 
 
 class ConversationHandler:
     """Handles tutoring conversations between student and AI"""
     
-    def __init__(self, db_manager: DatabaseManager, ai_client: AIClient):
+    def __init__(self, db_manager: DatabaseManager, ai_client: AIClient,
+                 session_manager: SessionManager = None,
+                 student_manager: StudentManager = None,
+                 upload_pipeline: UploadPipeline = None):
         """
         Initialize conversation handler
         
         Args:
             db_manager: Database manager instance
             ai_client: AI client instance
+            session_manager: Shared session manager (created if omitted)
+            student_manager: Shared student manager (created if omitted)
+            upload_pipeline: Turns processed chat attachments into AI content blocks
         """
         self.db = db_manager
         self.ai = ai_client
-        self.session_manager = SessionManager(db_manager)
-        self.student_manager = StudentManager(db_manager)
+        self.session_manager = session_manager or SessionManager(db_manager)
+        self.student_manager = student_manager or StudentManager(db_manager)
+        self.upload_pipeline = upload_pipeline
         self.prompt_builder = PromptBuilder()
     
     def handle_message(self, student_id: int, message: str,
-                      session_id: int = None, session_type: str = "general") -> Dict:
+                      session_id: int = None, session_type: str = "general",
+                      attachments: List[Dict] = None) -> Dict:
         """
         Handle a student message and generate AI response
         
+        Each stage runs in its own span under a "chat.turn" trace, so a slow
+        reply can be pinned on the database, prompt building or the AI call.
+        
         Args:
             student_id: Student ID
             message: Student's message
             session_id: Optional existing session ID
             session_type: Type of session if creating new one
+            attachments: Processed uploads (UploadPipeline results) sent to the
+                         model with this message
         
         Returns:
-            Dict with response, session info, and metadata
+            Dict with response, session info, metadata and 'trace_id'
         """
+        with span("chat.turn", root=True, student_id=student_id, session_type=session_type) as turn:
+            response = self._handle_message(student_id, message, session_id, session_type,
+                                            attachments or [])
+            if turn is not None:
+                turn.set_attribute("session_id", response["session_id"])
+                if not response["success"]:
+                    turn.record_error(response["error"])
+            response["trace_id"] = current_trace_id()
+            return response
+    
+    def _handle_message(self, student_id: int, message: str,
+                        session_id: Optional[int], session_type: str,
+                        attachments: List[Dict]) -> Dict:
+        """Run the stages of a chat turn"""
         # Get or create session
-        if session_id:
-            session = self.session_manager.get_session(session_id)
-            if not session or not session.is_active:
-                session = self.session_manager.start_session(student_id, session_type=session_type)
-        else:
-            session = self.session_manager.get_or_create_session(student_id, session_type=session_type)
+        with span("chat.get_or_create_session"):
+            if session_id:
+                session = self.session_manager.get_session(session_id)
+                if not session or not session.is_active:
+                    session = self.session_manager.start_session(student_id, session_type=session_type)
+            else:
+                session = self.session_manager.get_or_create_session(student_id, session_type=session_type)
+        
+        # Attached files go to the model as content blocks with this message only
+        user_content = message
+        message_metadata = None
+        if attachments and self.upload_pipeline is not None:
+            with span("chat.attachments", files=len(attachments)):
+                blocks = self.upload_pipeline.content_blocks(attachments)
+                if blocks:
+                    user_content = blocks + [{"type": "text", "text": message}]
+                message_metadata = {"attachments": [
+                    {key: item.get(key) for key in ("name", "sha256", "kind", "error")}
+                    for item in attachments
+                ]}
         
         # Save student message
-        student_msg = self.session_manager.add_message(
-            session_id=session.id,
-            role="student",
-            content=message
-        )
+        with span("chat.add_student_message"):
+            student_msg = self.session_manager.add_message(
+                session_id=session.id,
+                role="student",
+                content=message,
+                message_metadata=message_metadata
+            )
         
         # Get student info for context
-        student = self.student_manager.get_student(student_id)
+        with span("chat.get_student"):
+            student = self.student_manager.get_student(student_id)
         
         # Build system prompt with student context
-        system_prompt = self.prompt_builder.build_system_prompt(
-            student_name=student.name,
-            grade_level=student.grade_level
-        )
+        with span("chat.build_system_prompt"):
+            system_prompt = self.prompt_builder.build_system_prompt(
+                student_name=student.name,
+                grade_level=student.grade_level
+            )
         
         # Get conversation history
-        conversation_history = self.session_manager.get_conversation_history(
-            session_id=session.id,
-            limit=40  # Keep reasonable context window
-        )
+        with span("chat.get_conversation_history") as history_span:
+            conversation_history = self.session_manager.get_conversation_history(
+                session_id=session.id,
+                limit=40  # Keep reasonable context window
+            )
+            if history_span is not None:
+                history_span.set_attribute("messages", len(conversation_history))
         
         # Truncate if needed to fit token limits
-        conversation_history = self.ai.truncate_conversation_history(
-            conversation_history,
-            max_tokens=6000
-        )
+        with span("chat.truncate_history") as truncate_span:
+            conversation_history = self.ai.truncate_conversation_history(
+                conversation_history,
+                max_tokens=6000
+            )
+            if truncate_span is not None:
+                truncate_span.set_attribute("messages", len(conversation_history))
         
         try:
             # Generate AI response
-            ai_response = self.ai.generate_with_context(
-                system=system_prompt,
-                user_message=message,
-                conversation_history=conversation_history[:-1]  # Exclude the message we just added
-            )
+            with span("chat.generate_response"):
+                ai_response = self.ai.generate_with_context(
+                    system=system_prompt,
+                    user_message=user_content,
+                    conversation_history=conversation_history[:-1],  # Exclude the message we just added
+                    task="chat",
+                    student_id=student_id,
+                    session_id=session.id
+                )
             
             response_content = ai_response["content"]
             tokens_used = ai_response["usage"]["input_tokens"] + ai_response["usage"]["output_tokens"]
             
+            # Normalize the reply for KaTeX once, stored with the message
+            with span("chat.normalize_math"):
+                message_metadata = {"katex": katex_metadata(response_content)}
+            
             # Save AI response
-            tutor_msg = self.session_manager.add_message(
-                session_id=session.id,
-                role="tutor",
-                content=response_content,
-                tokens_used=tokens_used
-            )
+            with span("chat.add_tutor_message"):
+                tutor_msg = self.session_manager.add_message(
+                    session_id=session.id,
+                    role="tutor",
+                    content=response_content,
+                    message_metadata=message_metadata,
+                    tokens_used=tokens_used
+                )
             
             # Update student last active
-            self.student_manager.update_last_active(student_id)
+            with span("chat.update_last_active"):
+                self.student_manager.update_last_active(student_id)
             
             return {
                 "success": True,
                 "response": response_content,
                 "session_id": session.id,
                 "message_id": tutor_msg.id,
+                "message_metadata": message_metadata,
+                "student_message_id": student_msg.id,
                 "tokens_used": tokens_used,
+                "budget_warning": bool(ai_response.get("budget") and ai_response["budget"]["warning"]),
                 "timestamp": datetime.utcnow()
             }
         
@@ -0,0 +1,153 @@
+"""Progress dashboard - precomputed, cached view models for the Progress page"""
+
+import threading
+from typing import Dict
+
+from ..database.db_manager import DatabaseManager
+from ..utils.cache import LRUCache
+
+# pandas and plotly are imported inside the methods that need them, so importing
+# this module (app.py does) stays cheap
+
+
+class ProgressDashboard:
+    """Builds the Progress page's data frame and figures once per progress version
+
+    Each student has a progress version that is bumped whenever DatabaseManager
+    reports a progress write. View models are cached under
+    (student_id, version), so a page load only rebuilds them after new progress
+    was recorded.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_students: int = 256):
+        """
+        Initialize progress dashboard and subscribe to database write events
+
+        Args:
+            db_manager: Database manager instance
+            max_students: Maximum number of view models kept
+        """
+        self.db = db_manager
+        self.cache = LRUCache(max_size=max_students, name="progress_dashboard")
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        db_manager.add_listener(self.handle_event)
+
+    def get_version(self, student_id: int) -> int:
+        """Get a student's current progress version"""
+        with self._lock:
+            return self._versions.get(student_id, 0)
+
+    def handle_event(self, event: str, student_id: int = None, **data):
+        """
+        Bump the progress version when a student's progress changes
+
+        Args:
+            event: Write event name from DatabaseManager
+            student_id: Student the write belongs to
+        """
+        if event != "progress_updated" or student_id is None:
+            return
+
+        with self._lock:
+            version = self._versions.get(student_id, 0)
+            self._versions[student_id] = version + 1
+        self.cache.pop((student_id, version))
+
+    def get_view_model(self, student_id: int) -> Dict:
+        """
+        Get the Progress page view model (cached per progress version)
+
+        Args:
+            student_id: Student ID
+
+        Returns:
+            Dict with 'progress' records, sorted 'frame', 'avg_accuracy',
+            serialized 'accuracy_figure'/'skill_figure' and the recommendation
+            lists 'weak_topics', 'almost_there' and 'mastered'
+        """
+        key = (student_id, self.get_version(student_id))
+        return self.cache.get_or_compute(key, lambda: self._build(student_id))
+
+    @staticmethod
+    def figure(serialized: str):
+        """Rebuild a Plotly figure from its cached JSON"""
+        import plotly.io as pio
+        return pio.from_json(serialized)
+
+    def _build(self, student_id: int) -> Dict:
+        """Load progress and prepare everything the page displays"""
+        progress_records = self.db.get_student_progress(student_id)
+
+        view = {
+            "progress": progress_records,
+            "frame": None,
+            "avg_accuracy": None,
+            "accuracy_figure": None,
+            "skill_figure": None,
+            "weak_topics": [],
+            "almost_there": [],
+            "mastered": []
+        }
+        if not progress_records:
+            return view
+
+        import pandas as pd
+        import plotly.express as px
+        import plotly.graph_objects as go
+
+        view["avg_accuracy"] = sum(p.accuracy for p in progress_records) / len(progress_records)
+
+        # Create dataframe for visualization, sorted by accuracy
+        df = pd.DataFrame([
+            {
+                "Topic": prog.topic,
+                "Subtopic": prog.subtopic or "",
+                "Accuracy": prog.accuracy * 100,
+                "Attempts": prog.attempts,
+                "Skill Level": prog.skill_level,
+                "Last Practiced": prog.last_practiced
+            }
+            for prog in progress_records
+        ])
+        view["frame"] = df.sort_values("Accuracy", ascending=True)
+
+        # Horizontal accuracy bar chart
+        fig = px.bar(
+            view["frame"],
+            y="Topic",
+            x="Accuracy",
+            orientation='h',
+            color="Accuracy",
+            color_continuous_scale=["#ff4444", "#ffaa00", "#44ff44"],
+            range_color=[0, 100],
+            title="Accuracy by Topic",
+            labels={"Accuracy": "Accuracy (%)"}
+        )
+        fig.update_layout(height=400, showlegend=False, xaxis_range=[0, 100])
+        view["accuracy_figure"] = fig.to_json()
+
+        # Skill level pie chart
+        skill_counts = {}
+        for prog in progress_records:
+            skill_counts[prog.skill_level] = skill_counts.get(prog.skill_level, 0) + 1
+
+        fig = go.Figure(data=[go.Pie(
+            labels=list(skill_counts.keys()),
+            values=list(skill_counts.values()),
+            hole=.3,
+            marker=dict(colors=['#ff6b6b', '#ffd93d', '#6bcf7f', '#4ecdc4'])
+        )])
+        fig.update_layout(
+            title="Topics by Skill Level",
+            height=300,
+            showlegend=True,
+            legend=dict(orientation="v")
+        )
+        view["skill_figure"] = fig.to_json()
+
+        # Recommendations: weakest topics, topics close to mastery, mastered topics
+        view["weak_topics"] = sorted(progress_records, key=lambda x: x.accuracy)[:3]
+        view["almost_there"] = [p for p in progress_records if 0.70 <= p.accuracy < 0.85][:3]
+        view["mastered"] = [p for p in progress_records if p.accuracy >= 0.85][:3]
+        return view
@@ -0,0 +1,76 @@
+"""Invalidation bus - relays database write events between app replicas"""
+
+import logging
+import threading
+import uuid
+from typing import Dict
+
+from ..database.db_manager import DatabaseManager
+from ..utils.shared_cache import SharedCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Publishes local write events and replays other replicas' events locally
+
+    Every in-process cache that listens to DatabaseManager write events (view
+    cache, progress dashboard, auth) stays coherent across replicas without
+    knowing about them. Replayed events carry _remote=True so they are not
+    published again.
+    """
+
+    CHANNEL = "invalidation"
+
+    def __init__(self, db_manager: DatabaseManager, shared_cache: SharedCache,
+                 replica_id: str = None):
+        """
+        Initialize invalidation bus and start relaying events
+
+        Args:
+            db_manager: Database manager whose write events are relayed
+            shared_cache: Shared cache providing pub/sub
+            replica_id: Unique name of this replica (random if omitted)
+        """
+        self.db = db_manager
+        self.shared_cache = shared_cache
+        self.replica_id = replica_id or uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "received": 0, "failed": 0}
+
+        db_manager.add_listener(self._publish)
+        shared_cache.subscribe(self.CHANNEL, self._receive)
+
+    def _publish(self, event: str, _remote: bool = False, **data):
+        """Send a local write event to the other replicas"""
+        if _remote:
+            return
+        try:
+            self.shared_cache.publish(self.CHANNEL, {
+                "origin": self.replica_id,
+                "event": event,
+                "data": data
+            })
+            stat = "published"
+        except Exception:
+            # Other replicas serve stale cache entries until their next write event
+            logger.warning("Failed to publish %s to the invalidation bus", event, exc_info=True)
+            stat = "failed"
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _receive(self, message: Dict):
+        """Replay another replica's write event to local listeners"""
+        if message.get("origin") == self.replica_id:
+            return
+        with self._lock:
+            self._stats["received"] += 1
+        self.db.notify(message["event"], _remote=True, **message.get("data", {}))
+
+    def get_stats(self) -> Dict:
+        """Get counts of published, received and failed events"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["replica_id"] = self.replica_id
+        return stats
@@ -0,0 +1,306 @@
+"""Password hashing - bcrypt work on a bounded worker pool, plus login throttling"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Deque, Dict, Optional
+
+import bcrypt
+
+from ..utils.shared_cache import SharedCache
+
+
+# Cost factor embedded in a bcrypt hash: $2b$<rounds>$<salt+hash>
+BCRYPT_ROUNDS_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class HasherBusyError(Exception):
+    """Raised when too many hash operations are already waiting for a worker"""
+
+
+class LoginThrottledError(Exception):
+    """Raised when an email or IP address has too many recent failed logins"""
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    """Worker job - hash a password (module level so process pools can pickle it)"""
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    """Worker job - verify a password against a hash"""
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated, bounded pool
+
+    bcrypt releases the GIL, so a thread pool uses every core; a process pool
+    can be chosen instead. At most max_pending operations may be queued or
+    running - beyond that calls fail fast with HasherBusyError instead of
+    piling up behind a login burst.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = None,
+                 max_pending: int = 64, use_processes: bool = False):
+        """
+        Initialize password hasher
+
+        Args:
+            rounds: bcrypt cost factor for new hashes
+            max_workers: Worker count (defaults to the number of CPUs)
+            max_pending: Maximum operations queued or running at once
+            use_processes: Use a process pool instead of threads
+        """
+        self.rounds = rounds
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        kwargs = {} if use_processes else {"thread_name_prefix": "bcrypt"}
+        self._executor: Executor = executor_class(max_workers=self.max_workers, **kwargs)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"hashed": 0, "verified": 0, "rejected_busy": 0}
+
+    def _run(self, stat: str, fn, *args):
+        """Run a job on the pool and wait for it, enforcing the queue limit"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected_busy"] += 1
+                raise HasherBusyError("Too many login requests right now. Please try again in a moment.")
+            self._pending += 1
+
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats[stat] += 1
+
+    def hash(self, password: str) -> str:
+        """
+        Hash a password at the configured cost
+
+        Raises:
+            HasherBusyError: If the pool's queue is full
+        """
+        return self._run("hashed", _hashpw, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """
+        Check a password against a stored hash
+
+        Raises:
+            HasherBusyError: If the pool's queue is full
+        """
+        return self._run("verified", _checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Check whether a stored hash was made at a different cost factor"""
+        match = BCRYPT_ROUNDS_PATTERN.match(hashed or "")
+        return not match or int(match.group(1)) != self.rounds
+
+    @property
+    def pending(self) -> int:
+        """Operations currently queued or running"""
+        with self._lock:
+            return self._pending
+
+    def get_stats(self) -> Dict:
+        """Get hash/verify counts, busy rejections and current queue depth"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+        stats["rounds"] = self.rounds
+        stats["workers"] = self.max_workers
+        return stats
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=True)
+
+
+class LoginThrottle:
+    """Limits failed login attempts per email and per client IP
+
+    Failures are kept in a sliding window; once a key reaches max_attempts it
+    is locked out until its oldest failure leaves the window. Keys are kept in
+    order of their latest failure, so expired ones are pruned from the front and
+    at most max_keys are tracked (the least recently failing go first). With a shared
+    cache the failures are counted there for every replica instead, in
+    window-long buckets with the previous bucket weighted by how much of it
+    still overlaps the window.
+    """
+
+    def __init__(self, max_attempts: int = 5, window_seconds: int = 300,
+                 max_attempts_per_ip: int = 20, shared_cache: SharedCache = None,
+                 max_keys: int = 100_000):
+        """
+        Initialize login throttle
+
+        Args:
+            max_attempts: Failed attempts allowed per email within the window
+            window_seconds: Sliding window length in seconds
+            max_attempts_per_ip: Failed attempts allowed per IP within the window
+            shared_cache: Cache counting failures for every replica (None counts
+                          them in this process only)
+            max_keys: Emails and IPs tracked in this process at most
+        """
+        self.max_attempts = max_attempts
+        self.max_attempts_per_ip = max_attempts_per_ip
+        self.window_seconds = window_seconds
+        self.shared_cache = shared_cache
+        self.max_keys = max_keys
+        # key -> failure times (only the last max_attempts matter), latest failing last
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> Deque[float]:
+        """Get a key's failures inside the window, dropping older ones (lock held)"""
+        failures = self._failures.get(key)
+        if failures is None:
+            return deque()
+        while failures and now - failures[0] > self.window_seconds:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+        return failures
+
+    def check(self, email: str, ip: str = None):
+        """
+        Refuse the attempt if the email or IP is locked out
+
+        Raises:
+            LoginThrottledError: If there were too many recent failures
+        """
+        now = time.monotonic()
+        limits = [(f"email:{email.lower()}", self.max_attempts)]
+        if ip:
+            limits.append((f"ip:{ip}", self.max_attempts_per_ip))
+
+        if self.shared_cache is not None:
+            for key, limit in limits:
+                self._check_shared(key, limit)
+            return
+
+        with self._lock:
+            for key, limit in limits:
+                failures = self._recent(key, now)
+                if len(failures) >= limit:
+                    retry_after = int(self.window_seconds - (now - failures[0])) + 1
+                    raise LoginThrottledError(
+                        f"Too many failed login attempts. Please try again in {retry_after} seconds."
+                    )
+
+    def _bucket_keys(self, key: str):
+        """Shared counter keys of the current and previous buckets, and the current bucket's progress"""
+        position = time.time() / self.window_seconds
+        bucket = int(position)
+        return f"login:{key}:{bucket}", f"login:{key}:{bucket - 1}", position - bucket
+
+    def _check_shared(self, key: str, limit: int):
+        """Refuse the attempt if the shared failure count for a key is at the limit"""
+        current_key, previous_key, progress = self._bucket_keys(key)
+        current = self.shared_cache.get(current_key) or 0
+        previous = self.shared_cache.get(previous_key) or 0
+        if current + previous * (1 - progress) >= limit:
+            retry_after = int(self.window_seconds * (1 - progress)) + 1
+            raise LoginThrottledError(
+                f"Too many failed login attempts. Please try again in {retry_after} seconds."
+            )
+
+    def record_failure(self, email: str, ip: str = None):
+        """Count a failed login for the email and IP"""
+        now = time.monotonic()
+        keys = [f"email:{email.lower()}"] + ([f"ip:{ip}"] if ip else [])
+        if self.shared_cache is not None:
+            for key in keys:
+                self.shared_cache.incr(self._bucket_keys(key)[0], 1, 2 * self.window_seconds)
+            return
+
+        with self._lock:
+            for key in keys:
+                failures = self._failures.pop(key, None)
+                if failures is None:
+                    limit = self.max_attempts if key.startswith("email:") else self.max_attempts_per_ip
+                    failures = deque(maxlen=max(limit, 1))
+                failures.append(now)
+                self._failures[key] = failures
+            self._prune(now)
+
+    def _prune(self, now: float):
+        """Drop keys whose latest failure left the window, then any over max_keys (lock held)"""
+        while self._failures:
+            key, failures = next(iter(self._failures.items()))
+            if now - failures[-1] <= self.window_seconds and len(self._failures) <= self.max_keys:
+                break
+            del self._failures[key]
+
+    def record_success(self, email: str):
+        """Clear an email's failures after a successful login"""
+        if self.shared_cache is not None:
+            current_key, previous_key, _ = self._bucket_keys(f"email:{email.lower()}")
+            self.shared_cache.delete(current_key)
+            self.shared_cache.delete(previous_key)
+            return
+
+        with self._lock:
+            self._failures.pop(f"email:{email.lower()}", None)
+
+
+# ==================== Benchmark ====================
+
+def run_benchmark(rounds: int = 10, logins: int = 32, worker_counts=(1, 2, 4),
+                  use_processes: bool = False) -> Dict[int, float]:
+    """
+    Measure login verifications per second at several pool sizes
+
+    Args:
+        rounds: bcrypt cost factor
+        logins: Concurrent logins per measurement
+        worker_counts: Pool sizes to measure
+        use_processes: Use process pools instead of threads
+
+    Returns:
+        Dict of worker count -> logins per second
+    """
+    hashed = bcrypt.hashpw(b"correct horse battery staple", bcrypt.gensalt(rounds)).decode('utf-8')
+    results = {}
+
+    for workers in worker_counts:
+        hasher = PasswordHasher(rounds=rounds, max_workers=workers,
+                                max_pending=logins, use_processes=use_processes)
+        hasher.verify("warm-up", hashed)
+
+        # Simulate a burst: every login arrives on its own request thread
+        with ThreadPoolExecutor(max_workers=logins) as requests:
+            start = time.perf_counter()
+            list(requests.map(lambda _: hasher.verify("correct horse battery staple", hashed),
+                              range(logins)))
+            elapsed = time.perf_counter() - start
+
+        hasher.shutdown()
+        results[workers] = logins / elapsed
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark bcrypt logins per second by pool size")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--logins", type=int, default=32, help="Concurrent logins per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Pool sizes")
+    parser.add_argument("--processes", action="store_true", help="Use process pools")
+
+    args = parser.parse_args()
+
+    print(f"bcrypt cost {args.rounds}, {args.logins} concurrent logins, {os.cpu_count()} CPUs")
+    for workers, rate in run_benchmark(args.rounds, args.logins, args.workers, args.processes).items():
+        print(f"  {workers:3d} workers: {rate:7.1f} logins/s")
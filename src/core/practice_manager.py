@@ -0,0 +1,502 @@
+"""Practice management module - answer checking and batch grading"""
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from typing import Dict, List, Optional
+
+from ..database.db_manager import DatabaseManager
+from ..ai.ai_client import AIClient, PromptBuilder
+from ..utils.tracing import bind_context, span
+from .practice_recorder import PracticeRecorder
+
+
+# Markers the tutor uses in front of the final answer of a worked solution; the
+# answer must follow on the same line ("Solution:" over the working is no answer)
+ANSWER_MARKERS = re.compile(
+    r'(?:final[ \t]+answer|answer|solution)[ \t]*[:=][ \t]*\**[ \t]*([^\n]+)',
+    re.IGNORECASE
+)
+
+# A number written with thousands separators: 1,000 or -12,345.5
+THOUSANDS_RE = re.compile(r'(?<![\d,])\d{1,3}(?:,\d{3})+(?![\d,])')
+
+NEGATIVE_FEEDBACK = ["incorrect", "not correct", "not quite", "not right", "isn't right", "not exactly"]
+POSITIVE_FEEDBACK = ["correct", "right", "exactly", "perfect", "yes"]
+
+
+class PracticeManager:
+    """Checks practice answers and records the results"""
+
+    def __init__(self, db_manager: DatabaseManager, ai_client: AIClient,
+                 max_workers: int = 4, recorder: PracticeRecorder = None):
+        """
+        Initialize practice manager
+
+        Args:
+            db_manager: Database manager instance
+            ai_client: AI client instance
+            max_workers: Maximum concurrent AI answer checks in a batch
+            recorder: Background recorder; results are saved inline when omitted
+        """
+        self.db = db_manager
+        self.ai = ai_client
+        self.max_workers = max_workers
+        self.recorder = recorder
+        self.prompt_builder = PromptBuilder()
+
+    # ==================== Generation ====================
+
+    def generate_practice_set(self, student_id: int, student_name: str, grade_level: int,
+                              topic: str, difficulty: str = "medium", count: int = 5) -> str:
+        """
+        Generate a practice set with the AI tutor
+
+        Args:
+            student_id: Student ID
+            student_name: Student's name
+            grade_level: Student's grade level
+            topic: Practice topic
+            difficulty: Difficulty level
+            count: Number of problems
+
+        Returns:
+            Practice set content (problems followed by a Solutions section)
+        """
+        with span("practice.generate", root=True, student_id=student_id, topic=topic,
+                  difficulty=difficulty, count=count):
+            with span("practice.build_prompt"):
+                system_prompt = self._system_prompt(student_name, grade_level)
+                practice_prompt = self.prompt_builder.format_practice_request_prompt(
+                    topic=topic,
+                    difficulty=difficulty,
+                    count=count
+                )
+
+            # Practice generation route has a higher token limit for multiple problems
+            response = self.ai.create_message(
+                system=system_prompt,
+                messages=[{"role": "user", "content": practice_prompt}],
+                task="practice_generation",
+                student_id=student_id
+            )
+            return response["content"]
+
+    # ==================== Local Checking ====================
+
+    @staticmethod
+    def extract_final_answer(solution: str) -> Optional[str]:
+        """
+        Pull the final answer out of a worked solution
+
+        Args:
+            solution: Solution text from the practice set
+
+        Returns:
+            Final answer string, or None if no explicit answer is marked
+        """
+        if not solution:
+            return None
+
+        matches = ANSWER_MARKERS.findall(solution)
+        if not matches:
+            return None
+
+        # The last marked answer is the final one
+        answer = matches[-1].strip().rstrip('.').strip('*').strip()
+        return answer or None
+
+    @staticmethod
+    def normalize_answer(answer: str) -> str:
+        """
+        Normalize an answer for comparison
+
+        Strips math delimiters, whitespace, a leading "x =" and LaTeX spacing
+        so that "$x = 5$" and "5" compare equal.
+
+        Args:
+            answer: Raw answer text
+
+        Returns:
+            Normalized answer
+        """
+        text = answer.strip().lower()
+        text = re.sub(r'\\[,;!]|\\quad|\$', '', text)
+        text = re.sub(r'\\(?:text|mathrm)\{([^}]*)\}', r'\1', text)
+        text = re.sub(r'\\[dt]?frac\{([^}]*)\}\{([^}]*)\}', r'(\1)/(\2)', text)
+        text = re.sub(r'^[a-z]\s*=\s*', '', text)
+        text = re.sub(r'\s+', '', text)
+        return text.rstrip('.')
+
+    @staticmethod
+    def _parse_number(text: str) -> Optional[Fraction]:
+        """Parse a plain number or simple fraction, None if not numeric"""
+        text = THOUSANDS_RE.sub(lambda match: match.group().replace(',', ''), text)
+        if ',' in text:
+            # "3,5" is a list or a decimal comma - leave it to the tutor
+            return None
+        match = re.fullmatch(r'\(?(-?\d+(?:\.\d+)?)\)?(?:/\(?(-?\d+(?:\.\d+)?)\)?)?', text)
+        if not match:
+            return None
+        try:
+            value = Fraction(match.group(1))
+            if match.group(2):
+                value = value / Fraction(match.group(2))
+            return value
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    def check_locally(self, answer: str, solution: str) -> Optional[bool]:
+        """
+        Grade an answer without calling the AI
+
+        Args:
+            answer: Student's answer
+            solution: Solution text containing the final answer
+
+        Returns:
+            True or False when the answer can be checked locally, None otherwise
+        """
+        expected = self.extract_final_answer(solution)
+        if not expected or not answer:
+            return None
+
+        student_norm = self.normalize_answer(answer)
+        expected_norm = self.normalize_answer(expected)
+
+        if student_norm == expected_norm:
+            return True
+
+        # Numeric answers can be compared exactly, anything else needs the tutor
+        student_value = self._parse_number(student_norm)
+        expected_value = self._parse_number(expected_norm)
+        if student_value is not None and expected_value is not None:
+            return student_value == expected_value
+
+        return None
+
+    # ==================== AI Checking ====================
+
+    @staticmethod
+    def feedback_is_correct(feedback: str) -> bool:
+        """
+        Decide whether tutor feedback confirms the answer (simple heuristic)
+
+        Args:
+            feedback: Tutor feedback text
+
+        Returns:
+            True if the feedback opens by confirming the answer
+        """
+        opening = feedback.lower()[:200]
+        if any(phrase in opening for phrase in NEGATIVE_FEEDBACK):
+            return False
+        return any(word in opening for word in POSITIVE_FEEDBACK)
+
+    @staticmethod
+    def build_check_prompt(problem_text: str, answer: str, work: str = None,
+                           solution: str = "") -> str:
+        """
+        Build the prompt asking the tutor to check one answer
+
+        Args:
+            problem_text: Problem text
+            answer: Student's answer
+            work: Student's work (optional)
+            solution: Correct solution for comparison
+
+        Returns:
+            Formatted prompt
+        """
+        return f"""I'm working on this problem:
+{problem_text}
+
+My answer: {answer}
+
+{f"My work: {work}" if work else ""}
+
+Can you check if my answer is correct? If it's right, confirm it briefly. If it's wrong, help me understand what I did wrong and guide me toward the correct answer. Don't just give me the answer - help me learn.
+
+The correct solution is: {solution}"""
+
+    def _system_prompt(self, student_name: str, grade_level: int) -> str:
+        """Build the tutor system prompt for a student"""
+        return self.prompt_builder.build_system_prompt(
+            student_name=student_name,
+            grade_level=grade_level
+        )
+
+    def check_answer(self, student_name: str, grade_level: int, problem_text: str,
+                     answer: str, work: str = None, solution: str = "",
+                     system_prompt: str = None, student_id: int = None) -> Dict:
+        """
+        Check a single answer with the AI tutor
+
+        Args:
+            student_name: Student's name
+            grade_level: Student's grade level
+            problem_text: Problem text
+            answer: Student's answer
+            work: Student's work (optional)
+            solution: Correct solution for comparison
+            system_prompt: Prebuilt system prompt (built if omitted)
+            student_id: Student ID (for usage accounting)
+
+        Returns:
+            Dict with 'is_correct', 'feedback' and 'graded_by'
+        """
+        with span("practice.check_answer", root=True, student_id=student_id):
+            if system_prompt is None:
+                system_prompt = self._system_prompt(student_name, grade_level)
+
+            check_prompt = self.build_check_prompt(problem_text, answer, work, solution)
+
+            response = self.ai.create_message(
+                system=system_prompt,
+                messages=[{"role": "user", "content": check_prompt}],
+                task="answer_check",
+                student_id=student_id
+            )
+
+            feedback = response["content"]
+            return {
+                "is_correct": self.feedback_is_correct(feedback) if feedback else False,
+                "feedback": feedback,
+                "graded_by": "ai"
+            }
+
+    def _check_combined(self, system_prompt: str, submissions: List[Dict],
+                        student_id: int = None) -> Dict[str, Dict]:
+        """
+        Check several answers with one AI request
+
+        Args:
+            system_prompt: Tutor system prompt
+            submissions: Submissions to check
+            student_id: Student ID (for usage accounting)
+
+        Returns:
+            Dict mapping submission key to result dict
+        """
+        parts = []
+        for sub in submissions:
+            parts.append(
+                f"Problem {sub['number']}:\n{sub['problem_text']}\n"
+                f"My answer: {sub['answer']}\n"
+                + (f"My work: {sub['work']}\n" if sub.get('work') else "")
+                + f"Correct solution: {sub.get('solution', '')}\n"
+            )
+
+        prompt = (
+            "Please check my answers to these practice problems.\n\n"
+            + "\n".join(parts)
+            + "\nReply with only a JSON array, one object per problem, like "
+            '[{"problem": "1", "correct": true, "feedback": "..."}]. '
+            "If an answer is right, confirm it briefly. If it's wrong, guide me toward "
+            "the correct answer without just giving it to me."
+        )
+
+        response = self.ai.create_message(
+            system=system_prompt,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=min(4000, 400 * len(submissions)),
+            task="answer_check",
+            student_id=student_id
+        )
+
+        content = response["content"]
+        match = re.search(r'\[.*\]', content, re.DOTALL)
+        if not match:
+            raise ValueError("Combined check did not return a JSON array")
+
+        by_number = {}
+        for item in json.loads(match.group(0)):
+            by_number[str(item.get("problem"))] = item
+
+        results = {}
+        for sub in submissions:
+            item = by_number.get(str(sub["number"]))
+            if item is None:
+                raise ValueError(f"Combined check is missing problem {sub['number']}")
+            results[sub["key"]] = {
+                "is_correct": bool(item.get("correct")),
+                "feedback": item.get("feedback", ""),
+                "graded_by": "ai"
+            }
+        return results
+
+    # ==================== Batch Grading ====================
+
+    def grade_batch(self, student_id: int, student_name: str, grade_level: int,
+                    topic: str, difficulty: str, submissions: List[Dict],
+                    combined: bool = False, persist: bool = True,
+                    set_key: str = None) -> List[Dict]:
+        """
+        Grade every submitted answer of a practice set at once
+
+        Locally checkable answers are graded instantly. The rest are checked by the
+        AI tutor, either concurrently or as one combined request. All results are
+        then saved in a single transaction.
+
+        Args:
+            student_id: Student ID
+            student_name: Student's name
+            grade_level: Student's grade level
+            topic: Practice topic
+            difficulty: Practice difficulty
+            submissions: List of dicts with 'key', 'number', 'problem_text',
+                         'answer', and optionally 'work', 'solution', 'problem_id'
+            combined: Check the remaining answers with one AI request
+            persist: Save results to PracticeProblem and Progress
+            set_key: Key of the practice set (needed to link queued attempts)
+
+        Returns:
+            List of result dicts (submission order) with 'key', 'number',
+            'is_correct', 'feedback', 'graded_by' and 'problem_id'
+        """
+        with span("practice.grade", root=True, student_id=student_id, topic=topic,
+                  submissions=len(submissions), combined=combined):
+            return self._grade_batch(student_id, student_name, grade_level, topic, difficulty,
+                                     submissions, combined, persist, set_key)
+
+    def _grade_batch(self, student_id: int, student_name: str, grade_level: int,
+                     topic: str, difficulty: str, submissions: List[Dict],
+                     combined: bool, persist: bool, set_key: Optional[str]) -> List[Dict]:
+        """Local checks, AI checks for the rest, then one save"""
+        results = {}
+        remaining = []
+
+        with span("practice.check_locally") as local_span:
+            for sub in submissions:
+                if not sub.get("answer"):
+                    continue
+
+                local = self.check_locally(sub["answer"], sub.get("solution", ""))
+                if local is None:
+                    remaining.append(sub)
+                elif local:
+                    results[sub["key"]] = {
+                        "is_correct": True,
+                        "feedback": "Correct! Nice work.",
+                        "graded_by": "local"
+                    }
+                else:
+                    results[sub["key"]] = {
+                        "is_correct": False,
+                        "feedback": "Not quite. Check your steps and try again, or ask the tutor for a hint.",
+                        "graded_by": "local"
+                    }
+            if local_span is not None:
+                local_span.set_attribute("graded", len(results))
+
+        if remaining:
+            system_prompt = self._system_prompt(student_name, grade_level)
+
+            if combined and len(remaining) > 1:
+                try:
+                    with span("practice.check_combined", answers=len(remaining)):
+                        results.update(self._check_combined(system_prompt, remaining, student_id))
+                    remaining = []
+                except Exception:
+                    # Fall back to individual checks
+                    pass
+
+            if remaining:
+                with span("practice.check_concurrently", answers=len(remaining)):
+                    results.update(self._check_concurrently(
+                        student_id, student_name, grade_level, system_prompt, remaining
+                    ))
+
+        ordered = []
+        for sub in submissions:
+            if sub["key"] not in results:
+                continue
+            result = dict(results[sub["key"]])
+            result["key"] = sub["key"]
+            result["number"] = sub["number"]
+            result["problem_id"] = sub.get("problem_id")
+            ordered.append(result)
+
+        if persist:
+            with span("practice.save_results", queued=bool(self.recorder and set_key)):
+                self.save_results(student_id, topic, difficulty, submissions, ordered,
+                                  set_key=set_key)
+
+        return ordered
+
+    def _check_concurrently(self, student_id: int, student_name: str, grade_level: int,
+                            system_prompt: str, submissions: List[Dict]) -> Dict[str, Dict]:
+        """Check submissions with parallel AI requests"""
+        def check(sub):
+            try:
+                return self.check_answer(
+                    student_name, grade_level, sub["problem_text"], sub["answer"],
+                    work=sub.get("work"), solution=sub.get("solution", ""),
+                    system_prompt=system_prompt, student_id=student_id
+                )
+            except Exception as e:
+                return {
+                    "is_correct": None,
+                    "feedback": f"Error checking answer: {str(e)}",
+                    "graded_by": "error"
+                }
+
+        workers = max(1, min(self.max_workers, len(submissions)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Each check's spans stay under the grading trace
+            checked = list(executor.map(bind_context(check), submissions))
+
+        return {sub["key"]: result for sub, result in zip(submissions, checked)}
+
+    def save_results(self, student_id: int, topic: str, difficulty: str,
+                     submissions: List[Dict], results: List[Dict],
+                     set_key: str = None) -> List[int]:
+        """
+        Save graded results in one transaction
+
+        With a recorder and a set key the write is queued and happens off the
+        calling thread; otherwise it is done inline.
+
+        Args:
+            student_id: Student ID
+            topic: Practice topic
+            difficulty: Practice difficulty
+            submissions: Submissions that were graded
+            results: Grading results from grade_batch
+            set_key: Key of the practice set
+
+        Returns:
+            List of practice problem IDs (results order), empty when queued
+        """
+        by_key = {sub["key"]: sub for sub in submissions}
+        attempts = []
+        for result in results:
+            if result["is_correct"] is None:
+                continue
+            sub = by_key[result["key"]]
+            attempts.append({
+                "number": sub["number"],
+                "problem_id": sub.get("problem_id"),
+                "problem_text": sub["problem_text"],
+                "correct_answer": self.extract_final_answer(sub.get("solution", "")) or "",
+                "solution_explanation": sub.get("solution"),
+                "student_answer": sub["answer"],
+                "is_correct": result["is_correct"],
+                "feedback": result["feedback"]
+            })
+
+        if not attempts:
+            return []
+
+        if self.recorder and set_key:
+            self.recorder.record_attempts(student_id, topic, difficulty, set_key, attempts)
+            return []
+
+        problem_ids = self.db.record_practice_results(student_id, topic, difficulty, attempts)
+
+        ids = iter(problem_ids)
+        for result in results:
+            if result["is_correct"] is not None:
+                result["problem_id"] = next(ids)
+        return problem_ids
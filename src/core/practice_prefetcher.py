@@ -0,0 +1,282 @@
+"""Practice prefetcher - generates the likely next practice set in the background"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from ..database.models import Progress
+from .practice_manager import PracticeManager
+
+
+logger = logging.getLogger(__name__)
+
+
+class PracticePrefetcher:
+    """Speculatively generates a student's next practice set
+
+    A few prefetched sets are kept per student for a short TTL, one per distinct
+    request, so the Progress and Practice pages don't replace each other's set.
+    Asking for a set that matches one of them is a hit and returns it
+    immediately (or waits briefly for the generation already in flight);
+    anything else is a miss. Unused sets expire.
+
+    A replaced or expired set is cancelled before its AI call when it hasn't
+    started yet. A call already in flight can't be interrupted, so its result
+    is dropped and counted as wasted rather than prefetched.
+    """
+
+    def __init__(self, practice_manager: PracticeManager, ttl_seconds: int = 600,
+                 max_workers: int = 2, mastery_threshold: float = 0.8,
+                 max_per_student: int = 2, wait_seconds: float = 3.0):
+        """
+        Initialize practice prefetcher
+
+        Args:
+            practice_manager: Practice manager used to generate sets
+            ttl_seconds: Seconds a prefetched set stays valid
+            max_workers: Maximum concurrent background generations
+            mastery_threshold: Accuracy at which a topic counts as mastered
+            max_per_student: Prefetched sets kept per student (the oldest is
+                             dropped for a new one)
+            wait_seconds: Longest a take waits for a set still being generated
+        """
+        self.practice_manager = practice_manager
+        self.ttl_seconds = ttl_seconds
+        self.mastery_threshold = mastery_threshold
+        self.max_per_student = max_per_student
+        self.wait_seconds = wait_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="practice-prefetch")
+        # student_id -> prefetched sets, oldest first
+        self._entries: Dict[int, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "prefetched": 0, "hits": 0, "misses": 0,
+                       "expired": 0, "replaced": 0, "cancelled": 0, "wasted": 0,
+                       "failed": 0, "skipped": 0}
+
+    # ==================== Prediction ====================
+
+    def predict_next_topic(self, progress_records: List[Progress],
+                           current_topic: str = None) -> Optional[str]:
+        """
+        Predict the topic of the student's next practice set
+
+        Keeps the current topic until it is mastered, then moves to the topic
+        with the lowest accuracy.
+
+        Args:
+            progress_records: Student's progress records
+            current_topic: Topic of the set being worked on, if any
+
+        Returns:
+            Predicted topic, or None without any data
+        """
+        if current_topic:
+            current = [p for p in progress_records if p.topic == current_topic]
+            if not current or min(p.accuracy for p in current) < self.mastery_threshold:
+                return current_topic
+
+        if not progress_records:
+            return None
+
+        return min(progress_records, key=lambda p: p.accuracy).topic
+
+    # ==================== Prefetching ====================
+
+    def prefetch(self, student_id: int, student_name: str, grade_level: int,
+                 topic: str = None, difficulty: str = "medium", count: int = 5,
+                 current_topic: str = None) -> bool:
+        """
+        Start generating the predicted next set in the background
+
+        Args:
+            student_id: Student ID
+            student_name: Student's name
+            grade_level: Student's grade level
+            topic: Topic to prefetch (predicted from progress when omitted)
+            difficulty: Difficulty level
+            count: Number of problems
+            current_topic: Topic being worked on, used for the prediction
+
+        Returns:
+            True if a new prefetch was started
+        """
+        self._discard_expired()
+
+        with self._lock:
+            for entry in self._entries.get(student_id, []):
+                if (entry["requested_topic"], entry["difficulty"], entry["count"]) == (topic, difficulty, count):
+                    return False
+
+        # Don't spend tokens speculatively once the student is near their budget
+        ledger = getattr(self.practice_manager.ai, "ledger", None)
+        if ledger is not None and ledger.check_budget(student_id)["warning"]:
+            with self._lock:
+                self._stats["skipped"] += 1
+            return False
+
+        entry = {
+            "requested_topic": topic,
+            "topic": topic,
+            "difficulty": difficulty,
+            "count": count,
+            "created_at": time.monotonic(),
+            "ready": threading.Event(),
+            "cancelled": threading.Event()
+        }
+        entry["future"] = self._executor.submit(
+            self._generate, entry, student_id, student_name, grade_level, current_topic
+        )
+
+        with self._lock:
+            entries = self._entries.setdefault(student_id, [])
+            entries.append(entry)
+            while len(entries) > self.max_per_student:
+                self._discard(entries.pop(0))
+                self._stats["replaced"] += 1
+            self._stats["started"] += 1
+        return True
+
+    def has_pending(self, student_id: int) -> bool:
+        """
+        Check whether a student has a prefetched set ready or in flight
+
+        Args:
+            student_id: Student ID
+
+        Returns:
+            True if an unexpired set exists
+        """
+        with self._lock:
+            return any(not self._is_expired(entry) for entry in self._entries.get(student_id, []))
+
+    def _discard(self, entry: Dict):
+        """Cancel an unused set (caller holds the lock)"""
+        entry["cancelled"].set()
+        if entry["future"].cancel():
+            self._stats["cancelled"] += 1
+
+    def _generate(self, entry: Dict, student_id: int, student_name: str,
+                  grade_level: int, current_topic: str = None) -> Optional[str]:
+        """Background job - resolve the topic and generate the set"""
+        try:
+            if entry["topic"] is None:
+                progress = self.practice_manager.db.get_student_progress(student_id)
+                entry["topic"] = self.predict_next_topic(progress, current_topic)
+            entry["ready"].set()
+
+            if entry["topic"] is None:
+                return None
+            if entry["cancelled"].is_set():
+                with self._lock:
+                    self._stats["cancelled"] += 1
+                return None
+
+            content = self.practice_manager.generate_practice_set(
+                student_id, student_name, grade_level,
+                entry["topic"], entry["difficulty"], entry["count"]
+            )
+            with self._lock:
+                # Discarded while the call was in flight - the tokens are spent for nothing
+                self._stats["wasted" if entry["cancelled"].is_set() else "prefetched"] += 1
+            return content
+        except Exception:
+            logger.exception("Practice prefetch failed")
+            with self._lock:
+                self._stats["failed"] += 1
+            return None
+        finally:
+            entry["ready"].set()
+
+    def take(self, student_id: int, topic: str, difficulty: str, count: int,
+             timeout: float = None) -> Optional[str]:
+        """
+        Take the prefetched set if it matches the request
+
+        Args:
+            student_id: Student ID
+            topic: Requested topic
+            difficulty: Requested difficulty
+            count: Requested number of problems
+            timeout: Seconds to wait for a matching set still being generated
+                     (defaults to wait_seconds). A set not done by then stays
+                     prefetched for the next request.
+
+        Returns:
+            Practice set content on a hit, None on a miss
+        """
+        with self._lock:
+            entries = list(self._entries.get(student_id, []))
+
+        deadline = time.monotonic() + (self.wait_seconds if timeout is None else timeout)
+        content = None
+        for entry in reversed(entries):
+            if self._is_expired(entry) or (entry["difficulty"], entry["count"]) != (difficulty, count):
+                continue
+            entry["ready"].wait(max(deadline - time.monotonic(), 0))
+            if entry["topic"] != topic:
+                continue
+            try:
+                content = entry["future"].result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception:
+                content = None
+            if content:
+                break
+
+        with self._lock:
+            if content:
+                self._stats["hits"] += 1
+                if entry in self._entries.get(student_id, []):
+                    self._entries[student_id].remove(entry)
+                    if not self._entries[student_id]:
+                        del self._entries[student_id]
+            else:
+                self._stats["misses"] += 1
+        return content
+
+    def peek(self, student_id: int) -> List[Dict]:
+        """
+        Get the prefetched sets for a student without consuming them
+
+        Returns:
+            List of dicts with 'topic', 'difficulty', 'count' and 'ready', newest first
+        """
+        with self._lock:
+            entries = list(self._entries.get(student_id, []))
+        return [
+            {
+                "topic": entry["topic"],
+                "difficulty": entry["difficulty"],
+                "count": entry["count"],
+                "ready": entry["future"].done()
+            }
+            for entry in reversed(entries)
+            if not self._is_expired(entry)
+        ]
+
+    def _is_expired(self, entry: Dict) -> bool:
+        """Check whether a prefetched entry has outlived the TTL"""
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def _discard_expired(self):
+        """Drop prefetched sets that were never used"""
+        with self._lock:
+            for student_id in list(self._entries):
+                entries = self._entries[student_id]
+                for entry in [entry for entry in entries if self._is_expired(entry)]:
+                    entries.remove(entry)
+                    self._discard(entry)
+                    self._stats["expired"] += 1
+                if not entries:
+                    del self._entries[student_id]
+
+    def get_stats(self) -> Dict:
+        """Get prefetch statistics including the hit rate"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(entries) for entries in self._entries.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
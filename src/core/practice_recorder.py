@@ -0,0 +1,297 @@
+"""Practice recorder - persists practice problems and attempts in the background"""
+
+import atexit
+import logging
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..database.db_manager import DatabaseManager
+from ..utils.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class PracticeRecorder:
+    """Records generated practice problems and student attempts off the UI thread
+
+    Writes are queued and a single worker thread drains the queue, so the page
+    never waits on the database. Each drained batch is written with one bulk
+    insert for new problems and one transaction per practice set for attempts.
+    A write that fails is queued again, up to max_retries times, without
+    holding back the rest of the batch.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, batch_size: int = 100,
+                 max_queue_size: int = 10000, max_retries: int = 3,
+                 max_sets: int = 1000):
+        """
+        Initialize practice recorder
+
+        Args:
+            db_manager: Database manager instance
+            batch_size: Maximum queued jobs written per batch
+            max_queue_size: Maximum pending jobs before callers block
+            max_retries: Times a failed write is queued again before it is dropped
+            max_sets: Practice sets whose problem IDs are remembered (least
+                      recently used sets are forgotten first)
+        """
+        self.db = db_manager
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # (student_id, set_key) -> {problem number: problem ID}
+        self._problem_ids = LRUCache(max_size=max_sets, name="practice_problem_ids")
+        self._lock = threading.Lock()
+        self._stats = {"problems_recorded": 0, "attempts_recorded": 0, "failed_batches": 0,
+                       "retried_jobs": 0, "dropped_jobs": 0}
+
+        self._worker = threading.Thread(target=self._run, name="practice-recorder", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush, 5.0)
+
+    # ==================== Producer API ====================
+
+    def record_problem_set(self, student_id: int, topic: str, difficulty: str,
+                           set_key: str, problems: List[Dict]):
+        """
+        Queue the problems of a generated practice set
+
+        Args:
+            student_id: Student ID
+            topic: Practice topic
+            difficulty: Practice difficulty
+            set_key: Stable key of the practice set (content hash)
+            problems: List of dicts with 'number', 'problem_text' and optionally
+                      'correct_answer', 'solution_explanation', 'problem_type'
+        """
+        with self._lock:
+            known = dict(self._problem_ids.get((student_id, set_key)) or {})
+        pending = [p for p in problems if str(p["number"]) not in known]
+        if not pending:
+            return
+
+        self._queue.put(("problems", {
+            "student_id": student_id,
+            "topic": topic,
+            "difficulty": difficulty,
+            "set_key": set_key,
+            "problems": pending
+        }))
+
+    def record_attempt(self, student_id: int, topic: str, difficulty: str, set_key: str,
+                       number: str, problem_text: str, student_answer: str,
+                       is_correct: bool, feedback: str = None, correct_answer: str = "",
+                       solution_explanation: str = None):
+        """
+        Queue one graded attempt
+
+        Args:
+            student_id: Student ID
+            topic: Practice topic
+            difficulty: Practice difficulty
+            set_key: Key of the practice set the problem belongs to
+            number: Problem number within the set
+            problem_text: Problem text (used if the problem was never recorded)
+            student_answer: Student's answer
+            is_correct: Whether the answer was correct
+            feedback: Tutor feedback
+            correct_answer: Expected answer, if known
+            solution_explanation: Worked solution, if known
+        """
+        self.record_attempts(student_id, topic, difficulty, set_key, [{
+            "number": number,
+            "problem_text": problem_text,
+            "student_answer": student_answer,
+            "is_correct": is_correct,
+            "feedback": feedback,
+            "correct_answer": correct_answer,
+            "solution_explanation": solution_explanation
+        }])
+
+    def record_attempts(self, student_id: int, topic: str, difficulty: str,
+                        set_key: str, attempts: List[Dict]):
+        """
+        Queue several graded attempts to be written in one transaction
+
+        Args:
+            student_id: Student ID
+            topic: Practice topic
+            difficulty: Practice difficulty
+            set_key: Key of the practice set
+            attempts: Attempt dicts as accepted by DatabaseManager.record_practice_results,
+                      plus 'number'
+        """
+        if not attempts:
+            return
+
+        self._queue.put(("attempts", {
+            "student_id": student_id,
+            "topic": topic,
+            "difficulty": difficulty,
+            "set_key": set_key,
+            "attempts": attempts
+        }))
+
+    def problem_id(self, student_id: int, set_key: str, number: str) -> Optional[int]:
+        """Get the database ID of a recorded problem, None if not written yet"""
+        with self._lock:
+            return (self._problem_ids.get((student_id, set_key)) or {}).get(str(number))
+
+    def _remember_problem_ids(self, student_id: int, set_key: str, ids: Dict[str, int]):
+        """Store problem IDs of a practice set"""
+        with self._lock:
+            known = self._problem_ids.get((student_id, set_key))
+            if known is None:
+                known = {}
+                self._problem_ids.set((student_id, set_key), known)
+            known.update(ids)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until all queued jobs are written
+
+        Args:
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            True if the queue was drained
+        """
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to be written"""
+        return self._queue.qsize()
+
+    def get_stats(self) -> Dict:
+        """Get recorder statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self.queue_depth
+        return stats
+
+    # ==================== Worker ====================
+
+    def _run(self):
+        """Worker loop - drain the queue in batches"""
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            flush_events = [payload for kind, payload in jobs if kind == "flush"]
+            work = [(kind, payload) for kind, payload in jobs if kind != "flush"]
+
+            try:
+                if work:
+                    self._write_batch(work)
+            except Exception:
+                logger.exception("Failed to record practice batch")
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+            finally:
+                for event in flush_events:
+                    event.set()
+
+    def _requeue(self, kind: str, job: Dict):
+        """Queue a failed job again, or drop it once it has used its retries"""
+        retries = job.get("retries", 0) + 1
+        if retries <= self.max_retries:
+            try:
+                # Never block: this runs on the only thread that drains the queue
+                self._queue.put_nowait((kind, dict(job, retries=retries)))
+                with self._lock:
+                    self._stats["retried_jobs"] += 1
+                return
+            except queue.Full:
+                pass
+        logger.error("Dropping %s job for student %s, set %s after %d attempts",
+                     kind, job["student_id"], job["set_key"], retries)
+        with self._lock:
+            self._stats["dropped_jobs"] += 1
+
+    def _write_batch(self, jobs: List[Tuple[str, Dict]]):
+        """Write one drained batch - problem sets first so attempts can reference them"""
+        problem_rows = []
+        problem_keys = []
+        seen = set()
+        for kind, job in jobs:
+            if kind != "problems":
+                continue
+            for problem in job["problems"]:
+                key = (job["student_id"], job["set_key"], str(problem["number"]))
+                if key in seen or self.problem_id(*key) is not None:
+                    continue
+                seen.add(key)
+                problem_keys.append(key)
+                problem_rows.append({
+                    "student_id": job["student_id"],
+                    "topic": job["topic"],
+                    "difficulty": job["difficulty"],
+                    "problem_text": problem["problem_text"],
+                    "problem_type": problem.get("problem_type", "short_answer"),
+                    "correct_answer": problem.get("correct_answer") or "",
+                    "solution_explanation": problem.get("solution_explanation")
+                })
+
+        if problem_rows:
+            try:
+                ids = self.db.bulk_create_practice_problems(problem_rows)
+            except Exception:
+                logger.exception("Failed to record %d practice problems", len(problem_rows))
+                for kind, job in jobs:
+                    if kind == "problems":
+                        self._requeue(kind, job)
+            else:
+                for (student_id, set_key, number), problem_id in zip(problem_keys, ids):
+                    self._remember_problem_ids(student_id, set_key, {number: problem_id})
+                with self._lock:
+                    self._stats["problems_recorded"] += len(ids)
+
+        # Group attempts per practice set so each set is one transaction
+        groups: Dict[Tuple, Dict] = {}
+        for kind, job in jobs:
+            if kind != "attempts":
+                continue
+            group_key = (job["student_id"], job["topic"], job["difficulty"], job["set_key"])
+            group = groups.setdefault(group_key, dict(job, attempts=[], retries=0))
+            group["attempts"].extend(job["attempts"])
+            group["retries"] = max(group["retries"], job.get("retries", 0))
+
+        # One set failing must not cost the other sets their attempts
+        for group in groups.values():
+            try:
+                self._write_attempts(group)
+            except ValueError:
+                # Rejected by the database layer (a problem of another student); retrying won't help
+                logger.exception("Dropping practice attempts for student %s, set %s",
+                                 group["student_id"], group["set_key"])
+                with self._lock:
+                    self._stats["dropped_jobs"] += 1
+            except Exception:
+                logger.exception("Failed to record practice attempts for student %s, set %s",
+                                 group["student_id"], group["set_key"])
+                self._requeue("attempts", group)
+
+    def _write_attempts(self, group: Dict):
+        """Write the attempts of one practice set in one transaction"""
+        student_id, set_key, attempts = group["student_id"], group["set_key"], group["attempts"]
+        for attempt in attempts:
+            if not attempt.get("problem_id"):
+                attempt["problem_id"] = self.problem_id(student_id, set_key, attempt["number"])
+
+        ids = self.db.record_practice_results(student_id, group["topic"], group["difficulty"],
+                                              attempts)
+
+        self._remember_problem_ids(student_id, set_key, {
+            str(attempt["number"]): problem_id for attempt, problem_id in zip(attempts, ids)
+        })
+        with self._lock:
+            self._stats["attempts_recorded"] += len(attempts)
@@ -0,0 +1,201 @@
+"""Session lifecycle - tracks active tutoring sessions and ends idle ones"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from ..database.db_manager import DatabaseManager
+from ..utils import metrics
+from ..utils.shared_cache import SharedCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLifecycle:
+    """Keeps each student's active session in memory and ends sessions left idle
+
+    The index is built from the database once and then kept current from
+    DatabaseManager write events (relayed between replicas by the
+    invalidation bus), so finding a student's session needs no query. A
+    background sweeper ends sessions whose last message is older than the
+    timeout, a bounded batch per UPDATE. With a shared cache, replicas take
+    turns: each sweep interval is claimed by one replica only.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, timeout_minutes: int = 60,
+                 sweep_interval_seconds: float = 60, batch_size: int = 500,
+                 shared_cache: SharedCache = None, replica_id: str = "replica",
+                 start: bool = True):
+        """
+        Initialize session lifecycle
+
+        Args:
+            db_manager: Database manager instance
+            timeout_minutes: Minutes without a message after which a session ends
+            sweep_interval_seconds: Seconds between sweeps for idle sessions
+            batch_size: Maximum sessions ended per UPDATE
+            shared_cache: Cache shared by the replicas, used to let one of them
+                          sweep each interval (None sweeps every interval here)
+            replica_id: Name recorded with a claimed sweep interval
+            start: Start the background sweeper
+        """
+        self.db = db_manager
+        self.timeout = timedelta(minutes=timeout_minutes)
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.batch_size = batch_size
+        self.shared_cache = shared_cache
+        self.replica_id = replica_id
+        self._lock = threading.Lock()
+        # student_id -> {'session_id', 'last_activity'} (UTC, like message timestamps)
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._stats = {"started": 0, "ended": 0, "expired": 0, "sweeps": 0, "failed_sweeps": 0,
+                       "skipped_sweeps": 0}
+        self._stop = threading.Event()
+
+        db_manager.add_listener(self.handle_event)
+        self.reload()
+
+        self._worker = None
+        if start:
+            self._worker = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._worker.start()
+            atexit.register(self.stop)
+
+    # ==================== Index ====================
+
+    def reload(self):
+        """Rebuild the index from the database (the newest active session per student)"""
+        index = {}
+        for row in self.db.get_active_session_activity():
+            current = index.get(row["student_id"])
+            if current is None or row["session_id"] > current["session_id"]:
+                index[row["student_id"]] = {"session_id": row["session_id"],
+                                            "last_activity": row["last_activity"]}
+        with self._lock:
+            self._active = index
+
+    def handle_event(self, event: str, student_id: int = None, session_id: int = None,
+                     _remote: bool = False, expired: bool = False, **data):
+        """
+        Keep the index current from a database write
+
+        Args:
+            event: Write event name from DatabaseManager
+            student_id: Student the write belongs to
+            session_id: Session the write belongs to
+            _remote: Event replayed from another replica (not counted here)
+            expired: Session ended for inactivity
+        """
+        if student_id is None or session_id is None:
+            return
+
+        now = datetime.utcnow()
+        outcome = None
+        with self._lock:
+            current = self._active.get(student_id)
+            if event == "session_created":
+                if current is None or session_id >= current["session_id"]:
+                    self._active[student_id] = {"session_id": session_id, "last_activity": now}
+                outcome = "started"
+            elif event == "session_ended":
+                if current is not None and current["session_id"] == session_id:
+                    del self._active[student_id]
+                outcome = "expired" if expired else "ended"
+            elif event == "message_added":
+                if current is None or session_id >= current["session_id"]:
+                    self._active[student_id] = {"session_id": session_id, "last_activity": now}
+
+            if outcome and not _remote:
+                self._stats[outcome] += 1
+        if outcome and not _remote:
+            metrics.SESSION_EVENTS.inc(1, outcome)
+
+    def get_active_session_id(self, student_id: int, include_idle: bool = False) -> Optional[int]:
+        """
+        Get a student's active session without querying the database
+
+        Args:
+            student_id: Student ID
+            include_idle: Also return a session past the timeout the sweeper
+                          hasn't ended yet
+
+        Returns:
+            Session ID, or None if the student has no (live) active session
+        """
+        with self._lock:
+            current = self._active.get(student_id)
+        if current is None:
+            return None
+        if not include_idle and datetime.utcnow() - current["last_activity"] > self.timeout:
+            return None
+        return current["session_id"]
+
+    @property
+    def active_count(self) -> int:
+        """Students with an active session"""
+        with self._lock:
+            return len(self._active)
+
+    # ==================== Sweeper ====================
+
+    def sweep(self) -> int:
+        """
+        End every session idle for longer than the timeout
+
+        Returns:
+            Number of sessions ended
+        """
+        cutoff = datetime.utcnow() - self.timeout
+        total = 0
+        while True:
+            ended = self.db.end_idle_sessions(cutoff, limit=self.batch_size)
+            total += len(ended)
+            if len(ended) < self.batch_size:
+                break
+        with self._lock:
+            self._stats["sweeps"] += 1
+        if total:
+            logger.info("Ended %d idle tutoring sessions", total)
+        return total
+
+    def _claim_interval(self) -> bool:
+        """Claim the current sweep interval for this replica (always True without a shared cache)"""
+        if self.shared_cache is None:
+            return True
+        interval = int(time.time() // self.sweep_interval_seconds)
+        return self.shared_cache.add(f"session-sweep:{interval}", self.replica_id,
+                                     ttl_seconds=int(2 * self.sweep_interval_seconds) + 1)
+
+    def _run(self):
+        """Sweep on an interval until stopped"""
+        while not self._stop.wait(self.sweep_interval_seconds):
+            try:
+                if not self._claim_interval():
+                    # Another replica sweeps this interval
+                    with self._lock:
+                        self._stats["skipped_sweeps"] += 1
+                    continue
+                self.sweep()
+            except Exception:
+                # Idle sessions stay open until the next sweep
+                with self._lock:
+                    self._stats["failed_sweeps"] += 1
+                logger.exception("Sweeping idle tutoring sessions failed")
+
+    def stop(self):
+        """Stop the background sweeper"""
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get active and idle session counts, session churn and sweep counts"""
+        cutoff = datetime.utcnow() - self.timeout
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = len(self._active)
+            stats["idle"] = sum(1 for entry in self._active.values() if entry["last_activity"] < cutoff)
+        stats["timeout_minutes"] = self.timeout.total_seconds() / 60
+        return stats
@@ -1,23 +1,31 @@
 """Session management module"""
 
+import logging
 from typing import Optional, List, Dict, Tuple
 from datetime import datetime
 
 from ..database.db_manager import DatabaseManager
 from ..database.models import Session, Message
+from ..utils.math_renderer import NORMALIZER_VERSION, katex_metadata
+
+
+logger = logging.getLogger(__name__)
 
 
 class SessionManager:
     """Manages tutoring sessions"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, lifecycle=None):
         """
         Initialize session manager
         
         Args:
             db_manager: Database manager instance
+            lifecycle: SessionLifecycle answering "which session is active" from
+                       memory and ending idle sessions (None queries the database)
         """
         self.db = db_manager
+        self.lifecycle = lifecycle
     
     def start_session(self, student_id: int, topic: str = None,
                      session_type: str = "general") -> Session:
@@ -33,9 +41,13 @@ class SessionManager:
             Created session object
         """
         # End any active sessions first
-        active_session = self.db.get_active_session(student_id)
-        if active_session:
-            self.end_session(active_session.id)
+        if self.lifecycle is not None:
+            active_session_id = self.lifecycle.get_active_session_id(student_id, include_idle=True)
+        else:
+            active_session = self.db.get_active_session(student_id)
+            active_session_id = active_session.id if active_session else None
+        if active_session_id:
+            self.end_session(active_session_id)
         
         # Create new session
         session = self.db.create_session(
@@ -59,10 +71,14 @@ class SessionManager:
         Returns:
             Session object (existing or new)
         """
-        # Check for active session
-        active_session = self.db.get_active_session(student_id)
+        # Check for active session (one idle past the timeout doesn't count)
+        if self.lifecycle is not None:
+            active_session_id = self.lifecycle.get_active_session_id(student_id)
+            active_session = self.get_session(active_session_id) if active_session_id else None
+        else:
+            active_session = self.db.get_active_session(student_id)
         
-        if active_session:
+        if active_session and active_session.is_active:
             return active_session
         
         # Create new session
@@ -112,6 +128,37 @@ class SessionManager:
         """Get messages for a session"""
         return self.db.get_session_messages(session_id, limit=limit)
     
+    def normalize_tutor_messages(self, messages: List[Message]) -> List[Message]:
+        """
+        Make sure tutor messages carry a current KaTeX normalization
+        
+        Messages saved before normalization existed (or by an older version of
+        it) are normalized once here and the result is stored with them.
+        
+        Args:
+            messages: Messages as loaded from the database
+        
+        Returns:
+            The same messages, with message_metadata filled in
+        """
+        updates = {}
+        for msg in messages:
+            if msg.role != "tutor":
+                continue
+            stored = (msg.message_metadata or {}).get("katex")
+            if stored and stored.get("version") == NORMALIZER_VERSION:
+                continue
+            updates[msg.id] = {"katex": katex_metadata(msg.content)}
+            msg.message_metadata = {**(msg.message_metadata or {}), **updates[msg.id]}
+        
+        if updates:
+            try:
+                self.db.update_message_metadata(updates)
+            except Exception:
+                # Rendering still works; the messages are normalized again next load
+                logger.exception("Failed to store KaTeX normalization for %d messages", len(updates))
+        return messages
+    
     def get_conversation_history(self, session_id: int, limit: int = 50) -> List[Dict[str, str]]:
         """
         Get conversation history formatted for AI
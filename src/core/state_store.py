@@ -0,0 +1,343 @@
+"""Server-side session store - keeps per-user UI state outside Streamlit's memory"""
+
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from ..database.db_manager import DatabaseManager
+
+
+# session_state keys that are persisted; everything else is rebuilt per run
+PERSISTED_KEYS = (
+    "current_session",
+    "chat_messages",
+    "chat_session_id",
+    "chat_window",
+    "practice_content",
+    "practice_topic",
+    "practice_difficulty",
+    "problem_completed",
+    "show_solution",
+    "problem_feedback",
+    "answer_correct",
+    "recorded_practice_set",
+    "active_practice_set",
+    "prefetched_practice_set",
+)
+
+
+def _encode(value):
+    """JSON encoder for values JSON can't represent natively"""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Cannot persist {type(value).__name__} in the session store")
+
+
+def _decode(obj: Dict):
+    """JSON object hook reversing _encode"""
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def dumps(state: Dict) -> str:
+    """Serialize a state dict"""
+    return json.dumps(state, default=_encode, sort_keys=True)
+
+
+def loads(data: str) -> Dict:
+    """Deserialize a state dict"""
+    return json.loads(data, object_hook=_decode)
+
+
+class StateStore:
+    """Base class for session stores - state dicts keyed by session ID"""
+
+    def __init__(self, ttl_seconds: int = 72 * 3600):
+        """
+        Initialize state store
+
+        Args:
+            ttl_seconds: Seconds an untouched session is kept
+        """
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, sid: str) -> Optional[Dict]:
+        """Load a session's state (None if unknown or expired)"""
+        raise NotImplementedError
+
+    def save(self, sid: str, state: Dict):
+        """Store a session's state"""
+        raise NotImplementedError
+
+    def delete(self, sid: str):
+        """Remove a session's state"""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Remove expired sessions, returning how many were removed"""
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """In-process store - shared by all browser sessions, lost on restart"""
+
+    def __init__(self, ttl_seconds: int = 72 * 3600):
+        super().__init__(ttl_seconds)
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data.get(sid)
+        if not entry or time.time() - entry[1] > self.ttl_seconds:
+            return None
+        return loads(entry[0])
+
+    def save(self, sid: str, state: Dict):
+        data = dumps(state)
+        with self._lock:
+            self._data[sid] = (data, time.time())
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, (_, updated) in self._data.items() if updated < cutoff]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite file store - survives restarts and can be shared by local replicas"""
+
+    # Expired rows are purged every this many saves
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str = "data/session_state.db", ttl_seconds: int = 72 * 3600):
+        """
+        Initialize SQLite state store
+
+        Args:
+            path: Database file path
+            ttl_seconds: Seconds an untouched session is kept
+        """
+        super().__init__(ttl_seconds)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self._saves = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ui_state ("
+                "sid TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM ui_state WHERE sid = ?", (sid,)
+            ).fetchone()
+        if not row or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return loads(row[0])
+
+    def save(self, sid: str, state: Dict):
+        data = dumps(state)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO ui_state (sid, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (sid, data, time.time())
+            )
+            self._saves += 1
+            purge = self._saves % self.PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def delete(self, sid: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM ui_state WHERE sid = ?", (sid,))
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM ui_state WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            return cursor.rowcount
+
+
+def create_state_store(backend: str = "sqlite", path: str = "data/session_state.db",
+                       ttl_hours: float = 72) -> StateStore:
+    """
+    Create a state store from configuration
+
+    Args:
+        backend: 'memory' or 'sqlite'
+        path: Database file for the sqlite backend
+        ttl_hours: Hours an untouched session is kept
+
+    Returns:
+        State store instance
+    """
+    ttl_seconds = int(ttl_hours * 3600)
+    if backend == "memory":
+        return MemoryStateStore(ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteStateStore(path, ttl_seconds)
+    raise ValueError(f"Unknown state store backend: {backend}")
+
+
+# Streamlit-specific session helpers
+
+def _auth_enabled() -> bool:
+    return os.getenv("ENABLE_AUTHENTICATION", "False").lower() == "true"
+
+
+def _logged_in_student_id() -> Optional[int]:
+    """ID of the authenticated student of this browser session, if any"""
+    import streamlit as st
+
+    student = st.session_state.get('current_student')
+    if not st.session_state.get('authenticated') or student is None:
+        return None
+    return student.id
+
+
+def get_session_id() -> Optional[str]:
+    """
+    Get the browser session's store ID
+
+    With authentication on, state belongs to the logged-in student (None until
+    someone logs in). Without it there is no identity, so the ID is a random
+    token kept in the 'sid' query parameter (the link is the only key).
+
+    Returns:
+        Store ID, or None when nothing should be stored
+    """
+    import streamlit as st
+
+    if _auth_enabled():
+        student_id = _logged_in_student_id()
+        return f"student-{student_id}" if student_id is not None else None
+
+    sid = st.session_state.get('state_sid')
+    if sid is None:
+        sid = secrets.token_urlsafe(24)
+        st.session_state.state_sid = sid
+    # Page switches drop query parameters, so put it back on every run
+    if st.query_params.get("sid") != sid:
+        st.query_params["sid"] = sid
+    return sid
+
+
+def _clear_persisted_state():
+    import streamlit as st
+
+    for key in PERSISTED_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.pop('state_digest', None)
+
+
+def restore_session_state(store: StateStore, db_manager: DatabaseManager):
+    """
+    Restore persisted state into a new browser session (once per session)
+
+    With authentication on, only the logged-in student's own state is
+    restored, and the previous student's state is dropped when someone else
+    logs in. Without it, state is restored from the 'sid' link and then saved
+    under a new ID, so tabs or people sharing a link don't overwrite each other.
+
+    Args:
+        store: State store instance
+        db_manager: Database manager used to reload the selected student
+    """
+    import streamlit as st
+
+    if _auth_enabled():
+        owner = _logged_in_student_id()
+        if st.session_state.get('state_owner', owner) != owner:
+            # Logged out, or another student logged in on this browser session
+            _clear_persisted_state()
+            st.session_state.state_restored = False
+        st.session_state.state_owner = owner
+        if owner is None or st.session_state.get('state_restored'):
+            return
+        st.session_state.state_restored = True
+
+        state = store.load(get_session_id())
+        if not state or state.get("current_student_id") != owner:
+            return
+        for key in PERSISTED_KEYS:
+            if key in state and key not in st.session_state:
+                st.session_state[key] = state[key]
+        st.session_state.state_digest = hashlib.sha256(dumps(state).encode('utf-8')).hexdigest()
+        return
+
+    if st.session_state.get('state_restored'):
+        return
+    st.session_state.state_restored = True
+
+    linked_sid = st.query_params.get("sid")
+    # A fresh ID for this browser session; the linked state is copied, not shared
+    get_session_id()
+    state = store.load(linked_sid) if linked_sid else None
+    if not state:
+        return
+
+    for key in PERSISTED_KEYS:
+        if key in state and key not in st.session_state:
+            st.session_state[key] = state[key]
+
+    student_id = state.get("current_student_id")
+    if student_id and st.session_state.get('current_student') is None:
+        st.session_state.current_student = db_manager.get_student(student_id)
+
+
+def persist_session_state(store: Optional[StateStore]):
+    """
+    Save the browser session's persisted keys if they changed since the last save
+
+    Args:
+        store: State store instance (None does nothing)
+    """
+    import streamlit as st
+
+    if store is None:
+        return
+
+    sid = get_session_id()
+    if sid is None:
+        return
+    student = st.session_state.get('current_student')
+    if _auth_enabled() and st.session_state.get('state_owner') != student.id:
+        # Not restored for this student yet - don't save someone else's state under their ID
+        return
+
+    state = {key: st.session_state[key] for key in PERSISTED_KEYS if key in st.session_state}
+    state["current_student_id"] = student.id if student else None
+
+    data = dumps(state)
+    digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+    if st.session_state.get('state_digest') == digest:
+        return
+
+    store.save(sid, state)
+    st.session_state.state_digest = digest
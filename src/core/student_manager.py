@@ -109,17 +109,14 @@ class StudentManager:
         # Get progress records
         progress_records = self.db.get_student_progress(student_id)
         
-        # Calculate statistics - query messages count directly
+        # Calculate statistics
         total_sessions = len(all_sessions)
         
-        # Count total messages across all sessions
-        total_messages = 0
-        message_counts = {}
-        for session in all_sessions:
-            messages = self.db.get_session_messages(session.id)
-            count = len(messages)
-            message_counts[session.id] = count
-            total_messages += count
+        # Count messages per session with one grouped query
+        message_counts = self.db.get_message_counts(student_id)
+        total_messages = sum(
+            message_counts.get(session.id, 0) for session in all_sessions
+        )
         
         # Topics worked on
         topics_worked = set()
@@ -0,0 +1,283 @@
+"""Token ledger - records AI token usage and enforces daily budgets"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from ..database.db_manager import DatabaseManager
+from ..utils.shared_cache import SharedCache
+
+
+logger = logging.getLogger(__name__)
+
+# Shared daily counters outlive their day by this much, then expire
+COUNTER_TTL_SECONDS = 2 * 24 * 3600
+
+
+class BudgetExceededError(Exception):
+    """Raised when a hard token budget has been used up"""
+
+
+class TokenLedger:
+    """Records every AI call's tokens and enforces per-student and global daily budgets
+
+    Budgets are counted in tokens (input + output + cache) per UTC day. Crossing a
+    soft budget only flags a warning; crossing a hard budget blocks further calls.
+    Today's totals are loaded once from the daily aggregates and then kept in
+    memory, so budget checks do not hit the database. With a shared cache the
+    totals are counters in that cache instead, seeded from the database and
+    incremented atomically by every replica, so budgets hold for the whole
+    deployment rather than per replica.
+    """
+
+    def __init__(self, db_manager: DatabaseManager,
+                 student_daily_soft: int = None, student_daily_hard: int = None,
+                 global_daily_soft: int = None, global_daily_hard: int = None,
+                 shared_cache: SharedCache = None):
+        """
+        Initialize token ledger
+
+        Args:
+            db_manager: Database manager instance
+            student_daily_soft: Daily tokens per student before warning (None = no limit)
+            student_daily_hard: Daily tokens per student before blocking (None = no limit)
+            global_daily_soft: Daily tokens for the deployment before warning
+            global_daily_hard: Daily tokens for the deployment before blocking
+            shared_cache: Cache holding the daily totals for every replica (None
+                          keeps them in this process only)
+        """
+        self.db = db_manager
+        self.student_daily_soft = student_daily_soft
+        self.student_daily_hard = student_daily_hard
+        self.global_daily_soft = global_daily_soft
+        self.global_daily_hard = global_daily_hard
+        self.shared_cache = shared_cache
+
+        self._lock = threading.Lock()
+        self._day = None
+        self._student_totals: Dict[int, int] = {}
+        self._global_total: Optional[int] = None
+
+    # ==================== Recording ====================
+
+    def record(self, task: str, model: str, usage: Dict[str, int], cost: float = 0.0,
+               student_id: int = None, session_id: int = None):
+        """
+        Record the usage of one AI call
+
+        Args:
+            task: Task type (chat, practice_generation, answer_check, summarize)
+            model: Model that served the call
+            usage: Usage dict with input, output and cache token counts
+            cost: Estimated cost in USD
+            student_id: Student the call was made for
+            session_id: Tutoring session the call belongs to
+        """
+        entry = {
+            "input_tokens": usage.get("input_tokens", 0) or 0,
+            "output_tokens": usage.get("output_tokens", 0) or 0,
+            "cache_creation_tokens": usage.get("cache_creation_input_tokens", 0) or 0,
+            "cache_read_tokens": usage.get("cache_read_input_tokens", 0) or 0,
+        }
+
+        try:
+            self.db.record_token_usage(
+                task=task, model=model, cost=cost,
+                student_id=student_id, session_id=session_id, **entry
+            )
+        except Exception:
+            # Never lose a paid-for response because the ledger write failed
+            logger.exception("Failed to record token usage")
+
+        total = sum(entry.values())
+        if self.shared_cache is not None:
+            self._add_shared(total, student_id)
+
+        with self._lock:
+            self._roll_day()
+            if self._global_total is not None:
+                self._global_total += total
+            if student_id is not None and student_id in self._student_totals:
+                self._student_totals[student_id] += total
+
+    # ==================== Budgets ====================
+
+    def _roll_day(self):
+        """Reset in-memory totals when the UTC day changes (lock held)"""
+        today = datetime.utcnow().date()
+        if self._day != today:
+            self._day = today
+            self._student_totals = {}
+            self._global_total = None
+
+    def _counter_key(self, student_id: int = None) -> str:
+        """Shared counter of today's tokens for a student or the deployment"""
+        day = datetime.utcnow().date().isoformat()
+        return f"tokens:{day}:" + ("global" if student_id is None else f"student:{student_id}")
+
+    def _add_shared(self, total: int, student_id: int = None):
+        """Add a call's tokens to the shared counters that are already seeded"""
+        for key_student in ([None] if student_id is None else [None, student_id]):
+            key = self._counter_key(key_student)
+            try:
+                # An unseeded counter is seeded later from the database, which has this call
+                if self.shared_cache.get(key) is not None:
+                    self.shared_cache.incr(key, total, COUNTER_TTL_SECONDS)
+            except Exception:
+                logger.warning("Could not update shared token counter %s", key, exc_info=True)
+
+    def _shared_used_today(self, student_id: int = None) -> Optional[int]:
+        """Read (seeding if needed) a shared counter; None if the cache is unavailable"""
+        key = self._counter_key(student_id)
+        try:
+            used = self.shared_cache.get(key)
+            if used is None:
+                seed = self.db.get_daily_token_usage(student_id=student_id)["total_tokens"]
+                self.shared_cache.add(key, seed, COUNTER_TTL_SECONDS)
+                used = self.shared_cache.get(key)
+                if used is None:
+                    used = seed
+        except Exception:
+            logger.warning("Shared token counter %s unavailable; using this replica's total",
+                           key, exc_info=True)
+            return None
+
+        with self._lock:
+            self._roll_day()
+            if student_id is None:
+                self._global_total = int(used)
+            else:
+                self._student_totals[student_id] = int(used)
+        return int(used)
+
+    def get_used_today(self, student_id: int = None) -> int:
+        """
+        Get tokens used today
+
+        Args:
+            student_id: Student ID (None for the whole deployment)
+
+        Returns:
+            Total tokens used today
+        """
+        if self.shared_cache is not None:
+            used = self._shared_used_today(student_id)
+            if used is not None:
+                return used
+
+        with self._lock:
+            self._roll_day()
+            if student_id is None and self._global_total is not None:
+                return self._global_total
+            if student_id is not None and student_id in self._student_totals:
+                return self._student_totals[student_id]
+
+        used = self.db.get_daily_token_usage(student_id=student_id)["total_tokens"]
+
+        with self._lock:
+            if student_id is None:
+                self._global_total = used
+            else:
+                self._student_totals[student_id] = used
+        return used
+
+    def get_snapshot(self) -> Dict:
+        """
+        Get the in-memory budget state without querying the database (or the
+        shared cache: totals are as of their last budget check here)
+
+        Returns:
+            Dict with 'day', the 'global' budget status (None until loaded),
+            'students' (status of every student with a loaded total, most used
+            first) and 'limits'
+        """
+        with self._lock:
+            self._roll_day()
+            day = self._day
+            global_total = self._global_total
+            student_totals = dict(self._student_totals)
+
+        students = [
+            dict(self._budget_status(used, self.student_daily_soft, self.student_daily_hard),
+                 student_id=student_id)
+            for student_id, used in sorted(student_totals.items(), key=lambda item: -item[1])
+        ]
+        return {
+            "day": day.isoformat(),
+            "global": (
+                self._budget_status(global_total, self.global_daily_soft, self.global_daily_hard)
+                if global_total is not None else None
+            ),
+            "students": students,
+            "limits": {
+                "student_daily_soft": self.student_daily_soft,
+                "student_daily_hard": self.student_daily_hard,
+                "global_daily_soft": self.global_daily_soft,
+                "global_daily_hard": self.global_daily_hard
+            }
+        }
+
+    @staticmethod
+    def _budget_status(used: int, soft: Optional[int], hard: Optional[int]) -> Dict:
+        """Build the status dict of one budget"""
+        return {
+            "used": used,
+            "soft_limit": soft,
+            "hard_limit": hard,
+            "remaining": max(hard - used, 0) if hard else None,
+            "warning": bool(soft) and used >= soft,
+            "exceeded": bool(hard) and used >= hard
+        }
+
+    def check_budget(self, student_id: int = None) -> Dict:
+        """
+        Check today's budgets for a student and the deployment
+
+        Args:
+            student_id: Student ID (None checks only the global budget)
+
+        Returns:
+            Dict with 'allowed', 'warning', 'global' and 'student' budget status
+        """
+        global_status = self._budget_status(
+            self.get_used_today(), self.global_daily_soft, self.global_daily_hard
+        )
+
+        student_status = None
+        if student_id is not None:
+            student_status = self._budget_status(
+                self.get_used_today(student_id), self.student_daily_soft, self.student_daily_hard
+            )
+
+        statuses = [s for s in (global_status, student_status) if s]
+        return {
+            "allowed": not any(s["exceeded"] for s in statuses),
+            "warning": any(s["warning"] for s in statuses),
+            "global": global_status,
+            "student": student_status
+        }
+
+    def enforce(self, student_id: int = None) -> Dict:
+        """
+        Check budgets and block the call when a hard budget is used up
+
+        Args:
+            student_id: Student the call is made for
+
+        Returns:
+            Budget status dict (see check_budget)
+
+        Raises:
+            BudgetExceededError: If the student's or the global hard budget is used up
+        """
+        status = self.check_budget(student_id)
+        if not status["allowed"]:
+            if status["student"] and status["student"]["exceeded"]:
+                raise BudgetExceededError(
+                    "Daily AI usage limit reached for this student. Please try again tomorrow."
+                )
+            raise BudgetExceededError(
+                "Daily AI usage limit reached for the tutor. Please try again tomorrow."
+            )
+        return status
@@ -0,0 +1,446 @@
+"""Upload pipeline - stores chat attachments and turns them into AI content blocks
+
+Files are streamed to content-addressed storage (one copy per SHA-256, so a
+worksheet uploaded by a whole class is stored and processed once), then
+processed on a worker pool: images are downscaled and re-encoded to a bounded
+size, PDFs, DOCX and TXT files have their text extracted page by page up to a
+cap. The page gets a Future per file and keeps rendering while they run.
+With upload understanding configured, each processed file is also
+transcribed by the AI (once per distinct content, see upload_understanding)
+and the transcription is sent in place of the image or raw text.
+"""
+
+import atexit
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp", "heic", "heif"}
+TEXT_EXTENSIONS = {"txt", "pdf", "docx"}
+
+_DOCX_PARAGRAPH_RE = re.compile(r"<w:p[ >].*?</w:p>", re.DOTALL)
+_DOCX_TEXT_RE = re.compile(r"<w:t(?: [^>]*)?>([^<]*)</w:t>")
+_DOCX_PAGE_BREAK = '<w:br w:type="page"/>'
+
+
+class UploadError(Exception):
+    """Raised when an upload can't be stored or processed"""
+    pass
+
+
+def _extension(name: str) -> str:
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+_heif_registered = False
+
+
+def _register_heif():
+    """Teach Pillow to open HEIC photos when pillow-heif is installed"""
+    global _heif_registered
+    if _heif_registered:
+        return
+    _heif_registered = True
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        logger.info("pillow-heif is not installed; HEIC uploads can't be read")
+        return
+    register_heif_opener()
+
+
+def _iter_chunks(source) -> Iterator[bytes]:
+    """Read a file object, bytes or memoryview in chunks"""
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        view = memoryview(source)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+
+
+class UploadPipeline:
+    """Stores uploads by content hash and prepares them for the model"""
+
+    def __init__(self, storage_dir: str = "data/uploads", max_workers: int = 4,
+                 max_file_mb: float = 25, max_image_side: int = 1568,
+                 max_image_mb: float = 3.75, max_text_chars: int = 20000,
+                 max_pages: int = 30, understanding=None):
+        """
+        Initialize upload pipeline
+
+        Args:
+            storage_dir: Directory for original files and processed results
+            max_workers: Files processed at the same time
+            max_file_mb: Largest upload accepted
+            max_image_side: Longest image edge sent to the model, in pixels
+            max_image_mb: Largest encoded image sent to the model
+            max_text_chars: Extracted text kept per file
+            max_pages: Pages read per document
+            understanding: UploadUnderstanding that transcribes processed files
+                           (None sends images and extracted text as they are)
+        """
+        self.storage_dir = storage_dir
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self.max_image_side = max_image_side
+        self.max_image_bytes = int(max_image_mb * 1024 * 1024)
+        self.max_text_chars = max_text_chars
+        self.max_pages = max_pages
+        self.understanding = understanding
+
+        os.makedirs(storage_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        # One job per content hash, so concurrent uploads of a file share the work
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {"submitted": 0, "stored": 0, "deduplicated": 0, "processed": 0, "errors": 0}
+        atexit.register(self.shutdown)
+
+    # ==================== Storage ====================
+
+    def _path(self, digest: str, suffix: str = "") -> str:
+        return os.path.join(self.storage_dir, digest[:2], digest + suffix)
+
+    def store(self, source) -> Dict[str, Any]:
+        """
+        Stream a file into content-addressed storage
+
+        Args:
+            source: File object, bytes or memoryview
+
+        Returns:
+            Dict with 'sha256', 'size', 'path' and 'deduplicated'
+
+        Raises:
+            UploadError: If the file is larger than the upload limit
+        """
+        os.makedirs(self.storage_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.storage_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in _iter_chunks(source):
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise UploadError(
+                            f"File is larger than {self.max_file_bytes // (1024 * 1024)} MB"
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self._path(sha256)
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._stats["deduplicated" if deduplicated else "stored"] += 1
+        return {"sha256": sha256, "size": size, "path": path, "deduplicated": deduplicated}
+
+    # ==================== Processing ====================
+
+    def submit(self, name: str, source, media_type: str = None, student_id: int = None) -> Future:
+        """
+        Store and process an upload on the worker pool
+
+        Args:
+            name: Original file name
+            source: File object, bytes or memoryview with the file content
+            media_type: MIME type reported by the browser
+            student_id: Student uploading the file (for usage accounting)
+
+        Returns:
+            Future resolving to the result dict (see process)
+        """
+        with self._lock:
+            self._stats["submitted"] += 1
+        return self._pool.submit(self.process, name, source, media_type, student_id)
+
+    def submit_many(self, files: List[Dict[str, Any]], student_id: int = None) -> List[Future]:
+        """Submit several uploads (dicts with 'name', 'source' and 'media_type')"""
+        return [self.submit(item["name"], item["source"], item.get("media_type"), student_id)
+                for item in files]
+
+    def process(self, name: str, source, media_type: str = None,
+                student_id: int = None) -> Dict[str, Any]:
+        """
+        Store an upload and prepare it for the model (runs on a worker)
+
+        Args:
+            name: Original file name
+            source: File object, bytes or memoryview with the file content
+            media_type: MIME type reported by the browser
+            student_id: Student uploading the file (for usage accounting)
+
+        Returns:
+            Dict with 'name', 'sha256', 'kind' ('image', 'text' or 'unsupported'),
+            'error' (None on success) and kind-specific details: 'media_type',
+            'width', 'height', 'bytes' for images; 'pages', 'chars', 'truncated'
+            for text; plus 'understanding' (see UploadUnderstanding.understand)
+            when understanding is configured
+        """
+        try:
+            stored = self.store(source)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning("Could not store upload %s: %s", name, e)
+            return {"name": name, "sha256": None, "kind": "unsupported", "error": str(e)}
+
+        sha256 = stored["sha256"]
+        with self._lock:
+            future = self._inflight.get(sha256)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[sha256] = future
+
+        if owner:
+            try:
+                future.set_result(self._process_stored(sha256, stored["path"], name, media_type))
+            except Exception as e:
+                logger.exception("Processing upload %s failed", name)
+                future.set_result({"sha256": sha256, "kind": "unsupported", "error": str(e)})
+            finally:
+                with self._lock:
+                    self._inflight.pop(sha256, None)
+
+        result = dict(future.result(), name=name)
+        if self.understanding is not None and not result.get("error"):
+            # Per upload, not shared with concurrent uploads of the file: hints are per student
+            result["understanding"] = self._understand(result, name, student_id)
+        with self._lock:
+            self._stats["errors" if result.get("error") else "processed"] += 1
+        return result
+
+    def _process_stored(self, sha256: str, path: str, name: str, media_type: Optional[str]) -> Dict[str, Any]:
+        """Process a stored file once; later uploads of the same content reuse the result"""
+        result_path = self._path(sha256, ".json")
+        try:
+            with open(result_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        extension = _extension(name)
+        if extension in IMAGE_EXTENSIONS or (media_type or "").startswith("image/"):
+            result = self._process_image(sha256, path)
+        elif extension in TEXT_EXTENSIONS or media_type in ("application/pdf", "text/plain"):
+            result = self._process_document(sha256, path, extension, media_type)
+        else:
+            result = {"kind": "unsupported", "error": f"Can't read .{extension or '?'} files yet"}
+        result["sha256"] = sha256
+
+        if not result.get("error"):
+            self._write_json(result_path, result)
+        return result
+
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _process_image(self, sha256: str, path: str) -> Dict[str, Any]:
+        """Downscale and re-encode an image to fit the model's limits"""
+        from PIL import Image, ImageOps
+
+        _register_heif()
+        try:
+            with Image.open(path) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((self.max_image_side, self.max_image_side))
+                has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+                if has_alpha:
+                    # Paste onto white: photos of worksheets don't need transparency
+                    rgba = image.convert("RGBA")
+                    image = Image.new("RGB", rgba.size, (255, 255, 255))
+                    image.paste(rgba, mask=rgba.split()[-1])
+                elif image.mode != "RGB":
+                    image = image.convert("RGB")
+
+                data = b""
+                for quality in (85, 75, 65, 50):
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+                    data = buffer.getvalue()
+                    if len(data) <= self.max_image_bytes:
+                        break
+                width, height = image.size
+        except Exception as e:
+            return {"kind": "unsupported", "error": f"Could not read image: {e}"}
+
+        if len(data) > self.max_image_bytes:
+            return {"kind": "unsupported", "error": "Image is too detailed to send even after compressing"}
+
+        with open(self._path(sha256, ".jpeg"), "wb") as f:
+            f.write(data)
+        return {"kind": "image", "media_type": "image/jpeg", "width": width, "height": height,
+                "bytes": len(data), "error": None}
+
+    def _process_document(self, sha256: str, path: str, extension: str,
+                          media_type: Optional[str]) -> Dict[str, Any]:
+        """Extract text page by page until the page or character cap"""
+        try:
+            if extension == "pdf" or media_type == "application/pdf":
+                pages = self._pdf_pages(path)
+            elif extension == "docx":
+                pages = self._docx_pages(path)
+            else:
+                pages = self._text_pages(path)
+
+            kept = []
+            chars = 0
+            truncated = False
+            for page in pages:
+                if len(kept) >= self.max_pages or chars >= self.max_text_chars:
+                    truncated = True
+                    break
+                page = page.strip()
+                if chars + len(page) > self.max_text_chars:
+                    page = page[:self.max_text_chars - chars]
+                    truncated = True
+                kept.append(page)
+                chars += len(page)
+        except ImportError as e:
+            return {"kind": "unsupported", "error": f"Text extraction is not available on this server ({e.name})"}
+        except Exception as e:
+            return {"kind": "unsupported", "error": f"Could not read document: {e}"}
+
+        if not any(kept):
+            return {"kind": "unsupported", "error": "No text found (a scanned PDF? Try a photo instead)"}
+
+        with open(self._path(sha256, ".txt"), "w", encoding="utf-8") as f:
+            f.write("\f".join(kept))
+        return {"kind": "text", "pages": len(kept), "chars": chars, "truncated": truncated, "error": None}
+
+    def _pdf_pages(self, path: str) -> Iterator[str]:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+    def _docx_pages(self, path: str) -> Iterator[str]:
+        with zipfile.ZipFile(path) as archive:
+            xml = archive.read("word/document.xml").decode("utf-8", errors="replace")
+        for page_xml in xml.split(_DOCX_PAGE_BREAK):
+            yield "\n".join(
+                "".join(_DOCX_TEXT_RE.findall(paragraph))
+                for paragraph in _DOCX_PARAGRAPH_RE.findall(page_xml)
+            )
+
+    def _text_pages(self, path: str) -> Iterator[str]:
+        # Form feeds separate pages in plain text; read no more than the cap needs
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read(self.max_text_chars + self.max_pages)
+        yield from text.split("\f")
+
+    def _understand(self, result: Dict[str, Any], name: str, student_id: Optional[int]) -> Dict[str, Any]:
+        """Transcribe a processed file (cached across uploads of the same worksheet)"""
+        suffix = ".jpeg" if result["kind"] == "image" else ".txt"
+        named = dict(result, name=name)
+        return self.understanding.understand(
+            named, self._path(result["sha256"], suffix), self._raw_blocks([named]), student_id=student_id
+        )
+
+    # ==================== Model Input ====================
+
+    def content_blocks(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Build AI content blocks for processed uploads
+
+        Args:
+            results: Result dicts from process (failed ones are skipped)
+
+        Returns:
+            A text block with the transcription of each understood upload, and
+            image blocks (base64 JPEG) or text blocks with the extracted pages
+            for the rest (followed by the earlier transcription when it is only
+            a hint)
+        """
+        blocks = []
+        for result in results:
+            understanding = result.get("understanding")
+            name = result.get('name', 'document')
+            if not understanding or understanding["error"] or result.get("error"):
+                blocks.extend(self._raw_blocks([result]))
+            elif understanding.get("hint"):
+                blocks.extend(self._raw_blocks([result]))
+                blocks.append({
+                    "type": "text",
+                    "text": f"Transcription of an earlier, similar upload by this student - it may not "
+                            f"match '{name}' above, so go by the image:\n\n{understanding['transcription']}"
+                })
+            else:
+                blocks.append({
+                    "type": "text",
+                    "text": f"Attached file '{name}' (transcribed):\n\n{understanding['transcription']}"
+                })
+        return blocks
+
+    def _raw_blocks(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Image blocks and extracted-text blocks for processed uploads"""
+        blocks = []
+        for result in results:
+            if result.get("error") or not result.get("sha256"):
+                continue
+            if result["kind"] == "image":
+                with open(self._path(result["sha256"], ".jpeg"), "rb") as f:
+                    data = base64.standard_b64encode(f.read()).decode("ascii")
+                blocks.append({
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": result["media_type"], "data": data}
+                })
+            elif result["kind"] == "text":
+                with open(self._path(result["sha256"], ".txt"), encoding="utf-8") as f:
+                    pages = f.read().split("\f")
+                body = "\n\n".join(
+                    f"--- Page {number} ---\n{page}" for number, page in enumerate(pages, 1)
+                )
+                note = " (truncated)" if result.get("truncated") else ""
+                blocks.append({
+                    "type": "text",
+                    "text": f"Attached file '{result.get('name', 'document')}'{note}:\n\n{body}"
+                })
+        return blocks
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get counts of submitted, stored, deduplicated, processed and failed uploads"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_progress"] = len(self._inflight)
+        return stats
+
+    def shutdown(self):
+        """Stop the worker pool (running jobs finish)"""
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,310 @@
+"""Upload understanding - AI transcriptions of attachments, cached by content
+
+The first upload of a worksheet pays for one model call that transcribes it
+and pulls out the problems; the chat then sends that text instead of the
+image. Later uploads of the same content reuse the transcription without
+calling the model: images are keyed by a hash of their re-encoded pixels and
+documents by a hash of their whitespace-normalized text, so the same
+worksheet as PDF, DOCX or TXT is understood once. Keys also include a hash of
+the transcription prompts and route, so changing either starts fresh entries.
+Entries are kept in a size-bounded disk cache shared by every student, with a
+small in-memory layer in front.
+
+Only exact content is shared. Optionally, a photo close to one the same
+student uploaded before (by perceptual hash) gets the earlier transcription
+as a hint, and the image is still sent: two sheets with the same layout and
+different numbers or names hash almost alike.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from ..utils.cache import LRUCache
+from ..utils.math_prerender import DiskLRU
+
+
+logger = logging.getLogger(__name__)
+
+# Difference hash of a HASH_SIZE x HASH_SIZE grid (256 bits)
+HASH_SIZE = 16
+
+# Key prefixes in the disk cache (also its subdirectory names)
+IMAGE_PREFIX = "p"
+TEXT_PREFIX = "t"
+
+# Photos of the same page crop slightly differently; a hint must keep the shape
+MAX_ASPECT_DIFFERENCE = 0.03
+
+# Earlier uploads per student considered for hints
+HINT_HISTORY = 20
+
+PROBLEMS_MARKER = "PROBLEMS:"
+
+UNDERSTANDING_PROMPT = f"""Transcribe this attachment from a student for a math tutor.
+
+Write out all of its text and math exactly, using $...$ for math, and describe any diagram, graph or table in words.
+Then write a line containing only "{PROBLEMS_MARKER}" followed by each problem or question the student may ask about, one per line, numbered as in the original.
+Do not solve anything."""
+
+UNDERSTANDING_SYSTEM = "You transcribe students' math worksheets, photos and documents accurately."
+
+
+def understanding_version(route: Dict[str, Any]) -> str:
+    """
+    Version of the transcriptions a route produces
+
+    Args:
+        route: The 'transcribe' route (see AIClient.get_route)
+
+    Returns:
+        Short hash of the prompts, model, token limit and temperature
+    """
+    shape = [UNDERSTANDING_SYSTEM, UNDERSTANDING_PROMPT, route.get("model"),
+             route.get("max_tokens"), route.get("temperature")]
+    return hashlib.sha256(json.dumps(shape).encode("utf-8")).hexdigest()[:16]
+
+
+def image_hash(path: str) -> int:
+    """
+    Perceptual difference hash of an image
+
+    Args:
+        path: Image file
+
+    Returns:
+        256-bit hash; near-identical images differ in few bits
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        gray = ImageOps.autocontrast(image.convert("L"))
+        pixels = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def text_key(text: str, version: str = "") -> str:
+    """Cache key for document text (ignores spacing and page breaks, not case: f(X) is not f(x))"""
+    normalized = " ".join(text.split())
+    return TEXT_PREFIX + hashlib.sha256(f"{version}:{normalized}".encode("utf-8")).hexdigest()
+
+
+def pixel_key(path: str, version: str = "") -> str:
+    """Cache key for an image (the same pixels always map to one entry per version)"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        digest = hashlib.sha256(f"{version}:{image.mode}:{image.size}:".encode("utf-8"))
+        digest.update(image.tobytes())
+    return IMAGE_PREFIX + digest.hexdigest()
+
+
+def _parse_understanding(content: str) -> Dict[str, str]:
+    """Split the model's reply into the transcription and the problem list"""
+    transcription, marker, problems = content.partition(PROBLEMS_MARKER)
+    if not marker:
+        return {"transcription": content.strip(), "problem_text": ""}
+    return {"transcription": transcription.strip(), "problem_text": problems.strip()}
+
+
+class UploadUnderstanding:
+    """Transcribes attachments with the AI once per distinct content"""
+
+    def __init__(self, ai_client, cache_dir: str = "data/understanding",
+                 max_bytes: int = 64 * 1024 * 1024, memory_entries: int = 512,
+                 max_distance: int = 0):
+        """
+        Initialize upload understanding
+
+        Args:
+            ai_client: AI client used for transcription calls (task 'transcribe')
+            cache_dir: Directory for cached transcriptions
+            max_bytes: Disk space for cached transcriptions
+            memory_entries: Transcriptions also kept in process memory
+            max_distance: Bits (of 256) in which a photo's perceptual hash may differ
+                          from one the same student uploaded before for the earlier
+                          transcription to be sent as a hint (0 = no hints)
+        """
+        self.ai = ai_client
+        self.version = understanding_version(ai_client.get_route("transcribe"))
+        self.max_distance = max_distance
+        self.disk = DiskLRU(cache_dir, max_bytes)
+        self._memory = LRUCache(max_size=memory_entries, name="upload_understanding")
+        # student_id -> [(perceptual hash, cache key, aspect)], newest last
+        self._recent_images = LRUCache(max_size=memory_entries, name="upload_understanding_hints")
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "hints": 0, "misses": 0, "failures": 0,
+                       "tokens_saved": 0}
+
+    # ==================== Cache ====================
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+        raw = self.disk.get(key)
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return None
+        self._memory.set(key, entry)
+        return entry
+
+    def _similar_image(self, student_id: Optional[int], path: str, key: str,
+                       aspect: float) -> Optional[Dict[str, Any]]:
+        """Transcription of a photo close to one this student uploaded before"""
+        if not self.max_distance or student_id is None:
+            return None
+        value = image_hash(path)
+        with self._lock:
+            history = [item for item in self._recent_images.get(student_id, []) if item[1] != key]
+            self._recent_images.set(student_id, (history + [(value, key, aspect)])[-HINT_HISTORY:])
+
+        candidates = sorted(
+            (bin(cached ^ value).count("1"), cached_key)
+            for cached, cached_key, cached_aspect in history
+            if abs(cached_aspect - aspect) <= MAX_ASPECT_DIFFERENCE
+        )
+        for distance, cached_key in candidates:
+            if distance > self.max_distance:
+                break
+            entry = self._get(cached_key)
+            if entry is not None:
+                return entry
+        return None
+
+    def lookup(self, result: Dict[str, Any], path: str) -> Dict[str, Any]:
+        """
+        Find the cache key and any cached transcription for a processed upload
+
+        Args:
+            result: UploadPipeline result ('kind' image or text)
+            path: Processed file (the re-encoded JPEG or the extracted text)
+
+        Returns:
+            Dict with 'key' and 'entry' (None on a miss)
+        """
+        if result["kind"] == "image":
+            key = pixel_key(path, self.version)
+        else:
+            with open(path, encoding="utf-8") as f:
+                key = text_key(f.read(), self.version)
+        entry = self._get(key)
+        if entry is not None:
+            self._count("exact_hits", entry)
+        return {"key": key, "entry": entry}
+
+    def _count(self, outcome: str, entry: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._stats[outcome] += 1
+            if entry is not None:
+                self._stats["tokens_saved"] += entry.get("tokens", 0)
+
+    # ==================== Understanding ====================
+
+    def understand(self, result: Dict[str, Any], path: str, blocks: List[Dict[str, Any]],
+                   student_id: int = None) -> Dict[str, Any]:
+        """
+        Transcribe a processed upload, from the cache when possible
+
+        Args:
+            result: UploadPipeline result ('kind' image or text)
+            path: Processed file (the re-encoded JPEG or the extracted text)
+            blocks: Content blocks for the upload, sent to the model on a miss
+            student_id: Student the upload belongs to (for usage accounting and hints)
+
+        Returns:
+            Dict with 'transcription', 'problem_text', 'cached' (bool), 'hint'
+            (True when the transcription is of a similar earlier upload and the
+            upload itself must still be sent) and 'error' (None on success; the
+            caller falls back to the raw upload)
+        """
+        try:
+            found = self.lookup(result, path)
+            entry = found["entry"]
+            hint = None
+            if result["kind"] == "image":
+                # Remembered for this student's later uploads even on an exact hit
+                hint = self._similar_image(student_id, path, found["key"],
+                                           result["width"] / result["height"])
+        except Exception as e:
+            logger.warning("Could not hash upload %s: %s", result.get("sha256"), e)
+            return {"transcription": "", "problem_text": "", "cached": False, "hint": False,
+                    "error": str(e)}
+
+        if entry is not None:
+            return {"transcription": entry["transcription"], "problem_text": entry["problem_text"],
+                    "cached": True, "hint": False, "error": None}
+        if hint is not None:
+            self._count("hints")
+            return {"transcription": hint["transcription"], "problem_text": hint["problem_text"],
+                    "cached": True, "hint": True, "error": None}
+
+        self._count("misses")
+        try:
+            response = self.ai.create_message(
+                system=UNDERSTANDING_SYSTEM,
+                messages=[{"role": "user", "content": blocks + [{"type": "text", "text": UNDERSTANDING_PROMPT}]}],
+                task="transcribe",
+                student_id=student_id
+            )
+        except Exception as e:
+            self._count("failures")
+            logger.warning("Transcribing upload %s failed: %s", result.get("sha256"), e)
+            return {"transcription": "", "problem_text": "", "cached": False, "hint": False,
+                    "error": str(e)}
+
+        entry = _parse_understanding(response["content"])
+        entry["model"] = response["model"]
+        entry["tokens"] = response["usage"]["input_tokens"] + response["usage"]["output_tokens"]
+        entry["created"] = time.time()
+
+        self.disk.set(found["key"], json.dumps(entry))
+        self._memory.set(found["key"], entry)
+        return {"transcription": entry["transcription"], "problem_text": entry["problem_text"],
+                "cached": False, "hint": False, "error": None}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get exact hits, hints, misses, failures, tokens saved and cache layer statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["exact_hits"] + stats["hints"] + stats["misses"]
+        stats["hit_ratio"] = stats["exact_hits"] / lookups if lookups else 0.0
+        stats["memory"] = self._memory.get_stats()
+        stats["disk"] = self.disk.get_stats()
+        return stats
+
+
+def create_understanding(ai_client, settings: Dict[str, Any] = None) -> Optional[UploadUnderstanding]:
+    """
+    Build upload understanding from config (uploads.understanding)
+
+    Args:
+        ai_client: AI client used for transcription calls
+        settings: Dict with 'enabled', 'cache_dir', 'max_mb', 'memory_entries'
+                  and 'max_distance'
+
+    Returns:
+        UploadUnderstanding, or None when disabled
+    """
+    settings = settings or {}
+    if not settings.get("enabled", True):
+        return None
+    return UploadUnderstanding(
+        ai_client,
+        cache_dir=settings.get("cache_dir", "data/understanding"),
+        max_bytes=int(settings.get("max_mb", 64) * 1024 * 1024),
+        memory_entries=settings.get("memory_entries", 512),
+        max_distance=settings.get("max_distance", 0)
+    )
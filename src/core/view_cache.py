@@ -0,0 +1,62 @@
+"""View-model cache - read-through cache for sidebar and dashboard data"""
+
+from typing import Dict, List, Optional
+
+from ..database.models import Student
+from ..utils.cache import LRUCache
+from .student_manager import StudentManager
+
+
+class ViewCache:
+    """Caches the student list and per-student summaries between reruns
+
+    Entries are only dropped when DatabaseManager reports a write that affects
+    them, so a rerun that changes no data does no database work.
+    """
+
+    STUDENTS_KEY = ("students",)
+
+    def __init__(self, student_manager: StudentManager, max_students: int = 256):
+        """
+        Initialize view cache and subscribe to database write events
+
+        Args:
+            student_manager: Student manager used to load data on a miss
+            max_students: Maximum number of student summaries kept
+        """
+        self.student_manager = student_manager
+        self.cache = LRUCache(max_size=max_students + 1, name="view_models")
+        student_manager.db.add_listener(self.handle_event)
+
+    def get_all_students(self) -> List[Student]:
+        """Get all active students (cached)"""
+        return self.cache.get_or_compute(
+            self.STUDENTS_KEY, self.student_manager.get_all_students
+        )
+
+    def get_student_summary(self, student_id: int) -> Optional[Dict]:
+        """Get a student's summary (cached per student)"""
+        return self.cache.get_or_compute(
+            ("summary", student_id),
+            lambda: self.student_manager.get_student_summary(student_id)
+        )
+
+    def invalidate_student(self, student_id: int):
+        """Drop everything cached for one student"""
+        self.cache.pop(("summary", student_id))
+
+    def handle_event(self, event: str, student_id: int = None, **data):
+        """
+        Invalidate entries affected by a database write
+
+        Args:
+            event: Write event name from DatabaseManager
+            student_id: Student the write belongs to
+        """
+        if event in ("student_created", "student_updated"):
+            # The cached list holds Student rows, so an updated student must
+            # be reloaded there too
+            self.cache.pop(self.STUDENTS_KEY)
+        if event != "student_created" and student_id is not None:
+            # student_updated, session_created/ended, message_added, progress_updated
+            self.invalidate_student(student_id)
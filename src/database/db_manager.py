@@ -1,14 +1,26 @@
 """Database manager - handles database connections and operations"""
 
 import os
-from typing import Optional, List, Dict, Any
+import logging
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from collections import Counter
 from contextlib import contextmanager
-from sqlalchemy import create_engine, and_, or_, desc
+from sqlalchemy import create_engine, and_, or_, desc, func, select, update
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import sessionmaker, Session as DBSession
 from sqlalchemy.pool import StaticPool
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from .models import Base, Student, Session, Message, Progress, StudyMaterial, PracticeProblem
+from ..utils import metrics, tracing
+from .models import (
+    Base, Student, Session, Message, Progress, StudyMaterial, PracticeProblem,
+    TokenUsage, TokenUsageDaily, TokenEpoch, PROGRESS_KEY, TOKEN_USAGE_DAILY_KEY
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 class DatabaseManager:
@@ -30,27 +42,192 @@ class DatabaseManager:
         self.database_url = database_url
         
         # Special handling for SQLite
-        if database_url.startswith("sqlite"):
+        if database_url.startswith("sqlite") and (":memory:" in database_url or database_url == "sqlite://"):
+            # In-memory database: every thread must share the one connection
             self.engine = create_engine(
                 database_url,
                 connect_args={"check_same_thread": False},
                 poolclass=StaticPool,
                 echo=False
             )
+        elif database_url.startswith("sqlite"):
+            # One connection per concurrent session - a single shared sqlite3
+            # connection breaks when sessions on several threads commit at once
+            self.engine = create_engine(
+                database_url,
+                connect_args={"check_same_thread": False, "timeout": 30},
+                pool_size=10,
+                max_overflow=20,
+                echo=False
+            )
+            
+            # Let concurrent writers (and several app processes) share the file
+            @sqlalchemy_event.listens_for(self.engine, "connect")
+            def _configure_sqlite(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA busy_timeout=5000")
+                cursor.close()
         else:
             # PostgreSQL or other databases
             self.engine = create_engine(database_url, echo=False)
         
+        # SQL statements show up as spans in chat turn and practice traces,
+        # and are counted per calling method
+        tracing.instrument_engine(self.engine)
+        metrics.instrument_engine(self.engine)
+        
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        
+        # Write-event listeners (cache invalidation)
+        self._listeners: List[Callable[..., None]] = []
+        
+        # Opt-in statement profiler (see enable_profiler)
+        self.profiler = None
     
     def create_tables(self):
-        """Create all tables in the database"""
+        """Create all tables in the database, and unique keys added to existing ones"""
         Base.metadata.create_all(bind=self.engine)
+        for index, merge in ((PROGRESS_KEY, self._merge_progress),
+                             (TOKEN_USAGE_DAILY_KEY, self._merge_token_usage_daily)):
+            try:
+                with self.get_session() as db_session:
+                    # Rows written before the key existed may collide
+                    merged = merge(db_session)
+                    db_session.execute(CreateIndex(index, if_not_exists=True))
+                if merged:
+                    logger.info("Merged %d duplicate %s rows", merged, index.table.name)
+            except DBAPIError:
+                logger.warning("Could not create unique index %s on %s",
+                               index.name, index.table.name, exc_info=True)
+    
+    @staticmethod
+    def _merge_progress(db_session: DBSession) -> int:
+        """Fold progress rows sharing a student, topic and subtopic into the oldest one"""
+        key = (Progress.student_id, Progress.topic, func.coalesce(Progress.subtopic, ""))
+        groups = db_session.query(
+            func.min(Progress.id), func.sum(Progress.attempts), func.sum(Progress.successes),
+            func.min(Progress.first_attempted), func.max(Progress.last_practiced), *key
+        ).group_by(*key).having(func.count() > 1).all()
+        
+        removed = 0
+        for keep_id, attempts, successes, first_attempted, last_practiced, *values in groups:
+            db_session.query(Progress).filter(Progress.id == keep_id).update({
+                Progress.attempts: attempts,
+                Progress.successes: successes,
+                Progress.accuracy: successes / attempts if attempts else 0.0,
+                Progress.first_attempted: first_attempted,
+                Progress.last_practiced: last_practiced
+            }, synchronize_session=False)
+            removed += db_session.query(Progress).filter(
+                and_(*[column == value for column, value in zip(key, values)]),
+                Progress.id != keep_id
+            ).delete(synchronize_session=False)
+        return removed
+    
+    @staticmethod
+    def _merge_token_usage_daily(db_session: DBSession) -> int:
+        """Fold daily rollup rows sharing a key into the oldest one"""
+        key = (TokenUsageDaily.day, func.coalesce(TokenUsageDaily.student_id, 0),
+               TokenUsageDaily.task, TokenUsageDaily.model)
+        totals = ("calls", "input_tokens", "output_tokens", "cache_creation_tokens",
+                  "cache_read_tokens", "cost")
+        groups = db_session.query(
+            func.min(TokenUsageDaily.id),
+            *[func.sum(getattr(TokenUsageDaily, name)) for name in totals],
+            *key
+        ).group_by(*key).having(func.count() > 1).all()
+        
+        removed = 0
+        for row in groups:
+            keep_id, sums, values = row[0], row[1:len(totals) + 1], row[len(totals) + 1:]
+            db_session.query(TokenUsageDaily).filter(TokenUsageDaily.id == keep_id).update(
+                dict(zip(totals, sums)), synchronize_session=False
+            )
+            removed += db_session.query(TokenUsageDaily).filter(
+                and_(*[column == value for column, value in zip(key, values)]),
+                TokenUsageDaily.id != keep_id
+            ).delete(synchronize_session=False)
+        return removed
     
     def drop_tables(self):
         """Drop all tables (use with caution!)"""
         Base.metadata.drop_all(bind=self.engine)
     
+    def enable_profiler(self, slow_ms: float = 100.0, n_plus_one_threshold: int = 5,
+                        explain: bool = True):
+        """
+        Attach the SQL statement profiler to this database
+        
+        Args:
+            slow_ms: Statements at least this slow are captured with their plan
+            n_plus_one_threshold: Repeats of one statement shape within a request
+                                  that count as a suspected N+1
+            explain: Run EXPLAIN on slow statements
+        
+        Returns:
+            The attached QueryProfiler
+        """
+        from .query_profiler import QueryProfiler
+        
+        if self.profiler is None:
+            self.profiler = QueryProfiler(self.engine, slow_ms=slow_ms,
+                                          n_plus_one_threshold=n_plus_one_threshold,
+                                          explain=explain)
+        self.profiler.attach()
+        return self.profiler
+    
+    def get_pool_status(self) -> Dict[str, Any]:
+        """
+        Get the connection pool state (read from the pool, no query is run)
+        
+        Returns:
+            Dict with 'pool' (class name), 'size', 'checked_out', 'checked_in'
+            and 'overflow'; counts are None for pools that don't track them
+        """
+        pool = self.engine.pool
+        status = {"pool": type(pool).__name__, "size": None, "checked_out": None,
+                  "checked_in": None, "overflow": None}
+        for key, attr in (("size", "size"), ("checked_out", "checkedout"),
+                          ("checked_in", "checkedin"), ("overflow", "overflow")):
+            method = getattr(pool, attr, None)
+            if callable(method):
+                status[key] = method()
+        if status["overflow"] is not None:
+            # QueuePool reports unused base capacity as negative overflow
+            status["overflow"] = max(status["overflow"], 0)
+        return status
+    
+    # ==================== Write Events ====================
+    
+    def add_listener(self, listener: Callable[..., None]):
+        """
+        Subscribe to write events
+        
+        Listeners are called as listener(event, **data) after the write commits.
+        Events: student_created, student_updated, session_created, session_ended
+        (expired=True when ended for inactivity), message_added, progress_updated,
+        tokens_revoked. Events relayed from another replica carry _remote=True.
+        
+        Args:
+            listener: Callable receiving the event name and keyword data
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[..., None]):
+        """Unsubscribe from write events"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def notify(self, event: str, **data):
+        """Send a write event to all listeners"""
+        for listener in list(self._listeners):
+            try:
+                listener(event, **data)
+            except Exception:
+                logger.exception("Write event listener failed for %s", event)
+    
     @contextmanager
     def get_session(self):
         """Context manager for database sessions"""
@@ -75,7 +252,9 @@ class DatabaseManager:
             db_session.refresh(student)
             # Expunge to detach from session so it can be used outside
             db_session.expunge(student)
-            return student
+        
+        self.notify("student_created", student_id=student.id)
+        return student
     
     def get_student(self, student_id: int) -> Optional[Student]:
         """Get student by ID"""
@@ -111,6 +290,8 @@ class DatabaseManager:
             student = db_session.query(Student).filter(Student.id == student_id).first()
             if student:
                 student.last_active = datetime.utcnow()
+        
+        self.notify("student_updated", student_id=student_id)
     
     # ==================== Session Operations ====================
     
@@ -127,7 +308,9 @@ class DatabaseManager:
             db_session.flush()
             db_session.refresh(new_session)
             db_session.expunge(new_session)
-            return new_session
+        
+        self.notify("session_created", student_id=student_id, session_id=new_session.id)
+        return new_session
     
     def get_tutoring_session(self, session_id: int) -> Optional[Session]:
         """Get tutoring session by ID"""
@@ -138,11 +321,11 @@ class DatabaseManager:
             return sess
     
     def get_active_session(self, student_id: int) -> Optional[Session]:
-        """Get student's active session if any"""
+        """Get student's newest active session if any"""
         with self.get_session() as db_session:
             sess = db_session.query(Session).filter(
                 and_(Session.student_id == student_id, Session.is_active == True)
-            ).first()
+            ).order_by(desc(Session.id)).first()
             if sess:
                 db_session.expunge(sess)
             return sess
@@ -161,9 +344,97 @@ class DatabaseManager:
         """End a session"""
         with self.get_session() as db_session:
             sess = db_session.query(Session).filter(Session.id == session_id).first()
-            if sess:
-                sess.is_active = False
-                sess.end_time = datetime.utcnow()
+            if not sess:
+                return
+            sess.is_active = False
+            sess.end_time = datetime.utcnow()
+            student_id = sess.student_id
+        
+        self.notify("session_ended", student_id=student_id, session_id=session_id)
+    
+    def get_active_session_activity(self, idle_before: datetime = None,
+                                    limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Get active sessions with their last activity (newest message, or start)
+        
+        Args:
+            idle_before: Only sessions with no activity since this time (UTC)
+            limit: Maximum sessions returned
+        
+        Returns:
+            List of dicts with 'session_id', 'student_id' and 'last_activity',
+            oldest session first
+        """
+        with self.get_session() as db_session:
+            last_activity = func.coalesce(func.max(Message.timestamp), Session.start_time)
+            query = db_session.query(Session.id, Session.student_id, last_activity).outerjoin(
+                Message, Message.session_id == Session.id
+            ).filter(Session.is_active == True).group_by(
+                Session.id, Session.student_id, Session.start_time
+            ).order_by(Session.id)
+            if idle_before is not None:
+                query = query.having(last_activity < idle_before)
+            if limit:
+                query = query.limit(limit)
+            rows = query.all()
+        
+        return [
+            {"session_id": session_id, "student_id": student_id, "last_activity": activity}
+            for session_id, student_id, activity in rows
+        ]
+    
+    def end_idle_sessions(self, idle_before: datetime, limit: int = 500) -> List[Tuple[int, int]]:
+        """
+        End a batch of sessions idle since a cutoff, in one UPDATE
+        
+        Each session's end time is set to its last activity, not the time of
+        the sweep, so session durations stay accurate. The UPDATE re-checks
+        idleness, so a session that got a message (or was ended) after the
+        batch was selected is left alone, and only sessions this call ended
+        are reported and notified.
+        
+        Args:
+            idle_before: Sessions with no activity since this time (UTC) are ended
+            limit: Maximum sessions ended
+        
+        Returns:
+            List of (session_id, student_id) for the sessions ended
+        """
+        idle = self.get_active_session_activity(idle_before=idle_before, limit=limit)
+        if not idle:
+            return []
+        
+        session_ids = [row["session_id"] for row in idle]
+        last_message = select(func.max(Message.timestamp)).where(
+            Message.session_id == Session.id
+        ).scalar_subquery()
+        last_activity = func.coalesce(last_message, Session.start_time)
+        statement = update(Session).where(
+            Session.id.in_(session_ids),
+            Session.is_active == True,
+            last_activity < idle_before
+        ).values(is_active=False, end_time=last_activity).execution_options(synchronize_session=False)
+        
+        with self.get_session() as db_session:
+            if self.engine.dialect.update_returning:
+                ended = [tuple(row) for row in db_session.execute(
+                    statement.returning(Session.id, Session.student_id)
+                )]
+            else:
+                # Without RETURNING, re-read the batch inside the same transaction
+                db_session.execute(statement)
+                ended = [tuple(row) for row in db_session.execute(
+                    select(Session.id, Session.student_id).where(
+                        Session.id.in_(session_ids),
+                        Session.is_active == False,
+                        Session.end_time < idle_before
+                    )
+                )]
+        
+        ended.sort()
+        for session_id, student_id in ended:
+            self.notify("session_ended", student_id=student_id, session_id=session_id, expired=True)
+        return ended
     
     # ==================== Message Operations ====================
     
@@ -182,7 +453,31 @@ class DatabaseManager:
             db_session.flush()
             db_session.refresh(message)
             db_session.expunge(message)
-            return message
+            
+            student_id = None
+            if self._listeners:
+                student_id = db_session.query(Session.student_id).filter(
+                    Session.id == session_id
+                ).scalar()
+        
+        if student_id is not None:
+            self.notify("message_added", student_id=student_id, session_id=session_id)
+        return message
+    
+    def update_message_metadata(self, updates: Dict[int, Dict]):
+        """
+        Merge keys into the metadata of several messages in one transaction
+        
+        Args:
+            updates: Dict mapping message ID to the metadata keys to set
+        """
+        if not updates:
+            return
+        with self.get_session() as db_session:
+            messages = db_session.query(Message).filter(Message.id.in_(list(updates))).all()
+            for message in messages:
+                # Assign a new dict; in-place changes to a JSON column aren't tracked
+                message.message_metadata = {**(message.message_metadata or {}), **updates[message.id]}
     
     def get_session_messages(self, session_id: int, limit: int = None) -> List[Message]:
         """Get messages for a session"""
@@ -199,6 +494,24 @@ class DatabaseManager:
                 db_session.expunge(msg)
             return messages
     
+    def get_message_counts(self, student_id: int) -> Dict[int, int]:
+        """
+        Count messages per session for a student in one grouped query
+        
+        Args:
+            student_id: Student ID
+        
+        Returns:
+            Dict mapping session ID to message count (sessions without messages omitted)
+        """
+        with self.get_session() as db_session:
+            rows = db_session.query(
+                Message.session_id, func.count(Message.id)
+            ).join(Session, Session.id == Message.session_id).filter(
+                Session.student_id == student_id
+            ).group_by(Message.session_id).all()
+            return {session_id: count for session_id, count in rows}
+    
     def get_recent_messages(self, session_id: int, limit: int = 10) -> List[Message]:
         """Get recent messages from a session"""
         with self.get_session() as db_session:
@@ -211,45 +524,72 @@ class DatabaseManager:
     
     # ==================== Progress Operations ====================
     
+    @staticmethod
+    def _add_progress(db_session: DBSession, student_id: int, topic: str, subtopic: Optional[str],
+                      attempts: int, successes: int, skill_level: str = None):
+        """
+        Add attempts to a progress row in SQL, creating the row if there is none
+        
+        Concurrent writers never overwrite each other's counts; when two create
+        the row at once, the unique key makes one fail with IntegrityError and
+        the caller retries its transaction.
+        """
+        now = datetime.utcnow()
+        values = {
+            Progress.attempts: Progress.attempts + attempts,
+            Progress.successes: Progress.successes + successes,
+            Progress.accuracy: (Progress.successes + successes) * 1.0 / (Progress.attempts + attempts),
+            Progress.last_practiced: now
+        }
+        if skill_level:
+            values[Progress.skill_level] = skill_level
+        
+        updated = db_session.query(Progress).filter(
+            and_(
+                Progress.student_id == student_id,
+                Progress.topic == topic,
+                Progress.subtopic == subtopic
+            )
+        ).update(values, synchronize_session=False)
+        
+        if not updated:
+            db_session.add(Progress(
+                student_id=student_id,
+                topic=topic,
+                subtopic=subtopic,
+                attempts=attempts,
+                successes=successes,
+                accuracy=successes / attempts,
+                skill_level=skill_level or "beginner",
+                first_attempted=now,
+                last_practiced=now
+            ))
+            db_session.flush()
+    
     def update_progress(self, student_id: int, topic: str, subtopic: str = None,
                        success: bool = True, skill_level: str = None) -> Progress:
         """Update or create progress record"""
-        with self.get_session() as db_session:
-            # Find existing progress record
-            progress = db_session.query(Progress).filter(
-                and_(
-                    Progress.student_id == student_id,
-                    Progress.topic == topic,
-                    Progress.subtopic == subtopic
-                )
-            ).first()
-            
-            if progress:
-                # Update existing
-                progress.attempts += 1
-                if success:
-                    progress.successes += 1
-                progress.accuracy = progress.successes / progress.attempts if progress.attempts > 0 else 0.0
-                progress.last_practiced = datetime.utcnow()
-                if skill_level:
-                    progress.skill_level = skill_level
-            else:
-                # Create new
-                progress = Progress(
-                    student_id=student_id,
-                    topic=topic,
-                    subtopic=subtopic,
-                    attempts=1,
-                    successes=1 if success else 0,
-                    accuracy=1.0 if success else 0.0,
-                    skill_level=skill_level or "beginner"
-                )
-                db_session.add(progress)
-            
-            db_session.flush()
-            db_session.refresh(progress)
-            db_session.expunge(progress)
-            return progress
+        for attempt in range(2):
+            try:
+                with self.get_session() as db_session:
+                    self._add_progress(db_session, student_id, topic, subtopic,
+                                       1, 1 if success else 0, skill_level)
+                    progress = db_session.query(Progress).filter(
+                        and_(
+                            Progress.student_id == student_id,
+                            Progress.topic == topic,
+                            Progress.subtopic == subtopic
+                        )
+                    ).one()
+                    db_session.expunge(progress)
+                break
+            except IntegrityError:
+                # Another process created the row first - add to it instead
+                if attempt:
+                    raise
+        
+        self.notify("progress_updated", student_id=student_id, topic=topic)
+        return progress
     
     def get_student_progress(self, student_id: int, topic: str = None) -> List[Progress]:
         """Get student's progress records"""
@@ -360,3 +700,335 @@ class DatabaseManager:
                 db_session.expunge(prob)
             return problems
 
+    
+    def bulk_create_practice_problems(self, problems: List[Dict]) -> List[int]:
+        """
+        Create many practice problems with one bulk insert
+        
+        Problems a student already has (same topic and text) are reused instead of
+        being inserted again, so re-recording a practice set is harmless.
+        
+        Args:
+            problems: List of dicts with PracticeProblem column values
+        
+        Returns:
+            List of practice problem IDs in problems order
+        """
+        if not problems:
+            return []
+        
+        with self.get_session() as db_session:
+            student_ids = {p["student_id"] for p in problems}
+            texts = {p["problem_text"] for p in problems}
+            existing = {}
+            for problem_id, student_id, topic, text in db_session.query(
+                PracticeProblem.id, PracticeProblem.student_id,
+                PracticeProblem.topic, PracticeProblem.problem_text
+            ).filter(
+                PracticeProblem.student_id.in_(student_ids),
+                PracticeProblem.problem_text.in_(texts)
+            ).all():
+                existing[(student_id, topic, text)] = problem_id
+            
+            new_problems = {}
+            for p in problems:
+                key = (p["student_id"], p["topic"], p["problem_text"])
+                if key not in existing and key not in new_problems:
+                    new_problems[key] = PracticeProblem(**p)
+            
+            db_session.add_all(new_problems.values())
+            db_session.flush()
+            
+            for key, problem in new_problems.items():
+                existing[key] = problem.id
+            
+            return [existing[(p["student_id"], p["topic"], p["problem_text"])] for p in problems]
+    
+    def record_practice_results(self, student_id: int, topic: str, difficulty: str,
+                                attempts: List[Dict]) -> List[int]:
+        """
+        Record graded practice attempts and the topic progress in one transaction
+        
+        Args:
+            student_id: Student ID
+            topic: Practice topic
+            difficulty: Practice difficulty
+            attempts: List of dicts with 'problem_text', 'correct_answer', 'student_answer',
+                      'is_correct', and optionally 'problem_id', 'feedback',
+                      'solution_explanation', 'problem_type'
+        
+        Returns:
+            List of practice problem IDs in attempts order
+        
+        Raises:
+            ValueError: If a given problem_id is not one of the student's problems
+        """
+        if not attempts:
+            return []
+        
+        for retry in range(2):
+            try:
+                problem_ids = self._write_practice_results(student_id, topic, difficulty, attempts)
+                break
+            except IntegrityError:
+                # Another writer created the topic's progress row first - add to it instead
+                if retry:
+                    raise
+        
+        self.notify("progress_updated", student_id=student_id, topic=topic)
+        return problem_ids
+    
+    def _write_practice_results(self, student_id: int, topic: str, difficulty: str,
+                                attempts: List[Dict]) -> List[int]:
+        """One transaction of record_practice_results"""
+        now = datetime.utcnow()
+        
+        with self.get_session() as db_session:
+            existing_ids = Counter(a["problem_id"] for a in attempts if a.get("problem_id"))
+            existing = {}
+            if existing_ids:
+                for problem in db_session.query(PracticeProblem).filter(
+                    PracticeProblem.id.in_(existing_ids),
+                    PracticeProblem.student_id == student_id
+                ).all():
+                    existing[problem.id] = problem
+                foreign = set(existing_ids) - set(existing)
+                if foreign:
+                    raise ValueError(
+                        f"Practice problems {sorted(foreign)} do not belong to student {student_id}"
+                    )
+            
+            problems = []
+            for attempt in attempts:
+                problem = existing.get(attempt.get("problem_id"))
+                if problem is None:
+                    problem = PracticeProblem(
+                        student_id=student_id,
+                        topic=topic,
+                        difficulty=difficulty,
+                        problem_text=attempt["problem_text"],
+                        problem_type=attempt.get("problem_type", "short_answer"),
+                        correct_answer=attempt.get("correct_answer", ""),
+                        solution_explanation=attempt.get("solution_explanation"),
+                        attempt_count=1
+                    )
+                    db_session.add(problem)
+                else:
+                    # Counted in SQL so a concurrent attempt isn't lost
+                    problem.attempt_count = PracticeProblem.attempt_count + existing_ids[problem.id]
+                
+                problem.student_answer = attempt["student_answer"]
+                problem.is_correct = attempt["is_correct"]
+                problem.attempted_at = now
+                if attempt["is_correct"]:
+                    problem.completed_at = now
+                if attempt.get("feedback"):
+                    problem.feedback = attempt["feedback"]
+                problems.append(problem)
+            
+            # Roll all attempts into the topic's progress record
+            successes = sum(1 for a in attempts if a["is_correct"])
+            self._add_progress(db_session, student_id, topic, None, len(attempts), successes)
+            
+            db_session.flush()
+            return [problem.id for problem in problems]
+    
+    # ==================== Token Usage Operations ====================
+    
+    def record_token_usage(self, task: str, model: str, input_tokens: int, output_tokens: int,
+                           cache_creation_tokens: int = 0, cache_read_tokens: int = 0,
+                           cost: float = 0.0, student_id: int = None,
+                           session_id: int = None) -> TokenUsage:
+        """Add a ledger entry and roll it into the daily aggregate (atomic across processes)"""
+        now = datetime.utcnow()
+        
+        if student_id is not None:
+            student_filter = TokenUsageDaily.student_id == student_id
+        else:
+            student_filter = TokenUsageDaily.student_id == None
+        
+        # Incremented in SQL, so concurrent calls never overwrite each other's totals
+        increments = {
+            TokenUsageDaily.calls: TokenUsageDaily.calls + 1,
+            TokenUsageDaily.input_tokens: TokenUsageDaily.input_tokens + input_tokens,
+            TokenUsageDaily.output_tokens: TokenUsageDaily.output_tokens + output_tokens,
+            TokenUsageDaily.cache_creation_tokens:
+                TokenUsageDaily.cache_creation_tokens + cache_creation_tokens,
+            TokenUsageDaily.cache_read_tokens: TokenUsageDaily.cache_read_tokens + cache_read_tokens,
+            TokenUsageDaily.cost: TokenUsageDaily.cost + cost
+        }
+        
+        for attempt in range(2):
+            try:
+                with self.get_session() as db_session:
+                    updated = db_session.query(TokenUsageDaily).filter(
+                        and_(
+                            TokenUsageDaily.day == now.date(),
+                            student_filter,
+                            TokenUsageDaily.task == task,
+                            TokenUsageDaily.model == model
+                        )
+                    ).update(increments, synchronize_session=False)
+                    
+                    if not updated:
+                        db_session.add(TokenUsageDaily(
+                            day=now.date(), student_id=student_id, task=task, model=model,
+                            calls=1, input_tokens=input_tokens, output_tokens=output_tokens,
+                            cache_creation_tokens=cache_creation_tokens,
+                            cache_read_tokens=cache_read_tokens, cost=cost
+                        ))
+                    
+                    entry = TokenUsage(
+                        student_id=student_id,
+                        session_id=session_id,
+                        task=task,
+                        model=model,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        cache_creation_tokens=cache_creation_tokens,
+                        cache_read_tokens=cache_read_tokens,
+                        cost=cost,
+                        created_at=now
+                    )
+                    db_session.add(entry)
+                    db_session.flush()
+                    db_session.refresh(entry)
+                    db_session.expunge(entry)
+                return entry
+            except IntegrityError:
+                # Another process created today's row first - increment it instead
+                if attempt:
+                    raise
+    
+    def get_daily_token_usage(self, day: date = None, student_id: int = None) -> Dict[str, Any]:
+        """
+        Get token totals for one day from the daily aggregates
+        
+        Args:
+            day: Day to total (defaults to today, UTC)
+            student_id: Limit to one student (None totals the whole deployment)
+        
+        Returns:
+            Dict with calls, token counts, total_tokens and cost
+        """
+        day = day or datetime.utcnow().date()
+        
+        with self.get_session() as db_session:
+            query = db_session.query(
+                func.coalesce(func.sum(TokenUsageDaily.calls), 0),
+                func.coalesce(func.sum(TokenUsageDaily.input_tokens), 0),
+                func.coalesce(func.sum(TokenUsageDaily.output_tokens), 0),
+                func.coalesce(func.sum(TokenUsageDaily.cache_creation_tokens), 0),
+                func.coalesce(func.sum(TokenUsageDaily.cache_read_tokens), 0),
+                func.coalesce(func.sum(TokenUsageDaily.cost), 0.0)
+            ).filter(TokenUsageDaily.day == day)
+            if student_id is not None:
+                query = query.filter(TokenUsageDaily.student_id == student_id)
+            
+            calls, input_tokens, output_tokens, cache_creation, cache_read, cost = query.one()
+            return {
+                "day": day,
+                "calls": calls,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cache_creation_tokens": cache_creation,
+                "cache_read_tokens": cache_read,
+                "total_tokens": input_tokens + output_tokens + cache_creation + cache_read,
+                "cost": cost
+            }
+    
+    def get_token_usage_by_day(self, days: int = 7, student_id: int = None) -> List[Dict[str, Any]]:
+        """Get daily token totals per task for the last N days"""
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        
+        with self.get_session() as db_session:
+            query = db_session.query(
+                TokenUsageDaily.day,
+                TokenUsageDaily.task,
+                func.sum(TokenUsageDaily.calls),
+                func.sum(TokenUsageDaily.input_tokens + TokenUsageDaily.output_tokens
+                         + TokenUsageDaily.cache_creation_tokens + TokenUsageDaily.cache_read_tokens),
+                func.sum(TokenUsageDaily.cost)
+            ).filter(TokenUsageDaily.day >= since)
+            if student_id is not None:
+                query = query.filter(TokenUsageDaily.student_id == student_id)
+            
+            rows = query.group_by(TokenUsageDaily.day, TokenUsageDaily.task).order_by(TokenUsageDaily.day).all()
+            return [
+                {"day": day, "task": task, "calls": calls, "total_tokens": tokens, "cost": cost}
+                for day, task, calls, tokens, cost in rows
+            ]
+    
+    def get_top_token_students(self, day: date = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the students using the most tokens on a day"""
+        day = day or datetime.utcnow().date()
+        
+        with self.get_session() as db_session:
+            total = func.sum(TokenUsageDaily.input_tokens + TokenUsageDaily.output_tokens
+                             + TokenUsageDaily.cache_creation_tokens + TokenUsageDaily.cache_read_tokens)
+            rows = db_session.query(
+                TokenUsageDaily.student_id, total, func.sum(TokenUsageDaily.cost)
+            ).filter(
+                TokenUsageDaily.day == day,
+                TokenUsageDaily.student_id != None
+            ).group_by(TokenUsageDaily.student_id).order_by(desc(total)).limit(limit).all()
+            return [
+                {"student_id": student_id, "total_tokens": tokens, "cost": cost}
+                for student_id, tokens, cost in rows
+            ]
+
+    
+    # ==================== Token Revocation Operations ====================
+    
+    @staticmethod
+    def _epoch_scope(student_id: Optional[int]) -> str:
+        return "global" if student_id is None else f"student:{student_id}"
+    
+    def get_token_epoch(self, student_id: int = None) -> int:
+        """
+        Get a revocation epoch (0 if never revoked)
+        
+        Args:
+            student_id: Student whose epoch to read (None for the global epoch)
+        """
+        with self.get_session() as db_session:
+            epoch = db_session.query(TokenEpoch.epoch).filter(
+                TokenEpoch.scope == self._epoch_scope(student_id)
+            ).scalar()
+        return epoch or 0
+    
+    def bump_token_epoch(self, student_id: int = None) -> int:
+        """
+        Revoke tokens by advancing an epoch (atomic across processes)
+        
+        Args:
+            student_id: Student whose tokens are revoked (None revokes everyone's)
+        
+        Returns:
+            The new epoch
+        """
+        scope = self._epoch_scope(student_id)
+        for attempt in range(2):
+            try:
+                with self.get_session() as db_session:
+                    updated = db_session.query(TokenEpoch).filter(TokenEpoch.scope == scope).update(
+                        {TokenEpoch.epoch: TokenEpoch.epoch + 1, TokenEpoch.updated_at: datetime.utcnow()},
+                        synchronize_session=False
+                    )
+                    if not updated:
+                        db_session.add(TokenEpoch(scope=scope, epoch=1))
+                break
+            except IntegrityError:
+                # Another process inserted the row first - increment it instead
+                if attempt:
+                    raise
+        
+        self.notify("tokens_revoked", student_id=student_id)
+        return self.get_token_epoch(student_id)
+
+
+# Per-method latency and statement counts (context managers and event plumbing excluded)
+metrics.instrument_methods(DatabaseManager, exclude=(
+    "get_session", "add_listener", "remove_listener", "notify", "create_tables", "drop_tables",
+    "enable_profiler", "get_pool_status"
+))
@@ -2,7 +2,7 @@
 
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Boolean, JSON, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -172,3 +172,82 @@ class PracticeProblem(Base):
     def __repr__(self):
         return f"<PracticeProblem(id={self.id}, topic='{self.topic}', difficulty='{self.difficulty}')>"
 
+
+
+class TokenUsage(Base):
+    """Token usage model - ledger of every AI call"""
+    __tablename__ = "token_usage"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=True, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=True)
+    task = Column(String(50), nullable=False)  # chat, practice_generation, answer_check, summarize
+    model = Column(String(100), nullable=False)
+    
+    # Token counts
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    cache_creation_tokens = Column(Integer, default=0)
+    cache_read_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)  # Estimated USD
+    
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<TokenUsage(id={self.id}, student_id={self.student_id}, task='{self.task}', model='{self.model}')>"
+
+
+class TokenUsageDaily(Base):
+    """Daily token usage rollup - one row per day, student, task and model"""
+    __tablename__ = "token_usage_daily"
+    __table_args__ = (
+        Index("ix_token_usage_daily_day_student", "day", "student_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=True)
+    task = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=False)
+    
+    # Aggregates
+    calls = Column(Integer, default=0)
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    cache_creation_tokens = Column(Integer, default=0)
+    cache_read_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)
+    
+    def __repr__(self):
+        return f"<TokenUsageDaily(day={self.day}, student_id={self.student_id}, task='{self.task}')>"
+
+
+# One progress row per student, topic and subtopic (a topic's overall row has no
+# subtopic, indexed as '')
+PROGRESS_KEY = Index(
+    "uq_progress_key",
+    Progress.student_id, Progress.topic, func.coalesce(Progress.subtopic, ""),
+    unique=True
+)
+
+# One rollup row per key; the deployment-wide rows have no student, and NULLs
+# never collide in a unique index, so they are indexed as student 0
+TOKEN_USAGE_DAILY_KEY = Index(
+    "uq_token_usage_daily_key",
+    TokenUsageDaily.day, func.coalesce(TokenUsageDaily.student_id, 0),
+    TokenUsageDaily.task, TokenUsageDaily.model,
+    unique=True
+)
+
+
+class TokenEpoch(Base):
+    """Token revocation epoch - a login token is only valid while its epoch is current"""
+    __tablename__ = "token_epochs"
+    
+    # 'global' (every student) or 'student:<id>'
+    scope = Column(String(50), primary_key=True)
+    epoch = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<TokenEpoch(scope='{self.scope}', epoch={self.epoch})>"
@@ -0,0 +1,410 @@
+"""SQL statement profiler - query counts, slow statements and N+1 detection
+
+Opt-in: attach a QueryProfiler to a DatabaseManager's engine (database.profiler
+in config.yaml, or DatabaseManager.enable_profiler()). Statements are grouped
+by request - an explicit profiler.request() block, or else the running trace
+(a chat turn, a practice set) - and by the DatabaseManager method that issued
+them. Within one request, the same statement shape repeating past a threshold
+is flagged as a suspected N+1.
+
+Query budgets for key paths are checked with `python -m src.database.query_profiler`
+and by the test suite (`pytest`).
+"""
+
+import contextvars
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+from ..utils.metrics import current_db_method
+from ..utils.tracing import current_span
+
+
+_request: contextvars.ContextVar = contextvars.ContextVar("profiler_request", default=None)
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+
+
+class QueryBudgetExceededError(AssertionError):
+    """A block ran more SQL statements than its budget allows"""
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Reduce a statement to its shape, so repeats with other values match
+
+    Literals become ?, placeholder lists collapse to (?+) and whitespace is
+    normalized.
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?+)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class _RequestStats:
+    """Statements seen within one request"""
+
+    __slots__ = ("name", "statements", "shapes", "flagged")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.shapes: Counter = Counter()
+        self.flagged = set()
+
+
+class QueryProfiler:
+    """Counts, times and inspects every statement run on an engine"""
+
+    def __init__(self, engine, slow_ms: float = 100.0, n_plus_one_threshold: int = 5,
+                 explain: bool = True, max_slow: int = 50, max_suspects: int = 50):
+        """
+        Initialize profiler (call attach() to start profiling)
+
+        Args:
+            engine: SQLAlchemy engine to profile
+            slow_ms: Statements at least this slow are captured with their plan
+            n_plus_one_threshold: Repeats of one statement shape within a request
+                                  that count as a suspected N+1
+            explain: Run EXPLAIN on slow statements
+            max_slow: Slow statements kept (most recent)
+            max_suspects: N+1 suspects kept (most recent)
+        """
+        self.engine = engine
+        self.slow_ms = slow_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.explain = explain
+
+        self._lock = threading.Lock()
+        self._operations: Dict[str, Dict[str, float]] = {}
+        self._shapes: Counter = Counter()
+        self._slow: deque = deque(maxlen=max_slow)
+        self._suspects: deque = deque(maxlen=max_suspects)
+        self._requests: Dict[str, _RequestStats] = {}
+        self._local = threading.local()
+        self.total_statements = 0
+        self.attached = False
+
+    # ==================== Engine events ====================
+
+    def attach(self):
+        """Start listening to the engine"""
+        if not self.attached:
+            event.listen(self.engine, "before_cursor_execute", self._before)
+            event.listen(self.engine, "after_cursor_execute", self._after)
+            self.attached = True
+
+    def detach(self):
+        """Stop listening to the engine"""
+        if self.attached:
+            event.remove(self.engine, "before_cursor_execute", self._before)
+            event.remove(self.engine, "after_cursor_execute", self._after)
+            self.attached = False
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_profiler_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_profiler_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+        operation = current_db_method() or "other"
+        shape = statement_shape(statement)
+        request = self._current_request()
+
+        with self._lock:
+            self.total_statements += 1
+            stats = self._operations.setdefault(operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            self._shapes[shape] += 1
+
+            if request is not None:
+                request.statements += 1
+                request.shapes[shape] += 1
+                repeats = request.shapes[shape]
+                if repeats >= self.n_plus_one_threshold and shape not in request.flagged:
+                    request.flagged.add(shape)
+                    self._suspects.append({
+                        "request": request.name,
+                        "operation": operation,
+                        "shape": shape,
+                        "repeats": repeats,
+                        "time": time.time()
+                    })
+
+        counters = getattr(self._local, "budgets", None)
+        if counters:
+            for counter in counters:
+                counter[0] += 1
+
+        if elapsed_ms >= self.slow_ms:
+            self._capture_slow(conn, statement, parameters, executemany, operation, elapsed_ms)
+
+    def _capture_slow(self, conn, statement, parameters, executemany, operation, elapsed_ms):
+        """Keep a slow statement, with its query plan when it can be explained"""
+        plan = None
+        if self.explain and not executemany and statement.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE"):
+            plan = self._explain(conn, statement, parameters)
+        with self._lock:
+            self._slow.append({
+                "operation": operation,
+                "statement": statement,
+                "parameters": repr(parameters)[:200],
+                "duration_ms": round(elapsed_ms, 2),
+                "plan": plan,
+                "time": time.time()
+            })
+
+    def _explain(self, conn, statement, parameters) -> Optional[str]:
+        """Query plan of a statement (EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere)"""
+        prefix = "EXPLAIN QUERY PLAN " if self.engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            return f"(EXPLAIN failed: {e})"
+        return "\n".join(" | ".join(str(col) for col in row) for row in rows)
+
+    # ==================== Requests and budgets ====================
+
+    def _current_request(self) -> Optional[_RequestStats]:
+        """Stats of the request this statement belongs to, if any"""
+        request = _request.get()
+        if request is not None:
+            return request
+
+        # Fall back to the running trace (chat turn, practice set)
+        span = current_span()
+        if span is None:
+            return None
+        trace = span.trace
+        with self._lock:
+            stats = self._requests.get(trace.trace_id)
+            if stats is None:
+                stats = self._requests[trace.trace_id] = _RequestStats(trace.root.name)
+                # Bound memory - traces never tell the profiler they finished
+                if len(self._requests) > 1000:
+                    for trace_id in list(self._requests)[:500]:
+                        del self._requests[trace_id]
+            return stats
+
+    @contextmanager
+    def request(self, name: str):
+        """Treat the statements in a block as one request for N+1 detection"""
+        token = _request.set(_RequestStats(name))
+        try:
+            yield
+        finally:
+            _request.reset(token)
+
+    @contextmanager
+    def budget(self, max_statements: int, name: str = "block"):
+        """
+        Fail if a block runs more statements than allowed (this thread only)
+
+        Args:
+            max_statements: Statements allowed
+            name: Name used in the error message
+
+        Raises:
+            QueryBudgetExceededError: When the block ran more statements
+        """
+        counter = [0]
+        counters = getattr(self._local, "budgets", None)
+        if counters is None:
+            counters = self._local.budgets = []
+        counters.append(counter)
+        try:
+            yield counter
+        finally:
+            counters.remove(counter)
+        if counter[0] > max_statements:
+            raise QueryBudgetExceededError(
+                f"{name} ran {counter[0]} SQL statements, budget is {max_statements}"
+            )
+
+    # ==================== Report ====================
+
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Summarize what was profiled
+
+        Returns:
+            Dict with 'total_statements', 'operations' (count, total/mean/max ms
+            per DatabaseManager method), 'top_shapes', 'slow_statements' and
+            'n_plus_one' suspects
+        """
+        with self._lock:
+            operations = {
+                name: {
+                    "count": stats["count"],
+                    "total_ms": round(stats["total_ms"], 2),
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "max_ms": round(stats["max_ms"], 2)
+                }
+                for name, stats in self._operations.items()
+            }
+            return {
+                "total_statements": self.total_statements,
+                "operations": dict(sorted(operations.items(), key=lambda item: -item[1]["total_ms"])),
+                "top_shapes": [{"shape": shape, "count": count} for shape, count in self._shapes.most_common(top)],
+                "slow_statements": list(self._slow),
+                "n_plus_one": list(self._suspects)
+            }
+
+    def format_report(self, top: int = 10) -> str:
+        """Plain-text version of report()"""
+        report = self.report(top)
+        lines = [f"SQL statements: {report['total_statements']}", ""]
+        lines.append(f"{'operation':34} {'count':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}")
+        for name, stats in report["operations"].items():
+            lines.append(f"{name:34} {stats['count']:>7} {stats['total_ms']:>10.1f} "
+                         f"{stats['mean_ms']:>9.2f} {stats['max_ms']:>9.1f}")
+
+        if report["n_plus_one"]:
+            lines += ["", "Suspected N+1:"]
+            for suspect in report["n_plus_one"]:
+                lines.append(f"  {suspect['request']} / {suspect['operation']}: "
+                             f"{suspect['repeats']}x {suspect['shape'][:100]}")
+
+        if report["slow_statements"]:
+            lines += ["", f"Slow statements (>= {self.slow_ms:g} ms):"]
+            for slow in report["slow_statements"]:
+                lines.append(f"  {slow['duration_ms']:.1f} ms {slow['operation']}: {slow['statement'][:100]}")
+                if slow["plan"]:
+                    lines.extend(f"      {line}" for line in slow["plan"].splitlines())
+        return "\n".join(lines)
+
+    def reset(self):
+        """Forget everything profiled so far"""
+        with self._lock:
+            self._operations.clear()
+            self._shapes.clear()
+            self._slow.clear()
+            self._suspects.clear()
+            self._requests.clear()
+            self.total_statements = 0
+
+
+# ==================== Query budgets for key paths ====================
+
+# Statements allowed per key path. A path that needs more has grown a query
+# (often a per-row lookup) - fix the query or raise the budget knowingly.
+KEY_PATH_BUDGETS = {
+    "student_summary": 5,
+    "conversation_history": 1,
+    "add_message": 3,
+    "record_practice_results": 10,
+    "progress_view_model": 1,
+}
+
+
+def key_paths(db, sessions: int = 20, messages_per_session: int = 4) -> Dict[str, Callable[[], Any]]:
+    """
+    Seed a database for the key data paths and return a callable per path
+
+    Data sizes are chosen so per-row queries stand out: a student with many
+    sessions, each with several messages.
+
+    Args:
+        db: DatabaseManager with empty tables
+        sessions: Sessions created for the test student
+        messages_per_session: Messages per session
+
+    Returns:
+        Dict mapping each KEY_PATH_BUDGETS path to a callable that runs it
+    """
+    from ..core.dashboard import ProgressDashboard
+    from ..core.session_manager import SessionManager
+    from ..core.student_manager import StudentManager
+
+    student = db.create_student("Budget Student", 10)
+    for index in range(sessions):
+        session = db.create_session(student.id, topic=f"Topic {index % 4}")
+        for turn in range(messages_per_session):
+            db.add_message(session.id, "student" if turn % 2 == 0 else "tutor", f"Message {turn}")
+    db.update_progress(student.id, "Linear Equations", success=True)
+
+    student_manager = StudentManager(db)
+    session_manager = SessionManager(db)
+    dashboard = ProgressDashboard(db)
+
+    attempts = [
+        {"problem_text": f"Solve {n}x = {n * 3}", "correct_answer": "3",
+         "student_answer": "3", "is_correct": True}
+        for n in range(1, 6)
+    ]
+    return {
+        "student_summary": lambda: student_manager.get_student_summary(student.id),
+        "conversation_history": lambda: session_manager.get_conversation_history(session.id, limit=40),
+        "add_message": lambda: session_manager.add_message(session.id, "student", "One more question"),
+        "record_practice_results": lambda: db.record_practice_results(
+            student.id, "Linear Equations", "medium", attempts
+        ),
+        "progress_view_model": lambda: dashboard.get_view_model(student.id),
+    }
+
+
+def check_key_paths(sessions: int = 20, messages_per_session: int = 4) -> List[Dict[str, Any]]:
+    """
+    Run the key data paths against a throwaway database under query budgets
+
+    Args:
+        sessions: Sessions created for the test student
+        messages_per_session: Messages per session
+
+    Returns:
+        List of dicts with 'path', 'statements', 'budget' and 'ok'
+    """
+    from .db_manager import DatabaseManager
+
+    db = DatabaseManager("sqlite://")
+    db.create_tables()
+    paths = key_paths(db, sessions, messages_per_session)
+    profiler = db.enable_profiler(slow_ms=1000)
+
+    results = []
+    for path, run in paths.items():
+        budget = KEY_PATH_BUDGETS[path]
+        with profiler.request(path):
+            with profiler.budget(10 ** 6) as counter:
+                run()
+        results.append({"path": path, "statements": counter[0], "budget": budget,
+                        "ok": counter[0] <= budget})
+    profiler.detach()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Check SQL statement budgets of key data paths")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions for the test student")
+    parser.add_argument("--messages", type=int, default=4, help="Messages per session")
+
+    args = parser.parse_args()
+
+    failed = False
+    for result in check_key_paths(args.sessions, args.messages):
+        status = "ok" if result["ok"] else "OVER BUDGET"
+        print(f"{result['path']:26} {result['statements']:>4} / {result['budget']:<4} {status}")
+        failed = failed or not result["ok"]
+    sys.exit(1 if failed else 0)
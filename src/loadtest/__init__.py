@@ -0,0 +1 @@
+"""Load testing package - virtual students against a mock AI server"""
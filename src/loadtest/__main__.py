@@ -0,0 +1,88 @@
+"""Run the load test: python -m src.loadtest --students 100"""
+
+import argparse
+import json
+import os
+import sys
+
+from ..utils.config import config
+from .runner import LoadTestRunner, compare_to_baseline, save_baseline
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def print_report(report: dict):
+    """Print a report as a table"""
+    cfg = report["config"]
+    print(f"\n{cfg['students']} students x {cfg['turns']} chat turns + {cfg['practice_sets']} practice set(s), "
+          f"mock AI {cfg['latency_ms']:.0f}±{cfg['jitter_ms']:.0f} ms, {cfg['database']}")
+    print(f"Duration {report['duration_s']:.1f}s, throughput {report['throughput_ops_per_s']:.1f} ops/s, "
+          f"{report['ai_requests']} AI requests")
+    if report["memory_per_user_kb"] is not None:
+        print(f"Memory per user {report['memory_per_user_kb']:.1f} KB ({report['memory_method']})")
+    print()
+
+    print(f"{'operation':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    for name, stats in sorted(report["operations"].items()):
+        print(f"{name:<20}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['queries_per_op']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the tutor with virtual students")
+    parser.add_argument("--students", type=int, default=config.get('deployment.max_concurrent_users', 100),
+                        help="Concurrent virtual students (default: deployment.max_concurrent_users)")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per student")
+    parser.add_argument("--practice-sets", type=int, default=1, help="Practice sets per student")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Mean mock AI latency")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="Mock AI latency variation")
+    parser.add_argument("--output-tokens", type=int, default=300, help="Tokens per mock chat reply")
+    parser.add_argument("--database-url", default=None, help="Database URL (default: temporary SQLite)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Measure memory with tracemalloc (exact but slower)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, default=None,
+                        help="Save the report as the baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None,
+                        help="Compare with a baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown")
+
+    args = parser.parse_args()
+
+    report = LoadTestRunner(
+        students=args.students,
+        turns=args.turns,
+        practice_sets=args.practice_sets,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        output_tokens=args.output_tokens,
+        database_url=args.database_url,
+        trace_memory=args.trace_memory
+    ).run()
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("\nWarning: baseline was recorded with a different configuration")
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Mock Anthropic Messages API server for load testing"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+
+PRACTICE_REQUEST = re.compile(r'Create (\d+) \w+ difficulty practice problems')
+PROBLEM_NUMBER = re.compile(r'^Problem (\d+):', re.MULTILINE)
+
+
+class MockAnthropicServer(ThreadingHTTPServer):
+    """Answers POST /v1/messages with canned tutor replies after a simulated delay
+
+    Replies are shaped like the real ones the app parses: practice sets use
+    **Problem N:** headings and a Solutions section with final answers, batch
+    answer checks get a JSON array, single checks get a short confirmation.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 800,
+                 jitter_ms: float = 200, output_tokens: int = 300):
+        """
+        Initialize mock server
+
+        Args:
+            host: Address to bind
+            port: Port to bind (0 picks a free one)
+            latency_ms: Mean response delay in milliseconds
+            jitter_ms: Uniform +/- variation of the delay
+            output_tokens: Approximate tokens in a chat reply
+        """
+        super().__init__((host, port), _MessagesHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.output_tokens = output_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to AIClient"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-anthropic", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving"""
+        self.shutdown()
+        self.server_close()
+
+    def delay(self):
+        """Sleep for one simulated model latency"""
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(self.latency_ms + jitter, 0) / 1000)
+
+    def reply_for(self, prompt: str) -> str:
+        """Build the reply text for the last user message"""
+        practice = PRACTICE_REQUEST.search(prompt)
+        if practice:
+            return practice_set(int(practice.group(1)))
+
+        if "JSON array" in prompt:
+            return json.dumps([
+                {"problem": number, "correct": True, "feedback": "Correct! Nice work."}
+                for number in PROBLEM_NUMBER.findall(prompt)
+            ])
+
+        if "check if my answer is correct" in prompt:
+            return "Correct! Nice work - your steps are clear."
+
+        words = ["Let's", "work", "through", "this", "step", "by", "step", "together."]
+        return " ".join(words[i % len(words)] for i in range(int(self.output_tokens * 0.75)))
+
+
+def practice_set(count: int) -> str:
+    """Generate a practice set in the format the practice page parses"""
+    problems = "\n\n".join(
+        f"**Problem {n}:** Solve for x: {n}x + {n * 2} = {n * 5}"
+        for n in range(1, count + 1)
+    )
+    solutions = "\n\n".join(
+        f"**Problem {n} Solution:** Subtract {n * 2} and divide by {n}.\nFinal answer: x = 3"
+        for n in range(1, count + 1)
+    )
+    return f"{problems}\n\n## Solutions\n\n{solutions}\n"
+
+
+class _MessagesHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the mock server"""
+
+    server: MockAnthropicServer
+
+    def do_POST(self):
+        if not self.path.startswith("/v1/messages"):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        if isinstance(prompt, list):
+            prompt = " ".join(block.get("text", "") for block in prompt if isinstance(block, dict))
+
+        self.server.delay()
+        text = self.server.reply_for(prompt)
+        with self.server._lock:
+            self.server.requests += 1
+
+        input_chars = len(body.get("system", "") or "") + sum(
+            len(m["content"]) if isinstance(m["content"], str) else 0 for m in messages
+        )
+        self._send_json({
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "mock-model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_chars // 4, "output_tokens": max(len(text) // 4, 1)}
+        })
+
+    def _send_json(self, payload: Dict):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Keep load test output quiet"""
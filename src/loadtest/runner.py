@@ -0,0 +1,320 @@
+"""Load test runner - virtual students driving chat, practice and progress flows"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+
+from sqlalchemy import event
+
+from ..ai.ai_client import AIClient
+from ..core.conversation_handler import ConversationHandler
+from ..core.practice_manager import PracticeManager
+from ..core.student_manager import StudentManager
+from ..core.token_ledger import TokenLedger
+from ..database.db_manager import DatabaseManager
+from ..utils.practice_parser import parse_practice_content
+from .mock_ai import MockAnthropicServer
+
+
+CHAT_MESSAGES = [
+    "Can you help me solve 2x + 6 = 14?",
+    "I got x = 4, is that right?",
+    "Why do we subtract before dividing?",
+    "Can you give me a harder one?",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class QueryCounter:
+    """Counts SQL statements per operation label (per thread)"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        operation = getattr(self._local, "operation", None)
+        if operation:
+            with self._lock:
+                self.counts[operation] = self.counts.get(operation, 0) + 1
+
+    @contextmanager
+    def operation(self, name: str):
+        """Attribute queries run inside the block to an operation"""
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = None
+
+
+class LoadTestRunner:
+    """Runs N virtual students against a mock AI server and a throwaway database"""
+
+    def __init__(self, students: int = 100, turns: int = 3, practice_sets: int = 1,
+                 problems_per_set: int = 5, latency_ms: float = 800, jitter_ms: float = 200,
+                 output_tokens: int = 300, database_url: str = None, trace_memory: bool = False):
+        """
+        Initialize load test
+
+        Args:
+            students: Concurrent virtual students
+            turns: Chat turns per student
+            practice_sets: Practice sets generated and graded per student
+            problems_per_set: Problems per practice set
+            latency_ms: Mean mock AI latency in milliseconds
+            jitter_ms: Mock AI latency variation in milliseconds
+            output_tokens: Approximate tokens per mock chat reply
+            database_url: Database to test against (a temporary SQLite file by default)
+            trace_memory: Measure memory with tracemalloc (exact, but slows the run
+                down); otherwise the growth of peak RSS is used
+        """
+        self.students = students
+        self.turns = turns
+        self.practice_sets = practice_sets
+        self.problems_per_set = problems_per_set
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.output_tokens = output_tokens
+        self.database_url = database_url
+        self.trace_memory = trace_memory
+
+        self._timings: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, operation: str, elapsed_ms: float, ok: bool):
+        with self._lock:
+            self._timings.setdefault(operation, []).append(elapsed_ms)
+            if not ok:
+                self._errors[operation] = self._errors.get(operation, 0) + 1
+
+    @contextmanager
+    def _timed(self, operation: str):
+        """Time an operation and count its queries"""
+        state = {"ok": True}
+        start = time.perf_counter()
+        try:
+            with self.queries.operation(operation):
+                yield state
+        except Exception:
+            state["ok"] = False
+        finally:
+            self._record(operation, (time.perf_counter() - start) * 1000, state["ok"])
+
+    # ==================== Virtual student ====================
+
+    def _run_student(self, student):
+        """One student's session: chat turns, practice sets, progress check"""
+        session_id = None
+        for turn in range(self.turns):
+            with self._timed("chat_turn") as state:
+                response = self.conversation_handler.handle_message(
+                    student_id=student.id,
+                    message=CHAT_MESSAGES[turn % len(CHAT_MESSAGES)],
+                    session_id=session_id
+                )
+                state["ok"] = response["success"]
+                session_id = response.get("session_id", session_id)
+
+        for _ in range(self.practice_sets):
+            content = None
+            with self._timed("practice_generate"):
+                content = self.practice_manager.generate_practice_set(
+                    student.id, student.name, student.grade_level,
+                    "Linear Equations", "medium", self.problems_per_set
+                )
+
+            if not content:
+                continue
+
+            with self._timed("practice_grade"):
+                parsed = parse_practice_content(content)
+                submissions = [
+                    {
+                        "key": f"{number}_{idx}",
+                        "number": number,
+                        "problem_text": text,
+                        # Every third answer is wrong, the rest are right
+                        "answer": "4" if idx % 3 == 2 else "3",
+                        "work": "",
+                        "solution": parsed["solutions"].get(number, "")
+                    }
+                    for idx, (number, text) in enumerate(parsed["problems"])
+                ]
+                self.practice_manager.grade_batch(
+                    student.id, student.name, student.grade_level,
+                    "Linear Equations", "medium", submissions
+                )
+
+        with self._timed("progress_summary"):
+            self.student_manager.get_student_summary(student.id)
+
+    # ==================== Run ====================
+
+    def _memory_kb(self):
+        """Current traced memory, or peak RSS when not tracing (KB, None if unavailable)"""
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            return tracemalloc.get_traced_memory()[0] / 1024
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / 1024 if sys.platform == "darwin" else peak
+
+    def run(self) -> Dict:
+        """
+        Run the load test
+
+        Returns:
+            Report dict with 'config', 'throughput_ops_per_s', 'operations'
+            (count, errors, mean/p50/p95/p99 ms and queries per op) and memory use
+        """
+        temp_dir = None
+        database_url = self.database_url
+        if database_url is None:
+            temp_dir = tempfile.mkdtemp(prefix="mathtutor-loadtest-")
+            database_url = f"sqlite:///{os.path.join(temp_dir, 'loadtest.db')}"
+
+        mock = MockAnthropicServer(latency_ms=self.latency_ms, jitter_ms=self.jitter_ms,
+                                   output_tokens=self.output_tokens)
+        mock.start()
+
+        try:
+            db = DatabaseManager(database_url)
+            db.create_tables()
+            self.queries = QueryCounter(db.engine)
+
+            # Shared singletons, as app.py sets them up
+            ledger = TokenLedger(db)
+            ai_client = AIClient(api_key="loadtest", model="claude-sonnet-4-5",
+                                 ledger=ledger, base_url=mock.url)
+            self.student_manager = StudentManager(db)
+            self.conversation_handler = ConversationHandler(db, ai_client, student_manager=self.student_manager)
+            self.practice_manager = PracticeManager(db, ai_client, max_workers=4)
+
+            students = [
+                db.create_student(f"Load Student {i}", 9 + i % 4)
+                for i in range(self.students)
+            ]
+
+            # Load the SDK up front so the first turns don't pay for the import
+            ai_client.client
+
+            memory_before = self._memory_kb()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.students, thread_name_prefix="student") as pool:
+                list(pool.map(self._run_student, students))
+            elapsed = time.perf_counter() - start
+            memory_after = self._memory_kb()
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            mock.stop()
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        operations = {}
+        total_ops = 0
+        for name, timings in self._timings.items():
+            total_ops += len(timings)
+            operations[name] = {
+                "count": len(timings),
+                "errors": self._errors.get(name, 0),
+                "mean_ms": sum(timings) / len(timings),
+                "p50_ms": percentile(timings, 50),
+                "p95_ms": percentile(timings, 95),
+                "p99_ms": percentile(timings, 99),
+                "queries_per_op": self.queries.counts.get(name, 0) / len(timings)
+            }
+
+        return {
+            "config": {
+                "students": self.students,
+                "turns": self.turns,
+                "practice_sets": self.practice_sets,
+                "problems_per_set": self.problems_per_set,
+                "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms,
+                "output_tokens": self.output_tokens,
+                "database": "sqlite (temporary)" if temp_dir else database_url.split("://")[0]
+            },
+            "duration_s": elapsed,
+            "throughput_ops_per_s": total_ops / elapsed if elapsed else 0.0,
+            "ai_requests": mock.requests,
+            "memory_per_user_kb": (
+                max(memory_after - memory_before, 0) / self.students
+                if memory_before is not None else None
+            ),
+            "memory_method": "tracemalloc" if self.trace_memory else "peak_rss",
+            "operations": operations
+        }
+
+
+# ==================== Baselines ====================
+
+def save_baseline(report: Dict, path: str):
+    """Write a report as the baseline for later comparisons"""
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """
+    Compare a report with a baseline
+
+    Latency and throughput only count as regressions beyond the tolerance;
+    any increase in queries per operation does.
+
+    Args:
+        report: New report
+        baseline: Baseline report
+        tolerance: Allowed relative slowdown (0.2 = 20%)
+
+    Returns:
+        Descriptions of the regressions found (empty if none)
+    """
+    regressions = []
+
+    if report["throughput_ops_per_s"] < baseline["throughput_ops_per_s"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput_ops_per_s']:.1f} ops/s "
+            f"< baseline {baseline['throughput_ops_per_s']:.1f} ops/s"
+        )
+
+    for name, stats in report["operations"].items():
+        base = baseline["operations"].get(name)
+        if not base:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name} p95 {stats['p95_ms']:.0f} ms > baseline {base['p95_ms']:.0f} ms")
+        if stats["queries_per_op"] > base["queries_per_op"] + 0.01:
+            regressions.append(
+                f"{name} queries/op {stats['queries_per_op']:.1f} > baseline {base['queries_per_op']:.1f}"
+            )
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{name} errors {stats['errors']} > baseline {base['errors']}")
+
+    return regressions
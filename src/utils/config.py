@@ -1,17 +1,32 @@
 """Configuration management"""
 
 import os
-import yaml
+import threading
 from typing import Dict, Any
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+
+_env_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_environment():
+    """Load environment variables from .env (once per process)"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
 
 
 class Config:
-    """Application configuration manager"""
+    """Application configuration manager
+    
+    config.yaml and .env are read on first access rather than at import time.
+    """
     
     def __init__(self, config_path: str = None):
         """
@@ -25,16 +40,35 @@ class Config:
             config_path = base_dir / "config.yaml"
         
         self.config_path = config_path
-        self._config = self._load_config()
+        self._data = None
+        self._lock = threading.Lock()
     
     def _load_config(self) -> Dict[str, Any]:
         """Load configuration from YAML file"""
+        import yaml
+        
         if not os.path.exists(self.config_path):
             raise FileNotFoundError(f"Config file not found: {self.config_path}")
         
         with open(self.config_path, 'r') as f:
             return yaml.safe_load(f)
     
+    @property
+    def _config(self) -> Dict[str, Any]:
+        """Parsed config.yaml, loaded on first access"""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    load_environment()
+                    self._data = self._load_config()
+        return self._data
+    
+    @staticmethod
+    def _env(key: str, default: str = None) -> str:
+        """Read an environment variable after loading .env"""
+        load_environment()
+        return os.getenv(key, default)
+    
     def get(self, key: str, default=None):
         """Get configuration value by dot-notation key"""
         keys = key.split('.')
@@ -64,32 +98,63 @@ class Config:
     @property
     def ai_model(self) -> str:
         """Get AI model name"""
-        return os.getenv('AI_MODEL') or 'claude-3-5-sonnet-20241022'
+        return self._env('AI_MODEL') or 'claude-3-5-sonnet-20241022'
     
     @property
     def ai_max_tokens(self) -> int:
         """Get max tokens for AI"""
-        return int(os.getenv('AI_MAX_TOKENS', '4096'))
+        return int(self._env('AI_MAX_TOKENS', '4096'))
     
     @property
     def ai_temperature(self) -> float:
         """Get AI temperature"""
-        return float(os.getenv('AI_TEMPERATURE', '0.7'))
+        return float(self._env('AI_TEMPERATURE', '0.7'))
+    
+    @property
+    def ai_routes(self) -> Dict[str, dict]:
+        """Get per-task AI routing policy"""
+        return self.get('ai.routes', {})
+    
+    @property
+    def ai_pricing(self) -> Dict[str, dict]:
+        """Get AI price per million tokens by model prefix"""
+        return self.get('ai.pricing', {})
+    
+    @property
+    def token_budgets(self) -> Dict[str, int]:
+        """Get daily token budgets (soft/hard, per student and global)"""
+        return self.get('budgets', {})
     
     @property
     def database_url(self) -> str:
-        """Get database URL"""
-        return os.getenv('DATABASE_URL', 'sqlite:///data/tutoring.db')
+        """Get database URL (DATABASE_URL, or the SQLite file in data/)"""
+        default_path = Path(__file__).parent.parent.parent / "data" / "tutoring.db"
+        return self._env('DATABASE_URL', f"sqlite:///{default_path}")
+    
+    @property
+    def shared_cache_url(self) -> str:
+        """Get the shared cache URL for multi-replica mode (None = in-process)"""
+        return self._env('SHARED_CACHE_URL') or self.get('replicas.shared_cache_url')
+    
+    @property
+    def replica_id(self) -> str:
+        """Get this process's replica name (set by the launcher)"""
+        return self._env('REPLICA_ID')
+    
+    @property
+    def metrics_port(self) -> int:
+        """Get the sidecar metrics port (the launcher gives each replica its own)"""
+        return int(self._env('METRICS_PORT') or self.get('deployment.metrics_port', 9464))
     
     @property
     def session_timeout_minutes(self) -> int:
         """Get session timeout in minutes"""
-        return int(os.getenv('SESSION_TIMEOUT_MINUTES', '60'))
+        return int(self._env('SESSION_TIMEOUT_MINUTES') or self.get('session.session_timeout_minutes', 60))
     
     @property
     def max_conversation_history(self) -> int:
         """Get max conversation history messages"""
-        return int(os.getenv('MAX_CONVERSATION_HISTORY', '50'))
+        return int(self._env('MAX_CONVERSATION_HISTORY', '50'))
     
     @property
     def topics(self) -> Dict[str, list]:
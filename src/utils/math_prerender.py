@@ -0,0 +1,286 @@
+"""Math pre-rendering - LaTeX to MathML on the server, cached by expression
+
+With pre-rendering on, math segments reach the browser as MathML that it
+lays out natively, so no formula is typeset again by KaTeX on every rerun.
+Rendered formulas are stored on disk under the hash of the expression and
+shared by every student (and every replica on the host); the disk cache is
+bounded and evicts the least recently used formulas. A segment the renderer
+can't handle is shown HTML-escaped, as its $...$ source.
+"""
+
+import hashlib
+import html
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .cache import LRUCache
+from .math_renderer import DISPLAY, TEXT, tokenize_math
+
+
+logger = logging.getLogger(__name__)
+
+# Output that means the renderer didn't understand the input: a command
+# passed through as an identifier, or an alignment tab it can't lay out
+_UNRENDERED_RE = re.compile(r"<mi>\\|<mi>&amp;</mi>|<mi>&</mi>")
+_CODE_SPAN_RE = re.compile(r"(```.*?```|`[^`\n]*`)", re.DOTALL)
+
+
+class DiskLRU:
+    """Content-addressed files in a directory, bounded by total size
+
+    Recency is kept in memory and seeded from file modification times, so a
+    restart (or another replica sharing the directory) keeps roughly the same
+    eviction order.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Initialize disk cache
+
+        Args:
+            directory: Directory holding the cached files (created if missing)
+            max_bytes: Total size kept before least recently used files are removed
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Read a cached value, marking it recently used (None on a miss)"""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key not in self._index:
+                # Written by another replica
+                self._index[key] = len(value.encode("utf-8"))
+                self._bytes += self._index[key]
+            self._index.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        """Store a value atomically, evicting old files when over the size bound"""
+        path = self._path(key)
+        data = value.encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            logger.warning("Could not write cache file %s", path, exc_info=True)
+            return
+
+        with self._lock:
+            self._bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            stale = []
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+                stale.append(old_key)
+
+        for old_key in stale:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def keys(self) -> List[str]:
+        """Cached keys, least recently used first"""
+        with self._lock:
+            return list(self._index)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get files, bytes, hits, misses and evictions"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+class MathPrerenderer:
+    """Turns the math in markdown into MathML, rendering each expression once"""
+
+    def __init__(self, cache_dir: str = "data/math_cache", max_bytes: int = 64 * 1024 * 1024,
+                 memory_entries: int = 4096):
+        """
+        Initialize pre-renderer
+
+        Args:
+            cache_dir: Directory for rendered formulas
+            max_bytes: Disk space for rendered formulas
+            memory_entries: Formulas also kept in process memory
+
+        Raises:
+            ImportError: If latex2mathml is not installed
+        """
+        from latex2mathml.converter import convert
+
+        self._convert = convert
+        self.disk = DiskLRU(cache_dir, max_bytes)
+        self._memory = LRUCache(max_size=memory_entries, name="math_prerender")
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.render_errors = 0
+
+    @staticmethod
+    def expression_key(body: str, display: bool) -> str:
+        """Content address of a formula (the same expression always maps to one file)"""
+        normalized = " ".join(body.split())
+        return hashlib.sha256(f"mathml:{'block' if display else 'inline'}:{normalized}".encode("utf-8")).hexdigest()
+
+    def render_expression(self, body: str, display: bool = False) -> Optional[str]:
+        """
+        Render one formula to MathML, from the cache when possible
+
+        Args:
+            body: LaTeX without delimiters
+            display: Display (block) rather than inline math
+
+        Returns:
+            MathML markup, or None if the renderer can't handle the formula
+        """
+        key = self.expression_key(body, display)
+        cached = self._memory.get(key)
+        if cached is not None:
+            return cached or None
+
+        cached = self.disk.get(key)
+        if cached is None:
+            cached = self._render(body, display)
+            self.disk.set(key, cached)
+        # An empty string marks a formula the renderer failed on
+        self._memory.set(key, cached)
+        return cached or None
+
+    def _render(self, body: str, display: bool) -> str:
+        try:
+            markup = self._convert(body, display="block" if display else "inline")
+        except Exception as e:
+            logger.debug("MathML conversion failed for %r: %s", body, e)
+            markup = ""
+        if _UNRENDERED_RE.search(markup):
+            markup = ""
+
+        with self._lock:
+            self.renders += 1
+            if not markup:
+                self.render_errors += 1
+        return markup
+
+    def render_markdown(self, text: str, escape_html: bool = True) -> str:
+        """
+        Replace the math in markdown with pre-rendered MathML
+
+        The result must be shown with unsafe_allow_html=True, so it is only
+        used for tutor and generated content, never for what students type.
+
+        Args:
+            text: Markdown with $...$ / $$...$$ math (already KaTeX-normalized)
+            escape_html: Escape '<' in prose, for content that was plain markdown
+                         before (leave False for content already shown as HTML)
+
+        Returns:
+            Markdown with MathML in place of every formula the renderer handled
+            (the others are left as escaped source)
+        """
+        parts = []
+        for segment in tokenize_math(text):
+            if segment.kind == TEXT:
+                parts.append(_escape_prose_html(segment.raw) if escape_html else segment.raw)
+                continue
+            markup = self.render_expression(segment.content, display=segment.kind == DISPLAY)
+            parts.append(markup if markup is not None else html.escape(segment.raw))
+        return "".join(parts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get render counts and memory and disk cache statistics"""
+        with self._lock:
+            stats = {"renders": self.renders, "render_errors": self.render_errors}
+        stats["memory"] = self._memory.get_stats()
+        stats["disk"] = self.disk.get_stats()
+        return stats
+
+
+def _escape_prose_html(text: str) -> str:
+    """Keep '<' in prose from starting a tag (code spans are left alone)"""
+    if "<" not in text:
+        return text
+    return "".join(
+        part if index % 2 else part.replace("<", "&lt;")
+        for index, part in enumerate(_CODE_SPAN_RE.split(text))
+    )
+
+
+def create_prerenderer(settings: Dict[str, Any] = None) -> Optional[MathPrerenderer]:
+    """
+    Build the pre-renderer from config (ui.math_prerender)
+
+    Args:
+        settings: Dict with 'enabled', 'cache_dir', 'max_mb' and 'memory_entries'
+
+    Returns:
+        MathPrerenderer, or None when disabled or latex2mathml is missing
+    """
+    settings = settings or {}
+    if not settings.get("enabled", False):
+        return None
+    try:
+        return MathPrerenderer(
+            cache_dir=settings.get("cache_dir", "data/math_cache"),
+            max_bytes=int(settings.get("max_mb", 64) * 1024 * 1024),
+            memory_entries=settings.get("memory_entries", 4096)
+        )
+    except ImportError:
+        logger.warning("Math pre-rendering is enabled but latex2mathml is not installed; "
+                       "formulas will be typeset in the browser")
+        return None
@@ -1,7 +1,156 @@
 """Math rendering utilities for LaTeX"""
 
 import re
-from typing import List, Tuple
+from typing import Dict, Hashable, List, NamedTuple, Tuple
+
+from .cache import LRUCache
+
+
+# Rendered message content keyed by message ID, shared across sessions
+_rendered_messages = LRUCache(max_size=4096, name="rendered_messages")
+
+
+# ==================== Tokenizer ====================
+
+TEXT = "text"
+INLINE = "inline"
+DISPLAY = "display"
+
+# Every token the prose scanner stops at: an escaped backslash (a LaTeX line
+# break) or dollar, the \( \) \[ \] delimiters, any other LaTeX command, $$ and $
+_TOKEN_RE = re.compile(r"\\(?:[\\$()\[\]]|[A-Za-z]+)|\$\$?")
+
+# Inside math the scanner jumps straight to the closing delimiter. Each
+# pattern runs through the math body (skipping escaped characters) and ends
+# just past its closer, so commands inside math cost no extra steps.
+_CLOSERS = {
+    "$": (re.compile(r"[^\\$]*(?:\\.[^\\$]*)*\$", re.DOTALL), INLINE, 1),
+    "$$": (re.compile(r"[^\\$]*(?:(?:\\.|\$(?!\$))[^\\$]*)*\$\$", re.DOTALL), DISPLAY, 2),
+    "\\(": (re.compile(r"[^\\]*(?:\\[^)][^\\]*)*\\\)", re.DOTALL), INLINE, 2),
+    "\\[": (re.compile(r"[^\\]*(?:\\[^\]][^\\]*)*\\\]", re.DOTALL), DISPLAY, 2),
+}
+
+
+class MathSegment(NamedTuple):
+    """One run of prose or math; raw is the source text including delimiters"""
+    kind: str
+    content: str
+    raw: str
+
+
+def _scan(text: str, first_only: bool = False) -> Tuple[List[MathSegment], bool]:
+    """
+    Split text into prose and math segments in one left-to-right scan
+
+    Single dollars follow Pandoc's rule, so prices don't become math: an
+    opening $ is followed by a non-space, a closing $ follows a non-space and
+    is not followed by a digit. A delimiter that is never closed is prose;
+    closers don't depend on where math opened, so later openers of the same
+    kind are then prose as well, which keeps the scan linear.
+
+    Args:
+        text: Text to split
+        first_only: Stop at the first math segment or LaTeX command
+
+    Returns:
+        Tuple (segments, found) where found tells whether any math segment or
+        LaTeX command was seen
+    """
+    segments = []
+    found = False
+    unclosed = set()
+    prose_start = 0
+    pos = 0
+    length = len(text)
+    # Bound once: this loop runs for every message shown or checked
+    search = _TOKEN_RE.search
+    closer_for = _CLOSERS.get
+    append = segments.append
+
+    while True:
+        match = search(text, pos)
+        if match is None:
+            break
+
+        token = match[0]
+        start, pos = match.span()
+        closer = closer_for(token)
+        if closer is None:
+            if token[1].isalpha():
+                found = True
+                if first_only:
+                    return segments, True
+            continue
+        if token in unclosed or (token == "$" and (pos == length or text[pos].isspace())):
+            continue
+
+        pattern, kind, closer_length = closer
+        end = pos
+        while True:
+            close = pattern.match(text, end)
+            if close is None:
+                end = None
+                break
+            end = close.end()
+            if (token != "$" or not text[end - 2].isspace()
+                    and not (end < length and text[end].isdigit())):
+                break
+        if end is None:
+            unclosed.add(token)
+            continue
+
+        found = True
+        if first_only:
+            return segments, True
+        if start > prose_start:
+            prose = text[prose_start:start]
+            append(MathSegment(TEXT, prose, prose))
+        append(MathSegment(kind, text[pos:end - closer_length], text[start:end]))
+        prose_start = pos = end
+
+    if prose_start < length:
+        prose = text[prose_start:]
+        append(MathSegment(TEXT, prose, prose))
+    return segments, found
+
+
+def tokenize_math(text: str) -> List[MathSegment]:
+    """
+    Split text into prose, inline-math and display-math segments
+
+    Handles $...$, $$...$$, \\(...\\) and \\[...\\]; an escaped \\$ stays prose.
+    Joining the segments' raw text gives back the input.
+
+    Args:
+        text: Text to split
+
+    Returns:
+        List of MathSegment (kind is TEXT, INLINE or DISPLAY)
+    """
+    if "$" not in text and "\\" not in text:
+        return [MathSegment(TEXT, text, text)] if text else []
+    return _scan(text)[0]
+
+
+# Bare math the model sometimes writes without delimiters: x^2, \frac{a}{b}
+_BARE_MATH_RE = re.compile(r"\b[a-z]\^\d+|\\frac\{[^}]+\}\{[^}]+\}")
+
+_LATEX_ESCAPES: Dict[str, str] = {
+    '&': r'\&',
+    '%': r'\%',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+    '\\': r'\textbackslash{}',
+}
+_LATEX_SPECIAL_RE = re.compile("[" + re.escape("".join(_LATEX_ESCAPES)) + "]")
+
+
+def _escape_prose(text: str) -> str:
+    return _LATEX_SPECIAL_RE.sub(lambda match: _LATEX_ESCAPES[match.group()], text)
 
 
 class MathRenderer:
@@ -16,22 +165,12 @@ class MathRenderer:
             text: Text to check
         
         Returns:
-            True if LaTeX found
+            True if a delimited math expression or a LaTeX command is found
         """
-        # Look for common LaTeX patterns
-        patterns = [
-            r'\$\$.*?\$\$',  # Display math
-            r'\$.*?\$',      # Inline math
-            r'\\[a-zA-Z]+',  # LaTeX commands
-            r'\\\(.*?\\\)',  # Inline math alternative
-            r'\\\[.*?\\\]',  # Display math alternative
-        ]
-        
-        for pattern in patterns:
-            if re.search(pattern, text, re.DOTALL):
-                return True
-        
-        return False
+        if "$" not in text and "\\" not in text:
+            return False
+        # The scan stops at the first math segment or command
+        return _scan(text, first_only=True)[1]
     
     @staticmethod
     def extract_latex_expressions(text: str) -> List[Tuple[str, str]]:
@@ -42,21 +181,14 @@ class MathRenderer:
             text: Text containing LaTeX
         
         Returns:
-            List of tuples (expression, type) where type is 'inline' or 'display'
+            List of tuples (expression, type) in document order, where type is
+            'inline' or 'display'
         """
-        expressions = []
-        
-        # Display math $$...$$
-        display_pattern = r'\$\$(.*?)\$\$'
-        for match in re.finditer(display_pattern, text, re.DOTALL):
-            expressions.append((match.group(1), 'display'))
-        
-        # Inline math $...$
-        inline_pattern = r'\$(?!\$)(.*?)(?<!\$)\$'
-        for match in re.finditer(inline_pattern, text):
-            expressions.append((match.group(1), 'inline'))
-        
-        return expressions
+        return [
+            (segment.content, segment.kind)
+            for segment in tokenize_math(text)
+            if segment.kind != TEXT
+        ]
     
     @staticmethod
     def format_for_streamlit(text: str) -> str:
@@ -83,19 +215,15 @@ class MathRenderer:
         Returns:
             Text with properly wrapped math
         """
-        # This is a simple heuristic - wrap common math patterns
+        # This is a simple heuristic - wrap common math patterns in prose,
+        # leaving anything already inside math delimiters alone
         # Example: x^2 -> $x^2$
-        
-        # Common math patterns without delimiters
-        patterns = [
-            (r'(?<!\$)\b([a-z])\^(\d+)(?!\$)', r'$\1^\2$'),  # x^2
-            (r'(?<!\$)\\frac\{([^}]+)\}\{([^}]+)\}(?!\$)', r'$\\frac{\1}{\2}$'),  # \frac{a}{b}
-        ]
-        
-        for pattern, replacement in patterns:
-            text = re.sub(pattern, replacement, text)
-        
-        return text
+        if "^" not in text and "\\frac" not in text:
+            return text
+        return "".join(
+            _BARE_MATH_RE.sub(r"$\g<0>$", segment.raw) if segment.kind == TEXT else segment.raw
+            for segment in tokenize_math(text)
+        )
     
     @staticmethod
     def escape_latex_special_chars(text: str, in_math_mode: bool = False) -> str:
@@ -113,23 +241,14 @@ class MathRenderer:
             # In math mode, most special chars are okay
             return text
         
-        # Outside math mode, escape special chars
-        special_chars = {
-            '&': r'\&',
-            '%': r'\%',
-            '#': r'\#',
-            '_': r'\_',
-            '{': r'\{',
-            '}': r'\}',
-            '~': r'\textasciitilde{}',
-            '^': r'\textasciicircum{}',
-            '\\': r'\textbackslash{}',
-        }
-        
-        for char, escaped in special_chars.items():
-            text = text.replace(char, escaped)
-        
-        return text
+        # Outside math mode, escape special chars in one pass (math segments
+        # are kept as they are)
+        if _LATEX_SPECIAL_RE.search(text) is None:
+            return text
+        return "".join(
+            _escape_prose(segment.raw) if segment.kind == TEXT else segment.raw
+            for segment in tokenize_math(text)
+        )
     
     @staticmethod
     def format_equation(equation: str, numbered: bool = False) -> str:
@@ -143,10 +262,12 @@ class MathRenderer:
         Returns:
             Formatted equation
         """
-        if not equation.startswith('$'):
-            equation = f"$${equation}$$"
+        segments = tokenize_math(equation.strip())
+        if any(segment.kind != TEXT for segment in segments):
+            # Already delimited
+            return equation
         
-        return equation
+        return f"$${equation}$$"
     
     @staticmethod
     def format_problem_solution(problem: str, solution: str,
@@ -172,20 +293,239 @@ class MathRenderer:
         return formatted
 
 
+# ==================== KaTeX Normalization ====================
+
+# Bump when normalize_for_katex changes, so stored results are redone
+NORMALIZER_VERSION = 1
+
+# Environments KaTeX renders in both inline and display math
+KATEX_ENVIRONMENTS = frozenset({
+    "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix",
+    "array", "darray", "subarray", "cases", "dcases", "rcases", "drcases",
+    "aligned", "alignedat", "gathered", "split", "CD",
+})
+
+# Environments KaTeX rejects or only allows in display mode, and what they
+# become (None drops the environment and keeps its body)
+_ENVIRONMENT_REWRITES = {
+    "equation": None, "equation*": None, "displaymath": None,
+    "align": "aligned", "align*": "aligned", "flalign": "aligned", "flalign*": "aligned",
+    "eqnarray": "aligned", "eqnarray*": "aligned",
+    "gather": "gathered", "gather*": "gathered", "multline": "gathered", "multline*": "gathered",
+}
+
+_ENVIRONMENT_RE = re.compile(r"\\(begin|end)\{([^}]*)\}")
+# Numbering commands KaTeX doesn't know; they only matter in a LaTeX document
+_NUMBERING_RE = re.compile(r"\\label\{[^}]*\}|\\nonumber\b|\\notag\b")
+_ESCAPED_PAIR_RE = re.compile(r"\\.", re.DOTALL)
+_LEFT_RE = re.compile(r"\\left(?![A-Za-z])")
+_RIGHT_RE = re.compile(r"\\right(?![A-Za-z])")
+_UNESCAPED_DOLLAR_RE = re.compile(r"(?<!\\)\$")
+_CODE_SPAN_RE = re.compile(r"(```.*?```|`[^`\n]*`)", re.DOTALL)
+
+
+def _rewrite_environments(body: str) -> str:
+    """Swap environments KaTeX can't render for the closest ones it can"""
+    def rewrite(match):
+        command, name = match.groups()
+        if name not in _ENVIRONMENT_REWRITES:
+            return match.group()
+        replacement = _ENVIRONMENT_REWRITES[name]
+        return f"\\{command}{{{replacement}}}" if replacement else ""
+
+    return _ENVIRONMENT_RE.sub(rewrite, body)
+
+
+def validate_math(body: str) -> List[str]:
+    """
+    Check a math segment for mistakes that make KaTeX fail
+
+    Args:
+        body: Math without its delimiters
+
+    Returns:
+        Problems found (empty if the segment should render)
+    """
+    issues = []
+
+    braces = _ESCAPED_PAIR_RE.sub(lambda match: "" if match.group() in ("\\{", "\\}") else match.group(), body)
+    if braces.count("{") != braces.count("}"):
+        issues.append("unbalanced braces")
+
+    if len(_LEFT_RE.findall(body)) != len(_RIGHT_RE.findall(body)):
+        issues.append("unmatched \\left/\\right")
+
+    open_environments = []
+    for command, name in _ENVIRONMENT_RE.findall(body):
+        if command == "begin":
+            if name not in KATEX_ENVIRONMENTS:
+                issues.append(f"unsupported environment {name}")
+            open_environments.append(name)
+        elif not open_environments or open_environments.pop() != name:
+            issues.append(f"unmatched \\end{{{name}}}")
+    if open_environments:
+        issues.append(f"unclosed environment {open_environments[-1]}")
+
+    return issues
+
+
+def _escape_prose_dollars(text: str) -> str:
+    """Escape dollars that aren't math so Streamlit shows them as dollars"""
+    if "$" not in text:
+        return text
+    return "".join(
+        part if index % 2 else _UNESCAPED_DOLLAR_RE.sub(r"\\$", part)
+        for index, part in enumerate(_CODE_SPAN_RE.split(text))
+    )
+
+
+def _code_span(text: str) -> str:
+    fence = "``" if "`" in text else "`"
+    return f"{fence} {text} {fence}" if fence == "``" else f"`{text}`"
+
+
+def normalize_for_katex(text: str) -> Dict:
+    """
+    Rewrite tutor content into markdown Streamlit's KaTeX renders
+
+    \\(...\\) and \\[...\\] become $...$ and $$...$$, environments KaTeX lacks
+    are swapped for ones it has, numbering commands are dropped and dollars
+    outside math are escaped. A math segment that still fails validation is
+    shown as code instead of a KaTeX error.
+
+    Args:
+        text: Tutor message content
+
+    Returns:
+        Dict with 'content' (normalized markdown), 'changed', 'issues'
+        (problems found per failed segment) and 'version'
+    """
+    parts = []
+    issues = []
+    pending = text
+
+    while pending:
+        segments = tokenize_math(pending)
+        pending = ""
+        for index, segment in enumerate(segments):
+            if segment.kind == TEXT:
+                parts.append(_escape_prose_dollars(segment.raw))
+                continue
+
+            body = segment.content
+            if segment.raw.startswith("$") and not segment.raw.startswith("$$") \
+                    and _UNESCAPED_DOLLAR_RE.search(body):
+                # "$3 and a pen costs $2": the opening dollar was a price
+                parts.append("\\$")
+                pending = segment.raw[1:] + "".join(rest.raw for rest in segments[index + 1:])
+                break
+
+            body = _rewrite_environments(_NUMBERING_RE.sub("", body)).strip()
+            if not body:
+                continue
+
+            problems = validate_math(body)
+            if problems:
+                issues.append({"math": segment.raw[:200], "problems": problems})
+                parts.append(_code_span(segment.raw))
+            elif segment.kind == DISPLAY:
+                parts.append(f"$${body}$$")
+            else:
+                parts.append(f"${' '.join(body.split())}$")
+
+    content = "".join(parts)
+    return {
+        "content": content,
+        "changed": content != text,
+        "issues": issues,
+        "version": NORMALIZER_VERSION
+    }
+
+
+def katex_metadata(text: str) -> Dict:
+    """
+    Normalize content for storing under message_metadata["katex"]
+
+    The normalized content is only kept when it differs from the original.
+
+    Args:
+        text: Tutor message content
+
+    Returns:
+        Dict with 'version', 'issues' and, if changed, 'content'
+    """
+    result = normalize_for_katex(text)
+    stored = {"version": result["version"], "issues": result["issues"]}
+    if result["changed"]:
+        stored["content"] = result["content"]
+    return stored
+
+
+def normalized_content(text: str, metadata: Dict = None) -> str:
+    """
+    Normalized content of a tutor message, from its stored metadata if current
+
+    Args:
+        text: Message content
+        metadata: The message's message_metadata (may be None)
+
+    Returns:
+        KaTeX-safe markdown
+    """
+    stored = (metadata or {}).get("katex")
+    if stored and stored.get("version") == NORMALIZER_VERSION:
+        return stored.get("content", text)
+    return normalize_for_katex(text)["content"]
+
+
 # Streamlit-specific helper functions
-def render_math_message(message: str, role: str = "student") -> str:
+def render_math_message(message: str, role: str = "student", metadata: Dict = None,
+                        prerenderer=None) -> str:
     """
     Render a message with math support for Streamlit
     
     Args:
         message: Message content
         role: Message role (student or tutor)
+        metadata: The message's stored metadata, if any
+        prerenderer: MathPrerenderer turning tutor formulas into MathML (the
+                     result must then be shown with unsafe_allow_html=True);
+                     student messages are never pre-rendered
+    
+    Returns:
+        Formatted message (tutor messages are normalized for KaTeX)
+    """
+    # Streamlit handles LaTeX natively; tutor output is made KaTeX-safe first
+    content = normalized_content(message, metadata) if role == "tutor" else message
+    
+    if prerenderer is not None and role == "tutor":
+        content = prerenderer.render_markdown(content)
+    return content
+
+
+def render_message_cached(message_id: Hashable, message: str, role: str = "student",
+                          metadata: Dict = None, prerenderer=None) -> str:
+    """
+    Render a message once and reuse the result on later reruns
+    
+    Args:
+        message_id: Stable message ID (None disables caching)
+        message: Message content
+        role: Message role (student or tutor)
+        metadata: The message's stored metadata; a current normalization
+                  stored there is used instead of normalizing again
+        prerenderer: MathPrerenderer, when formulas are pre-rendered
     
     Returns:
         Formatted message
     """
-    # Streamlit handles LaTeX natively, just return the message
-    return message
+    if message_id is None:
+        return render_math_message(message, role, metadata, prerenderer)
+    
+    return _rendered_messages.get_or_compute(
+        (message_id, role, prerenderer is not None and role == "tutor"),
+        lambda: render_math_message(message, role, metadata, prerenderer)
+    )
 
 
 def create_problem_card(problem_number: int, problem_text: str,
@@ -218,3 +558,191 @@ def create_problem_card(problem_number: int, problem_text: str,
 ---
 """
 
+
+
+# ==================== Benchmark ====================
+
+# Tutor replies shaped like the model's output: prose with inline and display
+# math, prices, escaped dollars, aligned steps and bracket delimiters
+SAMPLE_TUTOR_MESSAGES = [
+    "Great question! To solve $2x + 6 = 14$, first subtract 6 from both sides:\n\n"
+    "$$2x = 8$$\n\nThen divide both sides by 2 to get $x = 4$. Can you check it by plugging it back in?",
+    "Not quite - you added 6 instead of subtracting it. What happens to $2x + 6$ if we take away 6?",
+    "If a notebook costs $3 and a pen costs $2, how much do 4 notebooks and 3 pens cost? "
+    "Write it as an expression first, like $4n + 3p$.",
+    "The quadratic formula is\n\n$$x = \\frac{-b \\pm \\sqrt{b^2 - 4ac}}{2a}$$\n\n"
+    "For $x^2 - 5x + 6 = 0$ we have $a = 1$, $b = -5$ and $c = 6$, so the discriminant is "
+    "$b^2 - 4ac = 25 - 24 = 1$.",
+    "Let's line the steps up:\n\n\\[\\begin{aligned} 3(x - 2) &= 12 \\\\ x - 2 &= 4 \\\\ x &= 6 "
+    "\\end{aligned}\\]\n\nEach line divides or adds the same thing on both sides.",
+    "Exactly right! The slope is \\(m = \\frac{y_2 - y_1}{x_2 - x_1}\\), which here is "
+    "\\(\\frac{7 - 3}{4 - 2} = 2\\). Nice work 🎉",
+    "Remember that \\$5 off a \\$20 shirt is a 25% discount, because $\\frac{5}{20} = 0.25$.",
+    "You're very close. Think about what the area of a circle is: $A = \\pi r^2$. "
+    "With $r = 3$ cm, what do you get?",
+    "A right triangle has legs 6 and 8. By the Pythagorean theorem,\n\n$$c^2 = 6^2 + 8^2 = 36 + 64 = 100$$\n\n"
+    "so $c = 10$. This is a scaled 3-4-5 triangle!",
+    "That's a great way to think about it. Fractions, decimals and percents are three ways of writing "
+    "the same amount - for example one half, 0.5 and 50%.",
+    "To simplify $\\sqrt{72}$, look for the largest perfect square factor: $72 = 36 \\cdot 2$, "
+    "so $\\sqrt{72} = 6\\sqrt{2}$.",
+    "Try this one on your own: solve the system $x + y = 10$ and $x - y = 2$. "
+    "Hint: what happens if you add the two equations?",
+]
+
+
+def _legacy_contains_latex(text: str) -> bool:
+    """The previous multi-regex check, kept as the benchmark baseline"""
+    for pattern in (r'\$\$.*?\$\$', r'\$.*?\$', r'\\[a-zA-Z]+', r'\\\(.*?\\\)', r'\\\[.*?\\\]'):
+        if re.search(pattern, text, re.DOTALL):
+            return True
+    return False
+
+
+def _legacy_extract(text: str) -> List[Tuple[str, str]]:
+    """The previous two-pass extraction, kept as the benchmark baseline"""
+    expressions = [(m.group(1), 'display') for m in re.finditer(r'\$\$(.*?)\$\$', text, re.DOTALL)]
+    expressions += [(m.group(1), 'inline') for m in re.finditer(r'\$(?!\$)(.*?)(?<!\$)\$', text)]
+    return expressions
+
+
+def _legacy_wrap_inline_math(text: str) -> str:
+    """The previous whole-text substitutions, kept as the benchmark baseline"""
+    text = re.sub(r'(?<!\$)\b([a-z])\^(\d+)(?!\$)', r'$\1^\2$', text)
+    return re.sub(r'(?<!\$)\\frac\{([^}]+)\}\{([^}]+)\}(?!\$)', r'$\\frac{\1}{\2}$', text)
+
+
+def _legacy_escape(text: str) -> str:
+    """The previous replace per character, kept as the benchmark baseline"""
+    for char, escaped in _LATEX_ESCAPES.items():
+        text = text.replace(char, escaped)
+    return text
+
+
+# Extra material mixed into generated messages: bare math for wrap_inline_math,
+# LaTeX special characters, prices, long prose and math-free replies
+_CORPUS_FRAGMENTS = [
+    "Now try x^2 + 3x = 10 on your own, then simplify \\frac{6}{8}.",
+    "Use 50% of the points & skip question #3 - the answer_key is on page 4.",
+    "It costs $12 today and $15 tomorrow; that's a $3 difference.",
+    "Keep going, you're doing really well. Take your time and read the question carefully, "
+    "then write down what you know and what you need to find before you start calculating.",
+    "Good thinking!",
+    "Compare $\\frac{3}{4}$ and $0.7$: which is larger, and by how much?",
+    "$$\\int_0^1 x^2 \\, dx = \\frac{1}{3}$$",
+]
+
+
+def build_corpus(size: int = 2000, seed: int = 0) -> List[str]:
+    """
+    Generate tutor-like messages for the benchmark
+
+    Each message joins one to four sample replies and fragments, so lengths
+    and the mix of math, prices and plain prose vary like real transcripts.
+
+    Args:
+        size: Number of messages
+        seed: Random seed (the same seed gives the same corpus)
+
+    Returns:
+        List of messages
+    """
+    import random
+
+    rng = random.Random(seed)
+    pool = SAMPLE_TUTOR_MESSAGES + _CORPUS_FRAGMENTS
+    return ["\n\n".join(rng.choice(pool) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def load_tutor_messages(database_url: str, limit: int = 1000) -> List[str]:
+    """Load recent tutor replies from a database to benchmark against"""
+    from ..database.db_manager import DatabaseManager
+    from ..database.models import Message
+
+    db = DatabaseManager(database_url)
+    with db.get_session() as session:
+        rows = (session.query(Message.content)
+                .filter(Message.role == "tutor")
+                .order_by(Message.id.desc())
+                .limit(limit)
+                .all())
+    return [row.content for row in rows]
+
+
+def run_benchmark(messages: List[str] = None, iterations: int = 10) -> Dict:
+    """
+    Time the math helpers over a corpus of tutor messages, before and after
+    the single-pass tokenizer
+
+    Args:
+        messages: Corpus (build_corpus() by default)
+        iterations: Passes over the corpus
+
+    Returns:
+        Dict with corpus size and, per helper, microseconds per message for the
+        legacy and the tokenizer-based implementation (the legacy wrap and
+        escape run over the whole text, math included, so they are a lower bound)
+    """
+    import time
+
+    messages = messages or build_corpus()
+
+    def measure(fn):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for message in messages:
+                fn(message)
+        return (time.perf_counter() - start) * 1e6 / (iterations * len(messages))
+
+    return {
+        "messages": len(messages),
+        "chars": sum(len(message) for message in messages),
+        "contains_latex": {
+            "legacy_us": measure(_legacy_contains_latex),
+            "tokenizer_us": measure(MathRenderer.contains_latex)
+        },
+        "extract_latex_expressions": {
+            "legacy_us": measure(_legacy_extract),
+            "tokenizer_us": measure(MathRenderer.extract_latex_expressions)
+        },
+        "tokenize_math": {
+            "legacy_us": None,
+            "tokenizer_us": measure(tokenize_math)
+        },
+        "wrap_inline_math": {
+            "legacy_us": measure(_legacy_wrap_inline_math),
+            "tokenizer_us": measure(MathRenderer.wrap_inline_math)
+        },
+        "escape_latex_special_chars": {
+            "legacy_us": measure(_legacy_escape),
+            "tokenizer_us": measure(MathRenderer.escape_latex_special_chars)
+        }
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the math tokenizer over tutor messages")
+    parser.add_argument("--database", help="Load tutor messages from this database URL "
+                                           "(default: a generated corpus)")
+    parser.add_argument("--limit", type=int, default=1000, help="Messages loaded from the database")
+    parser.add_argument("--size", type=int, default=2000, help="Messages in the generated corpus")
+    parser.add_argument("--iterations", type=int, default=10, help="Passes over the corpus")
+
+    args = parser.parse_args()
+
+    corpus = load_tutor_messages(args.database, args.limit) if args.database else build_corpus(args.size)
+    results = run_benchmark(corpus, args.iterations)
+    print(f"{results['messages']} messages, {results['chars']} characters")
+    for helper in ("contains_latex", "extract_latex_expressions", "tokenize_math",
+                   "wrap_inline_math", "escape_latex_special_chars"):
+        timings = results[helper]
+        if timings["legacy_us"] is None:
+            print(f"{helper:>27}: {timings['tokenizer_us']:.2f} us/message")
+        else:
+            print(f"{helper:>27}: legacy {timings['legacy_us']:.2f} us, tokenizer "
+                  f"{timings['tokenizer_us']:.2f} us/message "
+                  f"({timings['legacy_us'] / timings['tokenizer_us']:.1f}x)")
+    print("(the legacy helpers take prices and escaped dollars for math, and the legacy wrap "
+          "and escape also rewrite inside math, so they do less work)")
@@ -0,0 +1,440 @@
+"""Metrics - counters, gauges and histograms in Prometheus text format
+
+The hot path only touches a dict lookup and a lock-guarded add per sample.
+Anything that can be read instead of counted (queue depths, cache hit
+ratios, active sessions) is a callback gauge evaluated at scrape time, so it
+costs nothing between scrapes. MetricsServer serves the registry on a
+sidecar port for a local Prometheus (or any scraper) to read /metrics.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .perf_store import perf_store
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a fast SQL statement to a long AI call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Base for metrics with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple) -> Tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels):
+        """Add to the count for a label combination (positional, in labelnames order)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values)]
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from a callback
+
+    The callback returns a number, or a dict mapping label tuples to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str,
+                 callback: Callable[[], Union[float, Dict[Tuple, float]]],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        try:
+            result = self.callback()
+        except Exception:
+            logger.warning("Gauge %s failed", self.name, exc_info=True)
+            return []
+        if result is None:
+            return []
+        if not isinstance(result, dict):
+            result = {(): result}
+        return [f"{self.name}{_format_labels(self.labelnames, self._key(key))} {_format_value(float(value))}"
+                for key, value in sorted(result.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        """Record one value for a label combination"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of a block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def get_count(self, *labels) -> int:
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return int(sum(counts[:-1])) if counts else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+
+        lines = []
+        for key, counts in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, Gauge):
+                # Modules may be reloaded (Streamlit reruns) - keep the live instance
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str,
+              callback: Callable[[], Union[float, Dict[Tuple, float]]],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        """Create (or replace) a callback gauge"""
+        return self._register(Gauge(name, help_text, callback, labelnames))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# ==================== Built-in metrics ====================
+
+AI_REQUEST_SECONDS = registry.histogram(
+    "mathtutor_ai_request_seconds", "AI request latency by route, model and outcome",
+    ("route", "model", "status")
+)
+AI_TOKENS = registry.counter(
+    "mathtutor_ai_tokens_total", "AI tokens by route, model and direction",
+    ("route", "model", "direction")
+)
+AI_COST = registry.counter(
+    "mathtutor_ai_cost_usd_total", "Estimated AI cost in USD by route and model",
+    ("route", "model")
+)
+DB_METHOD_SECONDS = registry.histogram(
+    "mathtutor_db_method_seconds", "DatabaseManager method latency", ("method",)
+)
+DB_STATEMENTS = registry.counter(
+    "mathtutor_db_statements_total", "SQL statements by calling method and operation",
+    ("method", "operation")
+)
+DB_STATEMENT_SECONDS = registry.histogram(
+    "mathtutor_db_statement_seconds", "SQL statement latency by operation", ("operation",)
+)
+SESSION_EVENTS = registry.counter(
+    "mathtutor_tutoring_sessions_total", "Tutoring sessions started, ended and expired (idle timeout)",
+    ("event",)
+)
+RENDER_SECONDS = registry.histogram(
+    "mathtutor_render_seconds", "Streamlit script run (rerun) time by page", ("page",)
+)
+
+
+_db_method = threading.local()
+
+
+def current_db_method() -> Optional[str]:
+    """Outermost instrumented DatabaseManager method running on this thread"""
+    return getattr(_db_method, "name", None)
+
+
+def instrument_methods(cls, exclude: Sequence[str] = ()):
+    """
+    Time every public method of a data-access class
+
+    The method name is also remembered per thread, so the SQL statements it
+    runs are counted against it.
+
+    Args:
+        cls: Class whose public methods are wrapped in place
+        exclude: Method names left alone (context managers, event plumbing)
+    """
+    import functools
+
+    def wrap(name, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            if not registry.enabled:
+                return method(*args, **kwargs)
+            outer = getattr(_db_method, "name", None)
+            _db_method.name = outer or name
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if outer is None:
+                    _db_method.name = None
+                    DB_METHOD_SECONDS.observe(time.perf_counter() - start, name)
+        return timed
+
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or name in exclude or not callable(method):
+            continue
+        setattr(cls, name, wrap(name, method))
+    return cls
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement run on a SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if registry.enabled:
+            conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        operation = statement.lstrip()[:6].upper() if statement else "OTHER"
+        operation = operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+        DB_STATEMENTS.inc(1, current_db_method() or "other", operation)
+        DB_STATEMENT_SECONDS.observe(elapsed, operation)
+        perf_store.record_statement(operation, statement or "", elapsed * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        starts = conn.info.get("_metrics_start") if conn is not None else None
+        if starts:
+            starts.pop()
+
+
+class ActiveSessions:
+    """Browser sessions seen within a time window"""
+
+    def __init__(self, window_seconds: int = 300):
+        self.window_seconds = window_seconds
+        self._seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: Optional[str]):
+        """Mark a session as active now"""
+        if session_id:
+            with self._lock:
+                self._seen[session_id] = time.monotonic()
+
+    def count(self) -> int:
+        """Sessions seen within the window (older ones are forgotten)"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            for session_id in [sid for sid, seen in self._seen.items() if seen < cutoff]:
+                del self._seen[session_id]
+            return len(self._seen)
+
+
+active_sessions = ActiveSessions()
+
+
+def observe_render(page: str, start: float):
+    """
+    Record a page's script run time and mark the browser session active
+
+    Args:
+        page: Page name used as the label
+        start: time.perf_counter() taken at the top of the script
+    """
+    if not registry.enabled:
+        return
+    RENDER_SECONDS.observe(time.perf_counter() - start, page)
+
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        active_sessions.touch(ctx.session_id)
+
+
+# ==================== HTTP endpoint ====================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves GET /metrics"""
+
+    server: "MetricsServer"
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Scrapes are too frequent to log"""
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Sidecar HTTP server exposing a registry at /metrics"""
+
+    daemon_threads = True
+
+    def __init__(self, metrics_registry: MetricsRegistry = None, host: str = "127.0.0.1",
+                 port: int = 9464):
+        """
+        Initialize metrics server
+
+        Args:
+            metrics_registry: Registry to expose (the shared one by default)
+            host: Address to bind (keep it local unless a firewall fronts it)
+            port: Port to bind (0 picks a free one)
+        """
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = metrics_registry or registry
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        """Serve in a background thread"""
+        threading.Thread(target=self.serve_forever, name="metrics-server", daemon=True).start()
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9464) -> Optional[MetricsServer]:
+    """
+    Start the sidecar metrics endpoint
+
+    Returns:
+        The running server, or None if the port could not be bound
+    """
+    try:
+        server = MetricsServer(registry, host, port)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    server.start()
+    logger.info("Serving metrics on %s", server.url)
+    return server
@@ -0,0 +1,227 @@
+"""Performance store - in-process ring buffers behind the Performance page
+
+Finished traces, AI calls and slow SQL statements are appended to bounded
+deques as they happen; the page aggregates them on read. Nothing here
+touches the database, so watching the page adds no load to what it watches.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0.0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class PerfStore:
+    """Recent requests, AI calls and slow statements of this process"""
+
+    def __init__(self, max_requests: int = 2000, max_ai_calls: int = 5000,
+                 max_slow_statements: int = 200, slow_statement_ms: float = 50.0):
+        """
+        Initialize performance store
+
+        Args:
+            max_requests: Finished requests (traces) kept
+            max_ai_calls: AI calls kept
+            max_slow_statements: Slow SQL statements kept
+            slow_statement_ms: Statements at least this slow are kept
+        """
+        self.slow_statement_ms = slow_statement_ms
+        self._requests: deque = deque(maxlen=max_requests)
+        self._ai_calls: deque = deque(maxlen=max_ai_calls)
+        self._slow_statements: deque = deque(maxlen=max_slow_statements)
+        self._lock = threading.Lock()
+
+    # ==================== Recording ====================
+
+    def record_trace(self, trace):
+        """Keep a finished trace's timing, split into AI, database and other time"""
+        root = trace.root
+        ai_ms = sum(span.duration_ms for span in trace.spans if span.name == "ai.request")
+        db_ms = sum(span.duration_ms for span in trace.spans if span.name.startswith("db."))
+        entry = {
+            "time": root.start_ns / 1e9,
+            "name": root.name,
+            "duration_ms": root.duration_ms,
+            "ai_ms": ai_ms,
+            "db_ms": db_ms,
+            "statements": sum(1 for span in trace.spans if span.name.startswith("db.")),
+            "student_id": root.attributes.get("student_id"),
+            "ok": root.error is None,
+            "trace_id": trace.trace_id
+        }
+        with self._lock:
+            self._requests.append(entry)
+
+    def record_ai_call(self, route: str, model: str, latency_ms: float, input_tokens: int = 0,
+                       output_tokens: int = 0, cost: float = 0.0, ok: bool = True,
+                       student_id: int = None):
+        """Keep one AI call"""
+        entry = {
+            "time": time.time(),
+            "route": route,
+            "model": model,
+            "latency_ms": latency_ms,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": cost,
+            "ok": ok,
+            "student_id": student_id
+        }
+        with self._lock:
+            self._ai_calls.append(entry)
+
+    def record_statement(self, operation: str, statement: str, duration_ms: float):
+        """Keep a SQL statement if it was slow"""
+        if duration_ms < self.slow_statement_ms:
+            return
+        entry = {
+            "time": time.time(),
+            "operation": operation,
+            "statement": statement[:500],
+            "duration_ms": duration_ms
+        }
+        with self._lock:
+            self._slow_statements.append(entry)
+
+    # ==================== Reading ====================
+
+    def _since(self, buffer: deque, window_seconds: Optional[float]) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(buffer)
+        if window_seconds is None:
+            return entries
+        cutoff = time.time() - window_seconds
+        return [entry for entry in entries if entry["time"] >= cutoff]
+
+    def recent_requests(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent finished requests, newest first"""
+        with self._lock:
+            entries = list(self._requests)[-limit:]
+        entries.reverse()
+        return entries
+
+    def latency_summary(self, window_seconds: float = 900) -> Dict[str, Dict[str, float]]:
+        """
+        Latency of requests in a window, per request type
+
+        Returns:
+            Dict mapping request name to count, errors, p50/p95/max ms and the
+            average share of time spent in AI calls and SQL
+        """
+        by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self._since(self._requests, window_seconds):
+            by_name.setdefault(entry["name"], []).append(entry)
+
+        summary = {}
+        for name, entries in by_name.items():
+            durations = [entry["duration_ms"] for entry in entries]
+            total = sum(durations) or 1.0
+            summary[name] = {
+                "count": len(entries),
+                "errors": sum(1 for entry in entries if not entry["ok"]),
+                "p50_ms": _percentile(durations, 50),
+                "p95_ms": _percentile(durations, 95),
+                "max_ms": max(durations),
+                "ai_share": sum(entry["ai_ms"] for entry in entries) / total,
+                "db_share": sum(entry["db_ms"] for entry in entries) / total,
+                "statements_per_request": sum(entry["statements"] for entry in entries) / len(entries)
+            }
+        return summary
+
+    def ai_timeseries(self, window_seconds: float = 3600, bucket_seconds: float = 60) -> List[Dict[str, Any]]:
+        """
+        AI calls, tokens and cost per time bucket
+
+        Returns:
+            List of buckets (oldest first) with 'time', 'calls', 'errors',
+            'input_tokens', 'output_tokens' and 'cost'
+        """
+        buckets: Dict[float, Dict[str, Any]] = {}
+        for entry in self._since(self._ai_calls, window_seconds):
+            start = entry["time"] - entry["time"] % bucket_seconds
+            bucket = buckets.setdefault(start, {
+                "time": start, "calls": 0, "errors": 0,
+                "input_tokens": 0, "output_tokens": 0, "cost": 0.0
+            })
+            bucket["calls"] += 1
+            bucket["errors"] += 0 if entry["ok"] else 1
+            bucket["input_tokens"] += entry["input_tokens"]
+            bucket["output_tokens"] += entry["output_tokens"]
+            bucket["cost"] += entry["cost"]
+        return [buckets[start] for start in sorted(buckets)]
+
+    def ai_by_route(self, window_seconds: float = 3600) -> Dict[str, Dict[str, float]]:
+        """AI calls, tokens, cost and p95 latency per route and model in a window"""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self._since(self._ai_calls, window_seconds):
+            groups.setdefault(f"{entry['route']} / {entry['model']}", []).append(entry)
+        return {
+            key: {
+                "calls": len(entries),
+                "errors": sum(1 for entry in entries if not entry["ok"]),
+                "tokens": sum(entry["input_tokens"] + entry["output_tokens"] for entry in entries),
+                "cost": sum(entry["cost"] for entry in entries),
+                "p95_ms": _percentile([entry["latency_ms"] for entry in entries], 95)
+            }
+            for key, entries in groups.items()
+        }
+
+    def heavy_hitters(self, window_seconds: float = 3600, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Students using the most AI tokens in a window
+
+        Returns:
+            List (heaviest first) of dicts with 'student_id', 'ai_calls',
+            'tokens', 'cost', 'requests' and 'request_ms'
+        """
+        students: Dict[Any, Dict[str, Any]] = {}
+
+        def entry_for(student_id):
+            return students.setdefault(student_id, {
+                "student_id": student_id, "ai_calls": 0, "tokens": 0, "cost": 0.0,
+                "requests": 0, "request_ms": 0.0
+            })
+
+        for entry in self._since(self._ai_calls, window_seconds):
+            if entry["student_id"] is None:
+                continue
+            student = entry_for(entry["student_id"])
+            student["ai_calls"] += 1
+            student["tokens"] += entry["input_tokens"] + entry["output_tokens"]
+            student["cost"] += entry["cost"]
+
+        for entry in self._since(self._requests, window_seconds):
+            if entry["student_id"] is None:
+                continue
+            student = entry_for(entry["student_id"])
+            student["requests"] += 1
+            student["request_ms"] += entry["duration_ms"]
+
+        ranked = sorted(students.values(), key=lambda item: (-item["tokens"], -item["request_ms"]))
+        return ranked[:limit]
+
+    def slow_statements(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent slow SQL statements, newest first"""
+        with self._lock:
+            entries = list(self._slow_statements)[-limit:]
+        entries.reverse()
+        return entries
+
+    def clear(self):
+        """Forget everything recorded"""
+        with self._lock:
+            self._requests.clear()
+            self._ai_calls.clear()
+            self._slow_statements.clear()
+
+
+perf_store = PerfStore()
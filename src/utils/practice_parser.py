@@ -0,0 +1,179 @@
+"""Practice set parsing - splits AI-generated practice content into problems and solutions"""
+
+import hashlib
+import re
+from typing import Dict
+
+from .cache import LRUCache
+
+
+# Headings that separate the problems from the solutions
+SOLUTION_SPLIT_PATTERNS = [
+    re.compile(r'\n#+\s*Solutions?\s*\n', re.IGNORECASE),
+    re.compile(r'\n\*\*Solutions?\*\*\s*\n', re.IGNORECASE),
+    re.compile(r'\n##\s*Solutions?\s*\n', re.IGNORECASE),
+    re.compile(r'\nSOLUTIONS?\s*\n', re.IGNORECASE)
+]
+
+PROBLEM_PATTERN = re.compile(
+    r'\*\*Problem\s*(\d+)[:\.]?\*\*\s*(.*?)(?=\*\*Problem\s*\d+|\Z)',
+    re.DOTALL | re.IGNORECASE
+)
+PROBLEM_FALLBACK_SPLIT = re.compile(r'\n(?:\d+[\.\)]|\-{3,})\s*')
+SOLUTION_PATTERN = re.compile(
+    r'\*\*(?:Problem\s*)?(\d+)[:\.]?\s*(?:Solution)?[:\.]?\*\*\s*(.*?)(?=\*\*(?:Problem\s*)?\d+|\Z)',
+    re.DOTALL | re.IGNORECASE
+)
+
+BR_TAG = re.compile(r'<br\s*/?>')
+HTML_TAG = re.compile(r'<[^>]+>')
+BOLD_MARKER = re.compile(r'\*\*')
+RULE_LINE = re.compile(r'^[\-\_\*]{2,}', re.MULTILINE)
+
+# Parsed sets keyed by content hash, shared by every session in the process
+_parsed_sets = LRUCache(max_size=256, name="parsed_practice_sets")
+
+
+def content_hash(content: str) -> str:
+    """Get the SHA-256 hex digest of practice content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def clean_problem_text(text: str) -> str:
+    """Strip HTML, bold markers and rule lines from a problem statement"""
+    text = BR_TAG.sub('\n', text.strip())
+    text = HTML_TAG.sub('', text)
+    text = BOLD_MARKER.sub('', text)  # Remove markdown bold markers
+    text = RULE_LINE.sub('', text)  # Remove --- or *** lines
+    return text.strip()
+
+
+def clean_solution_text(text: str) -> str:
+    """Strip HTML from a solution for display"""
+    text = BR_TAG.sub('\n', text)
+    return HTML_TAG.sub('', text)
+
+
+def _parse(content: str) -> Dict:
+    """Parse practice content without caching"""
+    problems_part = content
+    solutions_part = None
+
+    # Split by Solutions heading
+    for pattern in SOLUTION_SPLIT_PATTERNS:
+        match = pattern.search(content)
+        if match:
+            problems_part = content[:match.start()]
+            solutions_part = content[match.end():]
+            break
+
+    # Parse individual problems
+    problems = PROBLEM_PATTERN.findall(problems_part)
+
+    if not problems:
+        # Fallback: try to split by numbers or dashes
+        problem_splits = PROBLEM_FALLBACK_SPLIT.split(problems_part)
+        problems = [(str(i + 1), prob.strip()) for i, prob in enumerate(problem_splits) if prob.strip()]
+
+    # Parse solutions
+    solutions = {}
+    if solutions_part:
+        solutions = {num: sol.strip() for num, sol in SOLUTION_PATTERN.findall(solutions_part)}
+
+    return {
+        "set_key": content_hash(content)[:16],
+        "problems": tuple((num, clean_problem_text(text)) for num, text in problems),
+        "solutions": solutions,
+        "solution_texts": {num: clean_solution_text(sol) for num, sol in solutions.items()}
+    }
+
+
+def parse_practice_content(content: str) -> Dict:
+    """
+    Parse a practice set, memoized by content hash
+
+    The result is shared between sessions and must be treated as read-only.
+
+    Args:
+        content: Practice set content from the AI
+
+    Returns:
+        Dict with 'set_key', 'problems' (number, cleaned text) pairs,
+        'solutions' by number and 'solution_texts' cleaned for display
+    """
+    return _parsed_sets.get_or_compute(content_hash(content), lambda: _parse(content))
+
+
+def get_cache_stats() -> Dict:
+    """Get statistics of the parsed practice set cache"""
+    return _parsed_sets.get_stats()
+
+
+# ==================== Benchmark ====================
+
+def _sample_content(problem_count: int) -> str:
+    """Build a practice set shaped like the generator's output"""
+    problems = "\n\n".join(
+        f"**Problem {n}:** A <b>train</b> travels {n * 40} miles in {n + 1} hours.<br>"
+        f"What is its average speed in miles per hour?\n---"
+        for n in range(1, problem_count + 1)
+    )
+    solutions = "\n\n".join(
+        f"**Problem {n} Solution:** Divide distance by time.<br>"
+        f"{n * 40} / {n + 1} = {n * 40 / (n + 1):.2f}\nFinal answer: {n * 40 / (n + 1):.2f} mph"
+        for n in range(1, problem_count + 1)
+    )
+    return f"# Practice Set\n\n{problems}\n\n## Solutions\n\n{solutions}\n"
+
+
+def run_benchmark(problem_count: int = 10, iterations: int = 2000) -> Dict:
+    """
+    Time the parsing done on each practice page rerun, uncached vs cached
+
+    Args:
+        problem_count: Problems in the generated set
+        iterations: Reruns to time
+
+    Returns:
+        Dict with mean and p95 latency in milliseconds for both paths
+    """
+    import time
+
+    content = _sample_content(problem_count)
+    _parsed_sets.pop(content_hash(content))
+
+    def measure(fn):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn(content)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            "mean_ms": sum(timings) / len(timings),
+            "p95_ms": timings[int(len(timings) * 0.95) - 1]
+        }
+
+    parsed = _parse(content)
+    return {
+        "problems_parsed": len(parsed["problems"]),
+        "content_chars": len(content),
+        "uncached": measure(_parse),
+        "cached": measure(parse_practice_content)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark practice set parsing per rerun")
+    parser.add_argument("--problems", type=int, default=10, help="Problems in the set")
+    parser.add_argument("--iterations", type=int, default=2000, help="Reruns to time")
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.problems, args.iterations)
+    print(f"{results['problems_parsed']} problems, {results['content_chars']} characters")
+    for path in ("uncached", "cached"):
+        print(f"{path:>9}: mean {results[path]['mean_ms']:.4f} ms, p95 {results[path]['p95_ms']:.4f} ms")
+    print(f"  speedup: {results['uncached']['mean_ms'] / results['cached']['mean_ms']:.1f}x")
@@ -0,0 +1,467 @@
+"""Shared cache - key/value and pub/sub shared by app replicas
+
+LocalSharedCache keeps everything in the process (single replica, the
+default). RedisSharedCache speaks the Redis protocol (RESP) over a plain
+socket, so it works against Redis, Valkey or RespStandInServer below without
+extra dependencies.
+"""
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache:
+    """Base class for caches shared between replicas"""
+
+    def get(self, key: str) -> Any:
+        """Get a value (None if missing or expired)"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
+        """Store a JSON-serializable value"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove a value"""
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl_seconds: int = None) -> bool:
+        """Store a value only if the key is missing (True if it was stored)"""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl_seconds: int = None) -> int:
+        """
+        Atomically add to an integer counter, creating it at 0 if missing
+
+        Args:
+            key: Counter key
+            amount: Amount to add
+            ttl_seconds: Expiry set when the counter is created
+
+        Returns:
+            The counter's new value
+        """
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: Dict):
+        """Send a message to every subscriber of a channel"""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callable[[Dict], None]):
+        """Call callback(message) for every message published on a channel"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections"""
+
+
+class LocalSharedCache(SharedCache):
+    """In-process shared cache - the default for a single replica"""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._subscribers: Dict[str, List[Callable[[Dict], None]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[1] is not None and entry[1] <= time.time():
+                del self._data[key]
+                entry = None
+        return entry[0] if entry else None
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
+        expires = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _live(self, key: str) -> Optional[tuple]:
+        """Get an unexpired entry (lock held)"""
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def add(self, key: str, value: Any, ttl_seconds: int = None) -> bool:
+        expires = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (value, expires)
+            return True
+
+    def incr(self, key: str, amount: int = 1, ttl_seconds: int = None) -> int:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = (0, time.time() + ttl_seconds if ttl_seconds else None)
+            value = int(entry[0]) + amount
+            self._data[key] = (value, entry[1])
+            return value
+
+    def publish(self, channel: str, message: Dict):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Subscriber failed on channel %s", channel)
+
+    def subscribe(self, channel: str, callback: Callable[[Dict], None]):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+
+# ==================== RESP protocol ====================
+
+def _encode_command(*args) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+def _read_reply(stream):
+    """Read one RESP reply from a buffered socket file"""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, payload = line[:1], line[1:-2]
+
+    if kind == b"+":
+        return payload.decode('utf-8')
+    if kind == b"-":
+        raise RuntimeError(payload.decode('utf-8'))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [_read_reply(stream) for _ in range(length)]
+    raise RuntimeError(f"Unexpected RESP reply: {line!r}")
+
+
+class RedisSharedCache(SharedCache):
+    """Shared cache over the Redis protocol
+
+    Commands go over one locked connection; each subscription gets its own
+    connection and a daemon reader thread that reconnects on failure.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "mathtutor:",
+                 timeout: float = 5.0):
+        """
+        Initialize Redis-protocol cache
+
+        Args:
+            url: redis://host:port/db URL
+            prefix: Prefix for every key, so deployments can share a server
+            timeout: Socket timeout in seconds for commands
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.password = parsed.password
+        self.prefix = prefix
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._sock = None
+        self._stream = None
+        self._closed = False
+
+    def _connect(self, timeout: Optional[float]):
+        """Open an authenticated connection and select the database"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.settimeout(timeout)
+        stream = sock.makefile("rb")
+        if self.password:
+            sock.sendall(_encode_command("AUTH", self.password))
+            _read_reply(stream)
+        if self.db:
+            sock.sendall(_encode_command("SELECT", self.db))
+            _read_reply(stream)
+        return sock, stream
+
+    def execute(self, *args):
+        """Run one command, reconnecting once if the connection dropped"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock, self._stream = self._connect(self.timeout)
+                    self._sock.sendall(_encode_command(*args))
+                    return _read_reply(self._stream)
+                except (OSError, ConnectionError):
+                    self._reset()
+                    if attempt:
+                        raise
+
+    def _reset(self):
+        """Drop the command connection (lock held)"""
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._stream = None
+
+    def get(self, key: str) -> Any:
+        data = self.execute("GET", self.prefix + key)
+        return json.loads(data) if data is not None else None
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
+        args = ["SET", self.prefix + key, json.dumps(value)]
+        if ttl_seconds:
+            args += ["EX", int(ttl_seconds)]
+        self.execute(*args)
+
+    def delete(self, key: str):
+        self.execute("DEL", self.prefix + key)
+
+    def add(self, key: str, value: Any, ttl_seconds: int = None) -> bool:
+        args = ["SET", self.prefix + key, json.dumps(value), "NX"]
+        if ttl_seconds:
+            args += ["EX", int(ttl_seconds)]
+        return self.execute(*args) is not None
+
+    def incr(self, key: str, amount: int = 1, ttl_seconds: int = None) -> int:
+        value = self.execute("INCRBY", self.prefix + key, int(amount))
+        if ttl_seconds and value == amount:
+            # This call created the counter
+            self.execute("EXPIRE", self.prefix + key, int(ttl_seconds))
+        return value
+
+    def publish(self, channel: str, message: Dict):
+        self.execute("PUBLISH", self.prefix + channel, json.dumps(message))
+
+    def subscribe(self, channel: str, callback: Callable[[Dict], None]):
+        thread = threading.Thread(target=self._listen, args=(self.prefix + channel, callback),
+                                  name=f"shared-cache-sub-{channel}", daemon=True)
+        thread.start()
+
+    def _listen(self, channel: str, callback: Callable[[Dict], None]):
+        """Subscriber thread - deliver messages, reconnecting with backoff"""
+        backoff = 0.5
+        while not self._closed:
+            try:
+                sock, stream = self._connect(None)
+                sock.sendall(_encode_command("SUBSCRIBE", channel))
+                _read_reply(stream)
+                backoff = 0.5
+                while not self._closed:
+                    reply = _read_reply(stream)
+                    if isinstance(reply, list) and reply[0] == b"message":
+                        try:
+                            callback(json.loads(reply[2]))
+                        except Exception:
+                            logger.exception("Subscriber failed on channel %s", channel)
+            except (OSError, ConnectionError, RuntimeError):
+                if self._closed:
+                    return
+                logger.warning("Lost subscription to %s, reconnecting", channel)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            self._reset()
+
+
+def create_shared_cache(url: str = None) -> SharedCache:
+    """
+    Create the shared cache for a deployment
+
+    Args:
+        url: redis:// URL of the shared server (None for the in-process cache)
+
+    Returns:
+        Shared cache instance
+    """
+    if not url:
+        return LocalSharedCache()
+    if url.startswith("redis://"):
+        return RedisSharedCache(url)
+    raise ValueError(f"Unsupported shared cache URL: {url}")
+
+
+# ==================== Local stand-in server ====================
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """One client connection to RespStandInServer"""
+
+    def handle(self):
+        server: "RespStandInServer" = self.server
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+
+            name = command[0].decode().upper()
+            args = command[1:]
+            try:
+                if name == "SUBSCRIBE":
+                    self._subscribe(server, args)
+                    return
+                self.wfile.write(server.execute(name, args))
+            except OSError:
+                return
+
+    def _subscribe(self, server: "RespStandInServer", channels: List[bytes]):
+        """Switch the connection to subscriber mode until the client leaves"""
+        lock = threading.Lock()
+
+        def deliver(payload: bytes):
+            with lock:
+                self.wfile.write(payload)
+
+        for count, channel in enumerate(channels, 1):
+            server.add_subscriber(channel, deliver)
+            deliver(b"*3\r\n$9\r\nsubscribe\r\n" + _bulk(channel) + f":{count}\r\n".encode())
+        try:
+            while self.rfile.readline():
+                pass
+        finally:
+            for channel in channels:
+                server.remove_subscriber(channel, deliver)
+
+
+def _bulk(data: Optional[bytes]) -> bytes:
+    """Encode a RESP bulk string"""
+    if data is None:
+        return b"$-1\r\n"
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+class RespStandInServer(socketserver.ThreadingTCPServer):
+    """Minimal Redis-protocol server for local multi-replica runs and testing
+
+    Supports PING, AUTH, SELECT, GET, SET (with EX and NX), DEL, INCRBY, EXPIRE,
+    PUBLISH and SUBSCRIBE - what RedisSharedCache uses. Data lives in memory only.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6380):
+        super().__init__((host, port), _RespHandler)
+        self._data: Dict[bytes, tuple] = {}
+        self._subscribers: Dict[bytes, List[Callable[[bytes], None]]] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, name: str, args: List[bytes]) -> bytes:
+        """Run a non-subscribe command and return the encoded reply"""
+        with self._lock:
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name in ("AUTH", "SELECT"):
+                return b"+OK\r\n"
+            if name == "GET":
+                entry = self._live(args[0])
+                return _bulk(entry[0] if entry else None)
+            if name == "SET":
+                options = [arg.upper() for arg in args[2:]]
+                expires = None
+                if b"EX" in options:
+                    expires = time.time() + int(options[options.index(b"EX") + 1])
+                if b"NX" in options and self._live(args[0]) is not None:
+                    return _bulk(None)
+                self._data[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if name == "INCRBY":
+                entry = self._live(args[0]) or (b"0", None)
+                try:
+                    value = int(entry[0]) + int(args[1])
+                except ValueError:
+                    return b"-ERR value is not an integer or out of range\r\n"
+                self._data[args[0]] = (str(value).encode(), entry[1])
+                return f":{value}\r\n".encode()
+            if name == "EXPIRE":
+                entry = self._live(args[0])
+                if entry is None:
+                    return b":0\r\n"
+                self._data[args[0]] = (entry[0], time.time() + int(args[1]))
+                return b":1\r\n"
+            if name == "DEL":
+                removed = sum(1 for key in args if self._data.pop(key, None) is not None)
+                return f":{removed}\r\n".encode()
+            if name == "PUBLISH":
+                subscribers = list(self._subscribers.get(args[0], []))
+            else:
+                return f"-ERR unknown command '{name}'\r\n".encode()
+
+        # PUBLISH - deliver outside the lock
+        payload = b"*3\r\n$7\r\nmessage\r\n" + _bulk(args[0]) + _bulk(args[1])
+        delivered = 0
+        for deliver in subscribers:
+            try:
+                deliver(payload)
+                delivered += 1
+            except OSError:
+                pass
+        return f":{delivered}\r\n".encode()
+
+    def _live(self, key: bytes) -> Optional[tuple]:
+        """Get an unexpired entry (lock held)"""
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def add_subscriber(self, channel: bytes, deliver: Callable[[bytes], None]):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(deliver)
+
+    def remove_subscriber(self, channel: bytes, deliver: Callable[[bytes], None]):
+        with self._lock:
+            if deliver in self._subscribers.get(channel, []):
+                self._subscribers[channel].remove(deliver)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local Redis-protocol stand-in server")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=6380, help="Port to listen on")
+
+    args = parser.parse_args()
+
+    with RespStandInServer(args.host, args.port) as server:
+        print(f"RESP stand-in listening on redis://{args.host}:{args.port}/0")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,217 @@
+"""Startup performance - background warm-up and import-time budget checks"""
+
+import ast
+import importlib
+import logging
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.parent.parent
+
+# Heavy dependencies kept out of the first paint; imported on first use or by the warm-up
+DEFERRED_MODULES = (
+    "anthropic",
+    "pandas",
+    "plotly.express",
+)
+
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+# ==================== Warm-up ====================
+
+def start_warmup(modules: Iterable[str] = DEFERRED_MODULES) -> bool:
+    """
+    Import deferred dependencies in a background thread (once per process)
+
+    Call after the first page has been rendered, so the first paint does not
+    wait for them but later AI calls and the Progress page do not either.
+
+    Args:
+        modules: Module names to import
+
+    Returns:
+        True if the warm-up was started by this call
+    """
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return False
+        _warmup_started = True
+
+    thread = threading.Thread(target=_warmup, args=(tuple(modules),),
+                              name="import-warmup", daemon=True)
+    thread.start()
+    return True
+
+
+def _configured_warmup() -> bool:
+    from .config import config
+
+    if not config.get('startup.warmup_enabled', True):
+        return False
+    start_warmup()
+    return True
+
+
+def init_warmup() -> bool:
+    """
+    Start the warm-up from any entry script (a Streamlit resource shared by all)
+
+    app.py and every page call this at the end of their run, so a student who
+    opens a page directly (a deep link, or a replica restarted under
+    launch.py --workers) warms the process too.
+
+    Returns:
+        True if the warm-up is enabled
+    """
+    import streamlit as st
+
+    return st.cache_resource(show_spinner=False)(_configured_warmup)()
+
+
+def _warmup(modules: tuple):
+    """Background job - import each module and log how long it took"""
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            logger.warning("Warm-up import of %s failed", name, exc_info=True)
+            continue
+        logger.debug("Warm-up imported %s in %.0f ms", name, (time.perf_counter() - start) * 1000)
+
+
+# ==================== Import-time budget ====================
+
+def entry_imports(script: Path) -> List[str]:
+    """
+    Get the modules a script imports at module level
+
+    Args:
+        script: Path to an entry script (app.py or a page)
+
+    Returns:
+        Absolute module names in import order
+    """
+    tree = ast.parse(Path(script).read_text(encoding="utf-8"))
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def _importtime(code: str, python: str) -> List[tuple]:
+    """Run code under `python -X importtime` and return (module, cumulative us, depth)"""
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{completed.stderr[-2000:]}")
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented two spaces per level after the separator
+        entries.append((name.strip(), int(cumulative), (len(name) - len(name.lstrip())) // 2))
+    return entries
+
+
+def measure_imports(modules: List[str], python: str = sys.executable) -> Dict:
+    """
+    Measure cold import time with `python -X importtime` in a fresh interpreter
+
+    Modules the interpreter itself loads at startup are not counted.
+
+    Args:
+        modules: Modules to import, in order
+        python: Interpreter to run
+
+    Returns:
+        Dict with 'total_ms', per-module 'modules' cumulative ms, the set of
+        every module 'loaded' and the 'slowest' top-level imports
+    """
+    startup = {name for name, _, _ in _importtime("pass", python)}
+    entries = _importtime("\n".join(f"import {name}" for name in modules), python)
+
+    loaded = {name for name, _, _ in entries} - startup
+    top_level = {
+        name: cumulative / 1000
+        for name, cumulative, depth in entries
+        if depth == 0 and name not in startup
+    }
+
+    return {
+        "total_ms": sum(top_level.values()),
+        "modules": top_level,
+        "loaded": loaded,
+        "slowest": sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:10]
+    }
+
+
+def check_budget(script: str = "app.py", budget_ms: float = 1500.0) -> Dict:
+    """
+    Check a script's import time against the time-to-first-paint budget
+
+    Fails when the imports take longer than the budget or pull in any of
+    DEFERRED_MODULES.
+
+    Args:
+        script: Entry script relative to the project root
+        budget_ms: Allowed cold import time in milliseconds
+
+    Returns:
+        Measurement dict (see measure_imports) with 'script', 'budget_ms',
+        'deferred_loaded' and 'passed'
+    """
+    result = measure_imports(entry_imports(BASE_DIR / script))
+    result["script"] = script
+    result["budget_ms"] = budget_ms
+    result["deferred_loaded"] = [name for name in DEFERRED_MODULES if name in result["loaded"]]
+    result["passed"] = result["total_ms"] <= budget_ms and not result["deferred_loaded"]
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.path.insert(0, str(BASE_DIR))
+    from src.utils.config import config
+
+    parser = argparse.ArgumentParser(description="Check cold import time of app.py and pages")
+    parser.add_argument("scripts", nargs="*", help="Entry scripts (default: app.py and pages/*.py)")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Import time budget per script")
+
+    args = parser.parse_args()
+
+    budget = args.budget_ms or config.get('startup.import_budget_ms', 1500)
+    scripts = args.scripts or ["app.py"] + sorted(
+        str(path.relative_to(BASE_DIR)) for path in (BASE_DIR / "pages").glob("*.py")
+    )
+
+    failed = False
+    for script in scripts:
+        result = check_budget(script, budget)
+        status = "OK  " if result["passed"] else "FAIL"
+        print(f"{status} {script}: {result['total_ms']:.0f} ms (budget {budget:.0f} ms)")
+        for name, ms in result["slowest"][:5]:
+            print(f"       {ms:8.1f} ms  {name}")
+        if result["deferred_loaded"]:
+            print(f"       imports deferred modules: {', '.join(result['deferred_loaded'])}")
+        failed = failed or not result["passed"]
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+"""Sticky reverse proxy - spreads browsers over app replicas, one replica per browser
+
+Streamlit keeps a browser's session on the replica its websocket is connected
+to, so every request from a browser must reach the same replica. The proxy
+works at the TCP level (websockets pass through untouched): it reads the
+request head of each new connection, routes by a replica cookie, and on a
+browser's first request picks the least busy replica and adds the cookie to
+the response.
+"""
+
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+COOKIE_NAME = "mathtutor_replica"
+COOKIE_PATTERN = re.compile(rb'(?im)^cookie:.*?\b' + COOKIE_NAME.encode() + rb'=(\d+)')
+MAX_HEAD_BYTES = 64 * 1024
+
+
+class StickyProxy:
+    """TCP reverse proxy with cookie-based sticky sessions"""
+
+    def __init__(self, backends: List[Tuple[str, int]], host: str = "0.0.0.0", port: int = 8501):
+        """
+        Initialize sticky proxy
+
+        Args:
+            backends: (host, port) of each app replica
+            host: Address to listen on
+            port: Port to listen on
+        """
+        self.backends = backends
+        self.host = host
+        self.port = port
+        self.active: Dict[int, int] = {index: 0 for index in range(len(backends))}
+        self.routed: Dict[int, int] = {index: 0 for index in range(len(backends))}
+
+    def choose_backend(self, head: bytes) -> Tuple[int, bool]:
+        """
+        Pick the replica for a request
+
+        Returns:
+            (backend index, whether the sticky cookie must be set)
+        """
+        match = COOKIE_PATTERN.search(head)
+        if match and int(match.group(1)) < len(self.backends):
+            return int(match.group(1)), False
+        return min(self.active, key=lambda index: self.active[index]), True
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        """Serve one client connection"""
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        index, set_cookie = self.choose_backend(head)
+        backend_reader, backend_writer = await self._connect(index)
+        if backend_writer is None:
+            client_writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await client_writer.drain()
+            client_writer.close()
+            return
+
+        self.active[index] += 1
+        self.routed[index] += 1
+        try:
+            backend_writer.write(head)
+            await backend_writer.drain()
+            cookie = f"{COOKIE_NAME}={index}" if set_cookie else None
+            await asyncio.gather(
+                self._pipe(client_reader, backend_writer),
+                self._pipe(backend_reader, client_writer, cookie)
+            )
+        finally:
+            self.active[index] -= 1
+            for writer in (client_writer, backend_writer):
+                writer.close()
+
+    async def _connect(self, index: int):
+        """Open a connection to a replica, failing over to the next ones"""
+        for offset in range(len(self.backends)):
+            host, port = self.backends[(index + offset) % len(self.backends)]
+            try:
+                return await asyncio.open_connection(host, port)
+            except OSError:
+                logger.warning("Replica %s:%s unreachable", host, port)
+        return None, None
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    cookie: Optional[str] = None):
+        """Copy bytes one way, adding Set-Cookie to the first response head if asked"""
+        try:
+            if cookie:
+                head = await reader.readuntil(b"\r\n\r\n")
+                status_line, _, rest = head.partition(b"\r\n")
+                writer.write(status_line + f"\r\nSet-Cookie: {cookie}; Path=/; HttpOnly; SameSite=Lax".encode()
+                             + b"\r\n" + rest)
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+    async def serve(self):
+        """Accept connections until cancelled"""
+        server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEAD_BYTES)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        """Run the proxy in the current thread until interrupted"""
+        asyncio.run(self.serve())
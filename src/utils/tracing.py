@@ -0,0 +1,498 @@
+"""Tracing - per-request spans for chat turns and practice flows
+
+A trace starts at a root span (a chat turn, a practice set) and collects the
+child spans opened while it runs: handler stages, AI requests and SQL
+statements. The current span travels in a contextvar, so AIClient and
+DatabaseManager attach their spans to whatever turn is running on the thread
+without being passed anything. Work handed to a thread pool keeps its parent
+when submitted through bind_context().
+
+Finished traces are kept in memory for the debug page waterfall and can be
+exported as JSONL (one span per line) or as OpenTelemetry OTLP/JSON, to a
+file or to a collector's /v1/traces endpoint.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "mathtutor"
+MAX_STATEMENT_CHARS = 200
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation inside a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "_start_perf", "error", "thread")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str = None,
+                 kind: int = KIND_INTERNAL, attributes: Dict[str, Any] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns = None
+        self.error = None
+        self.thread = threading.current_thread().name
+
+    def set_attribute(self, key: str, value: Any):
+        """Attach a value to the span"""
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        """Mark the span as failed (an exception or a message)"""
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        """Stop the clock (monotonic, so wall-clock jumps don't skew durations)"""
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or self.start_ns) - self.start_ns) / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flat representation used for JSONL export and the debug page"""
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "thread": self.thread
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OpenTelemetry OTLP/JSON span"""
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Encode one attribute as an OTLP key/value"""
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+class Trace:
+    """All spans of one request, in the order they started"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        # Spans may start on pool threads while the root is still open
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary plus spans, for the debug page"""
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start_ns": root.start_ns,
+            "duration_ms": round(root.duration_ms, 3),
+            "attributes": root.attributes,
+            "error": root.error,
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON ExportTraceServiceRequest holding this trace"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for span in self.spans]
+                }]
+            }]
+        }
+
+
+# ==================== Exporters ====================
+
+class JsonlExporter:
+    """Appends every span of a finished trace to a JSONL file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, trace: Trace):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in trace.spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+class OtlpFileExporter:
+    """Appends each finished trace as one OTLP/JSON request per line
+
+    The OpenTelemetry Collector's file receiver (otlpjsonfile) reads this format.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, trace: Trace):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(trace.to_otlp(), default=str) + "\n")
+
+
+class OtlpHttpExporter:
+    """Posts finished traces to an OTLP/HTTP collector (JSON encoding)"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        """
+        Args:
+            endpoint: Collector base URL (e.g. http://localhost:4318) or full /v1/traces URL
+            timeout: Request timeout in seconds
+        """
+        self.url = endpoint if endpoint.rstrip("/").endswith("/v1/traces") else endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, trace: Trace):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(trace.to_otlp(), default=str).encode('utf-8'),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+# ==================== Tracer ====================
+
+class Tracer:
+    """Creates spans, keeps recent traces and hands finished ones to exporters
+
+    Exporters run on a background thread, so a slow file system or collector
+    never adds to a student's wait.
+    """
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 1.0, max_traces: int = 200,
+                 trace_sql: bool = True, exporters: List[Any] = None):
+        """
+        Initialize tracer
+
+        Args:
+            enabled: Record spans at all
+            sample_rate: Fraction of root spans that start a recorded trace
+            max_traces: Finished traces kept in memory for the debug page
+            trace_sql: Record a span per SQL statement
+            exporters: Objects with export(trace), called for every finished trace
+        """
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.trace_sql = trace_sql
+        self.exporters = list(exporters or [])
+        self._listeners: List[Callable[[Trace], None]] = []
+        self._recent: deque = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=1000)
+        self._worker = None
+        self._stats = {"traces": 0, "spans": 0, "exported": 0, "export_errors": 0, "dropped": 0}
+
+    def configure(self, enabled: bool = None, sample_rate: float = None, max_traces: int = None,
+                  trace_sql: bool = None, exporters: List[Any] = None):
+        """Change settings in place (the module-level tracer is shared by every import)"""
+        if enabled is not None:
+            self.enabled = enabled
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if trace_sql is not None:
+            self.trace_sql = trace_sql
+        if exporters is not None:
+            self.exporters = list(exporters)
+        if max_traces is not None:
+            with self._lock:
+                self._recent = deque(self._recent, maxlen=max_traces)
+
+    def add_listener(self, callback: Callable[["Trace"], None]):
+        """Call a cheap, in-process callback with every finished trace (unlike exporters, inline)"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, kind: int = KIND_INTERNAL, **attributes):
+        """
+        Time a block as a span
+
+        Inside a running trace the span becomes a child of the current span.
+        Outside one, root=True starts a new trace; otherwise nothing is recorded.
+
+        Args:
+            name: Span name (e.g. "chat.turn", "db.get_conversation_history")
+            root: Start a trace if none is running
+            kind: OTLP span kind
+            **attributes: Values attached to the span
+
+        Yields:
+            The Span, or None when not recording
+        """
+        parent = _current_span.get()
+        if not self.enabled or (parent is None and (not root or random.random() >= self.sample_rate)):
+            yield None
+            return
+
+        trace = parent.trace if parent is not None else Trace()
+        span = Span(trace, name, parent.span_id if parent is not None else None, kind, attributes)
+        trace.add(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish_trace(trace)
+
+    def _finish_trace(self, trace: Trace):
+        """Keep a finished trace and queue it for export"""
+        with self._lock:
+            self._recent.append(trace)
+            self._stats["traces"] += 1
+            self._stats["spans"] += len(trace.spans)
+
+        for listener in self._listeners:
+            try:
+                listener(trace)
+            except Exception:
+                logger.warning("Trace listener %r failed", listener, exc_info=True)
+
+        if not self.exporters:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                    self._worker.start()
+
+    def _export_loop(self):
+        while True:
+            trace = self._queue.get()
+            for exporter in list(self.exporters):
+                try:
+                    exporter.export(trace)
+                    stat = "exported"
+                except Exception:
+                    logger.warning("Trace export to %s failed", type(exporter).__name__, exc_info=True)
+                    stat = "export_errors"
+                with self._lock:
+                    self._stats[stat] += 1
+            self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until queued traces are exported (True if the queue drained)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def recent_traces(self, limit: int = 50, name: str = None) -> List[Trace]:
+        """
+        Most recent finished traces, newest first
+
+        Args:
+            limit: Maximum traces returned
+            name: Only traces whose root span has this name
+        """
+        with self._lock:
+            traces = list(self._recent)
+        traces.reverse()
+        if name:
+            traces = [trace for trace in traces if trace.root.name == name]
+        return traces[:limit]
+
+    def get_trace(self, trace_id: str) -> Optional[Trace]:
+        """Find a recent trace by ID"""
+        with self._lock:
+            for trace in self._recent:
+                if trace.trace_id == trace_id:
+                    return trace
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counts of recorded traces and spans and of export results"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["kept"] = len(self._recent)
+        stats["export_queue"] = self._queue.qsize()
+        return stats
+
+
+tracer = Tracer()
+
+
+def span(name: str, root: bool = False, kind: int = KIND_INTERNAL, **attributes):
+    """Open a span on the shared tracer (see Tracer.span)"""
+    return tracer.span(name, root=root, kind=kind, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """Span running in this context, if any"""
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    """ID of the trace running in this context, if any"""
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Wrap a callable so it runs in the caller's context
+
+    Thread pools don't carry contextvars over, so work submitted through the
+    wrapper keeps the submitting span as its parent.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def instrument_engine(engine):
+    """
+    Record a span for every SQL statement run on a SQLAlchemy engine
+
+    Statements outside a trace cost one contextvar lookup.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if not tracer.trace_sql or _current_span.get() is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        manager = tracer.span(f"db.{operation.lower()}", kind=KIND_CLIENT,
+                              **{"db.system": engine.dialect.name,
+                                 "db.statement": statement[:MAX_STATEMENT_CHARS]})
+        manager.__enter__()
+        conn.info.setdefault("_trace_spans", []).append(manager)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("_trace_spans")
+        if spans:
+            manager = spans.pop()
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                current = _current_span.get()
+                if current is not None:
+                    current.set_attribute("db.rows", cursor.rowcount)
+            manager.__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("_trace_spans") if conn is not None else None
+        if spans:
+            manager = spans.pop()
+            error = exception_context.original_exception
+            manager.__exit__(type(error), error, None)
+
+
+def configure_tracing(settings: Dict[str, Any] = None) -> Tracer:
+    """
+    Apply the tracing section of config.yaml to the shared tracer
+
+    Args:
+        settings: Dict with enabled, sample_rate, max_traces, trace_sql,
+                  jsonl_path, otlp_path and otlp_endpoint
+
+    Returns:
+        The shared tracer
+    """
+    settings = settings or {}
+    exporters = []
+    if settings.get("jsonl_path"):
+        exporters.append(JsonlExporter(settings["jsonl_path"]))
+    if settings.get("otlp_path"):
+        exporters.append(OtlpFileExporter(settings["otlp_path"]))
+    if settings.get("otlp_endpoint"):
+        exporters.append(OtlpHttpExporter(settings["otlp_endpoint"]))
+
+    tracer.configure(
+        enabled=settings.get("enabled", True),
+        sample_rate=settings.get("sample_rate", 1.0),
+        max_traces=settings.get("max_traces", 200),
+        trace_sql=settings.get("trace_sql", True),
+        exporters=exporters
+    )
+    return tracer
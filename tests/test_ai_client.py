@@ -0,0 +1,71 @@
+"""Model fallback and cost accounting of the AI client"""
+
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+from src.ai.ai_client import AIClient
+
+
+def _status_error(status):
+    response = SimpleNamespace(status_code=status, headers={}, request=None)
+    return anthropic.APIStatusError(f"status {status}", response=response, body=None)
+
+
+class FakeMessages:
+    """Answers messages.create from a list of errors and responses, in order"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.models = []
+
+    def create(self, model, **kwargs):
+        self.models.append(model)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _response(model, **usage):
+    usage = dict({"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0,
+                  "cache_read_input_tokens": 0}, **usage)
+    return SimpleNamespace(model=model, content=[SimpleNamespace(text="ok")],
+                           stop_reason="end_turn", usage=SimpleNamespace(**usage))
+
+
+def _client(*outcomes):
+    client = AIClient(api_key="sk-test", model="fallback-model",
+                      pricing={"primary": {"input": 1.0, "output": 2.0}})
+    client.routes["chat"] = {"model": "primary", "max_tokens": 10, "temperature": 0.0}
+    client._client = SimpleNamespace(messages=FakeMessages(*outcomes))
+    return client
+
+
+@pytest.mark.parametrize("status", [400, 401, 403])
+def test_request_errors_are_raised_without_fallback(status):
+    client = _client(_status_error(status), _response("fallback-model"))
+
+    with pytest.raises(anthropic.APIStatusError):
+        client.create_message("system", [{"role": "user", "content": "hi"}], task="chat")
+    assert client._client.messages.models == ["primary"]
+
+
+@pytest.mark.parametrize("status", [429, 500, 529])
+def test_overload_falls_back_to_next_model(status):
+    client = _client(_status_error(status), _response("fallback-model"))
+
+    result = client.create_message("system", [{"role": "user", "content": "hi"}], task="chat")
+    assert result["model"] == "fallback-model"
+    assert client._client.messages.models == ["primary", "fallback-model"]
+
+
+def test_cost_includes_prompt_cache_tokens():
+    client = _client(_response("primary", input_tokens=1_000_000, output_tokens=1_000_000,
+                               cache_creation_input_tokens=1_000_000,
+                               cache_read_input_tokens=1_000_000))
+
+    result = client.create_message("system", [{"role": "user", "content": "hi"}], task="chat")
+    # input 1.0 + output 2.0 + cache write 1.25 + cache read 0.1
+    assert result["cost"] == pytest.approx(4.35)
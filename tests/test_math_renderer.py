@@ -0,0 +1,46 @@
+"""Math helpers built on the single-pass tokenizer"""
+
+import pytest
+
+from src.utils.math_renderer import DISPLAY, INLINE, MathRenderer, build_corpus, tokenize_math
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("no math here", []),
+    ("$5 and $3", []),
+    ("costs \\$5, or $x$", [("x", INLINE)]),
+    ("$$x$$ then $$ unclosed", [("x", DISPLAY)]),
+    ("\\(a\\) and \\[b\\] and \\( open", [("a", INLINE), ("b", DISPLAY)]),
+    # Pandoc's rule: no space inside the dollars and no digit right after
+    ("$ x$ $x $ $x$5 $y$", [("x $ $x$5 $y", INLINE)]),
+])
+def test_extract_latex_expressions(text, expected):
+    assert MathRenderer.extract_latex_expressions(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", False),
+    ("It costs $12 today and $15 tomorrow", False),
+    ("Use \\frac in LaTeX", True),
+    ("Solve $x + 1 = 2$", True),
+    ("\\$5 off", False),
+])
+def test_contains_latex(text, expected):
+    assert MathRenderer.contains_latex(text) is expected
+
+
+def test_wrap_and_escape_leave_math_alone():
+    assert MathRenderer.wrap_inline_math("x^2 and $y^2$") == "$x^2$ and $y^2$"
+    assert MathRenderer.escape_latex_special_chars("50% of $a_1$ & b_2") == \
+        "50\\% of $a_1$ \\& b\\_2"
+    assert MathRenderer.escape_latex_special_chars("plain text") == "plain text"
+
+
+def test_helpers_agree_with_segments():
+    for text in build_corpus(200, seed=1):
+        segments = tokenize_math(text)
+        assert "".join(segment.raw for segment in segments) == text
+        expressions = [(s.content, s.kind) for s in segments if s.kind != "text"]
+        assert MathRenderer.extract_latex_expressions(text) == expressions
+        if expressions:
+            assert MathRenderer.contains_latex(text)
@@ -0,0 +1,39 @@
+"""Local answer checking"""
+
+import pytest
+
+from src.core.practice_manager import PracticeManager
+
+
+@pytest.fixture
+def manager(db):
+    # Local checks never call the AI
+    return PracticeManager(db, ai_client=None)
+
+
+@pytest.mark.parametrize("answer, solution, expected", [
+    ("5", "Add 2 to both sides.\nFinal answer: x = 5", True),
+    ("$x = 5$", "**Answer:** 5.", True),
+    ("4", "Final Answer: 5", False),
+    ("1000", "Answer: 1,000", True),
+    ("-12345.5", "Answer: -12,345.5", True),
+    ("3/4", "Answer: 0.75", True),
+])
+def test_check_locally_grades_marked_answers(manager, answer, solution, expected):
+    assert manager.check_locally(answer, solution) is expected
+
+
+def test_marker_without_answer_on_its_line_is_not_an_answer(manager):
+    solution = "Solution:\nStep 1: 2x + 3 = 13, so 2x = 10\nStep 2: x = 5"
+    assert manager.extract_final_answer(solution) is None
+    assert manager.check_locally("2x + 3 = 13, so 2x = 10", solution) is None
+
+
+@pytest.mark.parametrize("answer, solution", [
+    ("3, 5", "Answer: 35"),
+    ("3,5", "Answer: 35"),
+    ("35", "Answer: 3, 5"),
+    ("1,00", "Answer: 100"),
+])
+def test_commas_that_are_not_thousands_separators_defer_to_the_tutor(manager, answer, solution):
+    assert manager.check_locally(answer, solution) is None
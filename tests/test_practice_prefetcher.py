@@ -0,0 +1,53 @@
+"""Prefetched practice sets that are replaced, expire or are still generating"""
+
+import threading
+from types import SimpleNamespace
+
+from src.core.practice_prefetcher import PracticePrefetcher
+
+
+class SlowPracticeManager:
+    """Generates '<topic> set' once released, recording every call"""
+
+    def __init__(self):
+        self.ai = SimpleNamespace(ledger=None)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def generate_practice_set(self, student_id, student_name, grade_level, topic, difficulty, count):
+        self.calls.append(topic)
+        self.started.set()
+        self.release.wait(5)
+        return f"{topic} set"
+
+
+def test_replaced_sets_are_cancelled_or_counted_as_wasted():
+    manager = SlowPracticeManager()
+    prefetcher = PracticePrefetcher(manager, max_workers=1, max_per_student=1)
+
+    prefetcher.prefetch(1, "Ana", 7, topic="algebra")
+    assert manager.started.wait(5)
+    # Queued behind algebra, then replaced before it starts: never generated
+    prefetcher.prefetch(1, "Ana", 7, topic="geometry")
+    prefetcher.prefetch(1, "Ana", 7, topic="fractions")
+    manager.release.set()
+
+    assert prefetcher.take(1, "fractions", "medium", 5, timeout=5) == "fractions set"
+    stats = prefetcher.get_stats()
+    assert manager.calls == ["algebra", "fractions"]
+    assert (stats["prefetched"], stats["wasted"], stats["cancelled"]) == (1, 1, 1)
+    assert stats["hits"] == 1
+
+
+def test_take_does_not_block_on_a_slow_generation():
+    manager = SlowPracticeManager()
+    prefetcher = PracticePrefetcher(manager, wait_seconds=0.1)
+    prefetcher.prefetch(1, "Ana", 7, topic="algebra")
+
+    assert prefetcher.take(1, "algebra", "medium", 5) is None
+    assert prefetcher.has_pending(1)
+
+    manager.release.set()
+    assert prefetcher.take(1, "algebra", "medium", 5, timeout=5) == "algebra set"
+    assert not prefetcher.has_pending(1)
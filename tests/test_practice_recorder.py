@@ -0,0 +1,101 @@
+"""Background writes of the practice recorder and the practice results they make"""
+
+import threading
+
+import pytest
+
+from src.core.practice_recorder import PracticeRecorder
+from src.database.db_manager import DatabaseManager
+
+
+def _attempt(number, answer="4"):
+    return {"number": number, "problem_text": f"Problem {number}", "student_answer": answer,
+            "is_correct": True, "correct_answer": "4"}
+
+
+def test_failed_set_is_retried_without_losing_other_sets(db, monkeypatch):
+    student = db.create_student("Retry", 7)
+    recorder = PracticeRecorder(db)
+    write = db.record_practice_results
+    failures = []
+
+    def flaky(student_id, topic, difficulty, attempts):
+        if topic == "algebra" and not failures:
+            failures.append(topic)
+            raise RuntimeError("database is locked")
+        return write(student_id, topic, difficulty, attempts)
+
+    monkeypatch.setattr(db, "record_practice_results", flaky)
+    recorder.record_attempts(student.id, "algebra", "easy", "set-a", [_attempt("1")])
+    recorder.record_attempts(student.id, "geometry", "easy", "set-b", [_attempt("1")])
+    assert recorder.flush(5) and recorder.flush(5)
+
+    stats = recorder.get_stats()
+    assert stats["attempts_recorded"] == 2
+    assert stats["retried_jobs"] == 1 and stats["dropped_jobs"] == 0
+    assert recorder.problem_id(student.id, "set-a", "1") is not None
+    assert recorder.problem_id(student.id, "set-b", "1") is not None
+
+
+def test_failed_set_is_dropped_after_max_retries(db, monkeypatch):
+    student = db.create_student("Dropped", 7)
+    recorder = PracticeRecorder(db, max_retries=2)
+
+    def broken(*args):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(db, "record_practice_results", broken)
+    recorder.record_attempts(student.id, "algebra", "easy", "set-a", [_attempt("1")])
+    for _ in range(4):
+        recorder.flush(5)
+
+    stats = recorder.get_stats()
+    assert stats["retried_jobs"] == 2 and stats["dropped_jobs"] == 1
+    assert recorder.queue_depth == 0
+
+
+def test_problem_ids_are_bounded_per_set(db):
+    student = db.create_student("Bounded", 7)
+    recorder = PracticeRecorder(db, max_sets=2)
+    for set_key in ("set-a", "set-b", "set-c"):
+        recorder.record_problem_set(student.id, "algebra", "easy", set_key, [
+            {"number": "1", "problem_text": "1 + 1"},
+            {"number": "2", "problem_text": "2 + 2"}
+        ])
+    assert recorder.flush(5)
+
+    assert recorder.problem_id(student.id, "set-a", "1") is None
+    assert recorder.problem_id(student.id, "set-c", "2") is not None
+    assert recorder.get_stats()["problems_recorded"] == 6
+
+
+def test_concurrent_results_roll_into_one_progress_row(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'progress.db'}")
+    db.create_tables()
+    student = db.create_student("Parallel", 7)
+    start = threading.Barrier(6)
+
+    def write():
+        start.wait()
+        for _ in range(5):
+            db.record_practice_results(student.id, "algebra", "easy", [_attempt("1")])
+
+    threads = [threading.Thread(target=write) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    progress = db.get_student_progress(student.id, "algebra")
+    assert [(row.attempts, row.successes, row.accuracy) for row in progress] == [(30, 30, 1.0)]
+
+
+def test_results_reject_another_students_problem(db):
+    owner = db.create_student("Owner", 7)
+    other = db.create_student("Other", 7)
+    problem_id = db.record_practice_results(owner.id, "algebra", "easy", [_attempt("1")])[0]
+
+    with pytest.raises(ValueError, match="do not belong"):
+        db.record_practice_results(other.id, "algebra", "easy",
+                                   [dict(_attempt("1"), problem_id=problem_id)])
+    assert db.get_student_progress(other.id) == []
@@ -0,0 +1,25 @@
+"""SQL statement budgets of the key data paths"""
+
+import pytest
+
+from src.database.query_profiler import KEY_PATH_BUDGETS, QueryBudgetExceededError, key_paths
+
+
+@pytest.mark.parametrize("path", sorted(KEY_PATH_BUDGETS))
+def test_key_path_within_budget(db, query_budget, path):
+    run = key_paths(db)[path]
+    with query_budget(KEY_PATH_BUDGETS[path], path) as counter:
+        run()
+    assert counter[0] > 0
+
+
+def test_every_key_path_has_a_budget(db):
+    assert set(key_paths(db, sessions=1, messages_per_session=1)) == set(KEY_PATH_BUDGETS)
+
+
+def test_budget_fails_when_exceeded(db, query_budget):
+    student = db.create_student("Over Budget", 9)
+    with pytest.raises(QueryBudgetExceededError, match="lookups ran 3 SQL statements"):
+        with query_budget(2, "lookups"):
+            for _ in range(3):
+                db.get_student(student.id)
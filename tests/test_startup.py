@@ -0,0 +1,20 @@
+"""Cold import time of every entry script (python -X importtime)"""
+
+import pytest
+
+from src.utils.config import config
+from src.utils.startup import BASE_DIR, check_budget
+
+ENTRY_SCRIPTS = ["app.py"] + sorted(
+    str(path.relative_to(BASE_DIR)) for path in (BASE_DIR / "pages").glob("*.py")
+)
+
+
+@pytest.mark.parametrize("script", ENTRY_SCRIPTS)
+def test_entry_script_imports_within_budget(script):
+    result = check_budget(script, config.get('startup.import_budget_ms', 1500))
+
+    assert not result["deferred_loaded"], \
+        f"{script} imports deferred modules: {result['deferred_loaded']}"
+    assert result["passed"], \
+        f"{script} imports took {result['total_ms']:.0f} ms, slowest: {result['slowest'][:5]}"
@@ -0,0 +1,33 @@
+"""Token usage rollups under concurrent AI calls"""
+
+import threading
+
+from src.core.token_ledger import TokenLedger
+from src.database.db_manager import DatabaseManager
+from src.database.models import TokenUsage, TokenUsageDaily
+
+
+def test_concurrent_records_roll_up_exactly(tmp_path):
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'ledger.db'}")
+    db.create_tables()
+    student = db.create_student("Parallel", 8)
+    ledger = TokenLedger(db)
+    usage = {"input_tokens": 1, "output_tokens": 1}
+    start = threading.Barrier(8)
+
+    def grade():
+        start.wait()
+        for _ in range(5):
+            ledger.record("answer_check", "model", usage, student_id=student.id)
+
+    threads = [threading.Thread(target=grade) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with db.get_session() as session:
+        assert session.query(TokenUsage).count() == 40
+        rows = session.query(TokenUsageDaily).all()
+        assert [(row.calls, row.input_tokens + row.output_tokens) for row in rows] == [(40, 80)]
+    assert db.get_daily_token_usage(student_id=student.id)["total_tokens"] == 80